@@ -1,20 +1,41 @@
 import json
 import os
 import logging
-import requests
 import openai
 import copy
 import uuid
+import time
+import tempfile
+import hashlib
+from datetime import datetime, timedelta, timezone
 from azure.identity import DefaultAzureCredential
 from base64 import b64encode
 from flask import Flask, Response, request, jsonify, send_from_directory
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
-from docx import Document  
-from io import BytesIO  
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosHttpResponseError
 
 from backend.auth.auth_utils import get_authenticated_user_details
-from backend.history.cosmosdbservice import CosmosConversationClient
+from backend.documents.blob_index import BlobIndexUnavailable, BlobNameIndex
+from backend.documents.blob_text_cache import BlobTextCache
+from backend.documents.docx_text import extract_docx_text
+from backend.documents.prefetch import DocumentPrefetcher
+from backend.history.content_store import BlobContentBackend, LocalContentBackend, MessageContentStore
+from backend.history.cosmosdbservice import CosmosConversationClient, HistoryResetError
+from backend.history.reclaim import HistoryReclaimer
+from backend.history.titles import TitleGenerator, heuristic_title
+from backend.history.write_queue import HistoryWriteQueue
+from backend.upstream.deployments import Deployment, DeploymentRegistry
+from backend.validation.batch import DeploymentConcurrencyLimiter, run_batch
+from backend.validation.result_cache import ValidationResultCache
+from backend.validation.prescreen import format_findings, prescreen
+from backend.validation.redline import format_diff_context, redline
+from backend.validation.clause_alignment import TemplateIndexCache, align, build_template_index, format_alignment
+from backend.validation.clauses import split_clauses
+from backend.validation.clause_verdicts import ClauseVerdictCache, format_clause_report, format_clause_verdict, iter_clause_verdicts, reduce_clause_report
+from backend.validation.token_budget import TokenBudget
+from backend.upstream.http_clients import HttpClientRegistry
+from backend.upstream.sse_relay import DONE_LITERAL, NdjsonEnvelope, extract_content_delta, iter_sse_lines
 
 load_dotenv()
 
@@ -74,6 +95,8 @@ AZURE_OPENAI_STOP_SEQUENCE = os.environ.get("AZURE_OPENAI_STOP_SEQUENCE")
 AZURE_OPENAI_SYSTEM_MESSAGE = os.environ.get("AZURE_OPENAI_SYSTEM_MESSAGE", "You are an AI assistant that helps people find information.")
 AZURE_OPENAI_PREVIEW_API_VERSION = os.environ.get("AZURE_OPENAI_PREVIEW_API_VERSION", "2023-08-01-preview")
 AZURE_OPENAI_STREAM = os.environ.get("AZURE_OPENAI_STREAM", "true")
+AZURE_OPENAI_STREAM_RELAY = os.environ.get("AZURE_OPENAI_STREAM_RELAY", "true")
+AZURE_OPENAI_STREAM_RELAY_BUFFER = os.environ.get("AZURE_OPENAI_STREAM_RELAY_BUFFER", 65536)
 AZURE_OPENAI_MODEL_NAME = os.environ.get("AZURE_OPENAI_MODEL_NAME", "gpt-35-turbo-16k") # Name of the model, e.g. 'gpt-35-turbo-16k' or 'gpt-4'
 AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ.get("AZURE_OPENAI_EMBEDDING_ENDPOINT")
 AZURE_OPENAI_EMBEDDING_KEY = os.environ.get("AZURE_OPENAI_EMBEDDING_KEY")
@@ -98,6 +121,30 @@ AZURE_OPENAI_KEY_GPT4 = os.environ.get("AZURE_OPENAI_KEY_GPT4")
 AZURE_BLOB_CONNECTION_STRING = os.environ.get("AZURE_BLOB_CONNECTION_STRING")  
 NDA_TEMPPLATES_CONTAINER = os.environ.get("NDA_TEMPPLATES_CONTAINER")
 NDA_AGREEMENTS_CONTAINER = os.environ.get("NDA_AGREEMENTS_CONTAINER")
+DOCX_CACHE_MAX_BYTES = os.environ.get("DOCX_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+DOCX_CACHE_TTL_SECONDS = os.environ.get("DOCX_CACHE_TTL_SECONDS", 60)
+BLOB_INDEX_REFRESH_SECONDS = os.environ.get("BLOB_INDEX_REFRESH_SECONDS", 300)
+DOCUMENT_PREFETCH_WORKERS = os.environ.get("DOCUMENT_PREFETCH_WORKERS", 8)
+
+# Batch validation settings
+BATCH_VALIDATION_CONCURRENCY = os.environ.get("BATCH_VALIDATION_CONCURRENCY", 4)
+BATCH_VALIDATION_MAX_DOCUMENTS = os.environ.get("BATCH_VALIDATION_MAX_DOCUMENTS", 40)
+
+# Validation result cache settings
+VALIDATION_CACHE_ENABLED = os.environ.get("VALIDATION_CACHE_ENABLED", "true").lower() == "true"
+VALIDATION_CACHE_PATH = os.environ.get("VALIDATION_CACHE_PATH", os.path.join(tempfile.gettempdir(), "nda_validation_cache.sqlite3"))
+VALIDATION_CACHE_MAX_BYTES = os.environ.get("VALIDATION_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+CLAUSE_VERDICT_CACHE_MAX_ENTRIES = os.environ.get("CLAUSE_VERDICT_CACHE_MAX_ENTRIES", 100000)
+CLAUSE_VALIDATION_BATCH_SIZE = os.environ.get("CLAUSE_VALIDATION_BATCH_SIZE", 8)
+CLAUSE_VALIDATION_CONCURRENCY = os.environ.get("CLAUSE_VALIDATION_CONCURRENCY", 4)
+# "conversation" lets the model validate the whole agreement in one completion, "clauses" validates clause pairs in parallel
+VALIDATION_MODE = os.environ.get("VALIDATION_MODE", "conversation").lower()
+
+# Deterministic pre-screening of the general NDA rules
+PRESCREEN_ENABLED = os.environ.get("PRESCREEN_ENABLED", "true").lower() == "true"
+# "full" hands the model the whole agreement, "diff" only its word-level differences to the template
+VALIDATION_AGREEMENT_CONTEXT = os.environ.get("VALIDATION_AGREEMENT_CONTEXT", "full").lower()
+CLAUSE_INDEX_MAX_TEMPLATES = os.environ.get("CLAUSE_INDEX_MAX_TEMPLATES", 32)
 
 # CosmosDB Mongo vcore vector db Settings
 AZURE_COSMOSDB_MONGO_VCORE_CONNECTION_STRING = os.environ.get("AZURE_COSMOSDB_MONGO_VCORE_CONNECTION_STRING")  #This has to be secure string
@@ -115,6 +162,7 @@ AZURE_COSMOSDB_MONGO_VCORE_VECTOR_COLUMNS = os.environ.get("AZURE_COSMOSDB_MONGO
 
 
 SHOULD_STREAM = True if AZURE_OPENAI_STREAM.lower() == "true" else False
+SHOULD_RELAY_STREAM = AZURE_OPENAI_STREAM_RELAY.lower() == "true"
 
 #Chat History CosmosDB Integration Settings
 
@@ -123,6 +171,18 @@ AZURE_COSMOSDB_ACCOUNT = os.environ.get("AZURE_COSMOSDB_ACCOUNT")
 AZURE_COSMOSDB_CONVERSATIONS_CONTAINER = os.environ.get("AZURE_COSMOSDB_CONVERSATIONS_CONTAINER")
 AZURE_COSMOSDB_ACCOUNT_KEY = os.environ.get("AZURE_COSMOSDB_ACCOUNT_KEY")
 AZURE_COSMOSDB_ENABLE_FEEDBACK = "true"
+AZURE_COSMOSDB_DELETED_TTL_SECONDS = os.environ.get("AZURE_COSMOSDB_DELETED_TTL_SECONDS", "86400")
+AZURE_COSMOSDB_BULK_CONCURRENCY = os.environ.get("AZURE_COSMOSDB_BULK_CONCURRENCY", "4")
+AZURE_COSMOSDB_APPLY_INDEXING_POLICY = os.environ.get("AZURE_COSMOSDB_APPLY_INDEXING_POLICY", "false").lower() == "true"
+HISTORY_RECLAIM_WORKERS = os.environ.get("HISTORY_RECLAIM_WORKERS", "2")
+HISTORY_WRITE_QUEUE_PATH = os.environ.get("HISTORY_WRITE_QUEUE_PATH")
+HISTORY_WRITE_BEHIND = os.environ.get("HISTORY_WRITE_BEHIND", "true" if HISTORY_WRITE_QUEUE_PATH else "false").lower() == "true"
+HISTORY_WRITE_READ_TIMEOUT_SECONDS = os.environ.get("HISTORY_WRITE_READ_TIMEOUT_SECONDS", "5")
+HISTORY_WRITE_MAX_ATTEMPTS = os.environ.get("HISTORY_WRITE_MAX_ATTEMPTS", "8")
+AZURE_OPENAI_TITLE_DEPLOYMENT = os.environ.get("AZURE_OPENAI_TITLE_DEPLOYMENT", "GPT 3.5")
+HISTORY_CONTENT_OFFLOAD_BYTES = os.environ.get("HISTORY_CONTENT_OFFLOAD_BYTES", "8192")
+HISTORY_CONTENT_CONTAINER = os.environ.get("HISTORY_CONTENT_CONTAINER")
+HISTORY_CONTENT_PATH = os.environ.get("HISTORY_CONTENT_PATH")
 
 # Elasticsearch Integration Settings
 ELASTICSEARCH_ENDPOINT = os.environ.get("ELASTICSEARCH_ENDPOINT")
@@ -140,6 +200,11 @@ ELASTICSEARCH_STRICTNESS = os.environ.get("ELASTICSEARCH_STRICTNESS", SEARCH_STR
 ELASTICSEARCH_EMBEDDING_MODEL_ID = os.environ.get("ELASTICSEARCH_EMBEDDING_MODEL_ID")
 
 
+# Upstream HTTP connection pooling
+UPSTREAM_HTTP_POOL_MAXSIZE = os.environ.get("UPSTREAM_HTTP_POOL_MAXSIZE", 10)
+UPSTREAM_HTTP_CONNECT_TIMEOUT = os.environ.get("UPSTREAM_HTTP_CONNECT_TIMEOUT", 10)
+UPSTREAM_HTTP_READ_TIMEOUT = os.environ.get("UPSTREAM_HTTP_READ_TIMEOUT", 230)
+
 #Experimental: Call functions with ChatGPT
 USE_FUNCTION = os.environ.get("USE_FUNCTION", False)
 
@@ -151,7 +216,99 @@ frontend_settings = {
     "feedback_enabled": AZURE_COSMOSDB_ENABLE_FEEDBACK and AZURE_COSMOSDB_DATABASE not in [None, ""],
 }
 
-message_uuid = ""
+# Keep-alive HTTP sessions shared by all calls to Azure OpenAI, Cognitive Search and Graph
+http_clients = HttpClientRegistry(
+    pool_maxsize=int(UPSTREAM_HTTP_POOL_MAXSIZE),
+    connect_timeout=float(UPSTREAM_HTTP_CONNECT_TIMEOUT),
+    read_timeout=float(UPSTREAM_HTTP_READ_TIMEOUT)
+)
+
+# Extracted DOCX text, revalidated against the blob ETag
+docx_text_cache = BlobTextCache(
+    max_bytes=int(DOCX_CACHE_MAX_BYTES),
+    ttl_seconds=float(DOCX_CACHE_TTL_SECONDS)
+)
+blob_service_client = None
+
+# Fetches the selected template and agreement while the model is still deciding to ask for them
+document_prefetcher = DocumentPrefetcher(max_workers=int(DOCUMENT_PREFETCH_WORKERS))
+
+# Caps concurrent batch validations per deployment across all batches in the process
+batch_limiter = DeploymentConcurrencyLimiter(limit=int(BATCH_VALIDATION_CONCURRENCY))
+
+# Caps concurrent clause judging calls per deployment; separate from batch_limiter because a
+# clause-mode batch validation holds a batch slot while its clauses are judged
+clause_limiter = DeploymentConcurrencyLimiter(limit=int(CLAUSE_VALIDATION_CONCURRENCY))
+
+# Answers for template/agreement/deployment/prompt/conversation combinations already validated
+validation_cache = None
+clause_verdict_cache = None
+if VALIDATION_CACHE_ENABLED:
+    try:
+        validation_cache = ValidationResultCache(path=VALIDATION_CACHE_PATH, max_bytes=int(VALIDATION_CACHE_MAX_BYTES))
+        clause_verdict_cache = ClauseVerdictCache(path=VALIDATION_CACHE_PATH, max_entries=int(CLAUSE_VERDICT_CACHE_MAX_ENTRIES))
+    except Exception as e:
+        logging.exception("Exception in validation cache initialization")
+        validation_cache = None
+        clause_verdict_cache = None
+
+# TF-IDF clause indexes of the templates, keyed by template ETag
+template_indexes = TemplateIndexCache(max_templates=int(CLAUSE_INDEX_MAX_TEMPLATES))
+
+# Blob name indexes behind /get_files and /get_nda_templates
+agreements_index = BlobNameIndex(
+    get_container_client=lambda: get_blob_service_client().get_container_client(NDA_AGREEMENTS_CONTAINER),
+    refresh_seconds=float(BLOB_INDEX_REFRESH_SECONDS)
+)
+templates_index = BlobNameIndex(
+    get_container_client=lambda: get_blob_service_client().get_container_client(NDA_TEMPPLATES_CONTAINER),
+    refresh_seconds=float(BLOB_INDEX_REFRESH_SECONDS)
+)
+
+# Azure OpenAI deployments selectable per request via "selectedGPTVersion"
+DEFAULT_GPT_VERSION = "GPT 3.5"
+deployments = DeploymentRegistry(
+    deployments=[
+        Deployment(
+            name="default",
+            model=AZURE_OPENAI_MODEL,
+            model_name=AZURE_OPENAI_MODEL_NAME,
+            key=AZURE_OPENAI_KEY,
+            resource=AZURE_OPENAI_RESOURCE,
+            endpoint=AZURE_OPENAI_ENDPOINT
+        ),
+        Deployment(
+            name="GPT 3.5",
+            model=AZURE_OPENAI_MODEL_GPT3 or AZURE_OPENAI_MODEL,
+            model_name=AZURE_OPENAI_MODEL_NAME_GPT3 or AZURE_OPENAI_MODEL_NAME,
+            key=AZURE_OPENAI_KEY_GPT3 or AZURE_OPENAI_KEY,
+            resource=AZURE_OPENAI_RESOURCE_GPT3 or AZURE_OPENAI_RESOURCE,
+            endpoint=AZURE_OPENAI_ENDPOINT_GPT3 or (None if AZURE_OPENAI_RESOURCE_GPT3 else AZURE_OPENAI_ENDPOINT)
+        ),
+        Deployment(
+            name="GPT 4.0",
+            model=AZURE_OPENAI_MODEL_GPT4 or AZURE_OPENAI_MODEL,
+            model_name=AZURE_OPENAI_MODEL_NAME_GPT4 or AZURE_OPENAI_MODEL_NAME,
+            key=AZURE_OPENAI_KEY_GPT4 or AZURE_OPENAI_KEY,
+            resource=AZURE_OPENAI_RESOURCE_GPT4 or AZURE_OPENAI_RESOURCE,
+            endpoint=AZURE_OPENAI_ENDPOINT_GPT4 or (None if AZURE_OPENAI_RESOURCE_GPT4 else AZURE_OPENAI_ENDPOINT)
+        )
+    ],
+    default="default"
+)
+
+# Deletes the messages of deleted conversations after the delete endpoints have returned
+history_reclaimer = HistoryReclaimer(max_workers=int(HISTORY_RECLAIM_WORKERS))
+
+# Keeps large message bodies (agreement texts, answers) out of the Cosmos items, in Blob Storage or an explicitly
+# configured local directory; with neither they stay inline, as a temporary directory would lose them on restart
+history_content_store = None
+if AZURE_COSMOSDB_ACCOUNT and int(HISTORY_CONTENT_OFFLOAD_BYTES) > 0:
+    if HISTORY_CONTENT_CONTAINER:
+        history_content_store = MessageContentStore(BlobContentBackend(lambda: get_blob_service_client().get_container_client(HISTORY_CONTENT_CONTAINER)),
+                                                    threshold_bytes=int(HISTORY_CONTENT_OFFLOAD_BYTES))
+    elif HISTORY_CONTENT_PATH:
+        history_content_store = MessageContentStore(LocalContentBackend(HISTORY_CONTENT_PATH), threshold_bytes=int(HISTORY_CONTENT_OFFLOAD_BYTES))
 
 # Initialize a CosmosDB client with AAD auth and containers for Chat History
 cosmos_conversation_client = None
@@ -169,13 +326,87 @@ if AZURE_COSMOSDB_DATABASE and AZURE_COSMOSDB_ACCOUNT and AZURE_COSMOSDB_CONVERS
             credential=credential, 
             database_name=AZURE_COSMOSDB_DATABASE,
             container_name=AZURE_COSMOSDB_CONVERSATIONS_CONTAINER,
-            enable_message_feedback = AZURE_COSMOSDB_ENABLE_FEEDBACK
+            enable_message_feedback = AZURE_COSMOSDB_ENABLE_FEEDBACK,
+            deleted_ttl=int(AZURE_COSMOSDB_DELETED_TTL_SECONDS),
+            bulk_concurrency=int(AZURE_COSMOSDB_BULK_CONCURRENCY),
+            content_store=history_content_store
         )
     except Exception as e:
         logging.exception("Exception in CosmosDB initialization", e)
         cosmos_conversation_client = None
 
 
+def write_conversation(user_id, payload):
+    cosmos_conversation_client.create_conversation(user_id=user_id, title=payload['title'],
+                                                   conversation_id=payload['conversation_id'], created_at=payload['created_at'])
+
+
+def write_messages(user_id, payload):
+    cosmos_conversation_client.create_messages(conversation_id=payload['conversation_id'], user_id=user_id,
+                                               input_messages=[tuple(message) for message in payload['messages']],
+                                               created_at=payload['created_at'])
+
+
+def write_generated_title(user_id, payload):
+    cosmos_conversation_client.rename_conversation(user_id, payload['conversation_id'], payload['title'],
+                                                   expected_title=payload['provisional_title'])
+
+
+HISTORY_WRITERS = {
+    "create_conversation": write_conversation,
+    "create_messages": write_messages,
+    "set_generated_title": write_generated_title
+}
+
+# Spools history writes to a local SQLite file and flushes them to Cosmos in the background,
+# so neither the model call nor the answer waits on Cosmos
+history_write_queue = None
+if cosmos_conversation_client and HISTORY_WRITE_BEHIND and not HISTORY_WRITE_QUEUE_PATH:
+    ## a spool in the temp directory would lose the queued writes on every restart
+    logging.warning("HISTORY_WRITE_BEHIND needs HISTORY_WRITE_QUEUE_PATH on local persistent disk; writing history during the request")
+elif cosmos_conversation_client and HISTORY_WRITE_BEHIND:
+    try:
+        history_write_queue = HistoryWriteQueue(path=HISTORY_WRITE_QUEUE_PATH, handlers=HISTORY_WRITERS,
+                                                max_attempts=int(HISTORY_WRITE_MAX_ATTEMPTS))
+    except Exception as e:
+        logging.exception("Exception in history write queue initialization")
+        history_write_queue = None
+
+
+# Titles new conversations with the model after they were created under a provisional title
+title_generator = None
+if cosmos_conversation_client and deployments.get(AZURE_OPENAI_TITLE_DEPLOYMENT):
+    title_generator = TitleGenerator(generate=lambda messages, names: generate_title(messages, deployments.get(AZURE_OPENAI_TITLE_DEPLOYMENT), names))
+
+
+def persist_history(kind, user_id, payload):
+    ## ids and timestamps are fixed in the payload, so a write replayed by the queue changes nothing
+    if history_write_queue:
+        history_write_queue.enqueue(kind, user_id, payload)
+    else:
+        HISTORY_WRITERS[kind](user_id, payload)
+
+
+def history_writes_pending(user_id):
+    ## reads and updates of the history must see the writes the user just queued; 409 while they are still not in Cosmos
+    if history_write_queue and not history_write_queue.flush_user(user_id, timeout=float(HISTORY_WRITE_READ_TIMEOUT_SECONDS)):
+        return jsonify({"error": "Recent history writes are still being saved, retry shortly"}), 409, {"Retry-After": "5"}
+    return None
+
+
+def expand_message_content(user_id, messages):
+    ## the frontend resends offloaded messages as their preview and contentRef; the model gets the full bodies.
+    ## The point read in the user's partition is what authorizes access to the shared content, as for /history/message_content
+    for message in messages:
+        if not message.get('contentRef'):
+            continue
+        stored = cosmos_conversation_client.get_message(user_id, message.get('id'))
+        if not stored or stored.get('contentRef') != message['contentRef']:
+            raise KeyError(message['contentRef'])
+        message['content'] = cosmos_conversation_client.get_message_content(stored)
+        del message['contentRef']
+
+
 def is_chat_model():
     if 'gpt-4' in AZURE_OPENAI_MODEL_NAME.lower() or AZURE_OPENAI_MODEL_NAME.lower() in ['gpt-35-turbo-4k', 'gpt-35-turbo-16k']:
         return True
@@ -210,29 +441,26 @@ def parse_multi_columns(columns: str) -> list:
     else:
         return columns.split(",")
 
-def fetchUserGroups(userToken, nextLink=None):
-    # Recursively fetch group membership
-    if nextLink:
-        endpoint = nextLink
-    else:
-        endpoint = "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
-    
+def fetchUserGroups(userToken):
+    # Fetch group membership, following nextLink pages over the pooled Graph session
+    endpoint = "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id"
     headers = {
         'Authorization': "bearer " + userToken
     }
+    groups = []
     try :
-        r = requests.get(endpoint, headers=headers)
-        if r.status_code != 200:
-            if DEBUG_LOGGING:
-                logging.error(f"Error fetching user groups: {r.status_code} {r.text}")
-            return []
-        
-        r = r.json()
-        if "@odata.nextLink" in r:
-            nextLinkData = fetchUserGroups(userToken, r["@odata.nextLink"])
-            r['value'].extend(nextLinkData)
-        
-        return r['value']
+        while endpoint:
+            r = http_clients.get(endpoint, headers=headers)
+            if r.status_code != 200:
+                if DEBUG_LOGGING:
+                    logging.error(f"Error fetching user groups: {r.status_code} {r.text}")
+                return []
+
+            r = r.json()
+            groups.extend(r['value'])
+            endpoint = r.get("@odata.nextLink")
+
+        return groups
     except Exception as e:
         logging.error(f"Exception in fetchUserGroups: {e}")
         return []
@@ -251,7 +479,7 @@ def generateFilterString(userToken):
 
 
 
-def prepare_body_headers_with_data(request, selected_files):
+def prepare_body_headers_with_data(request, selected_files, deployment):
     request_messages = request.json["messages"]
     # file_filter = " OR ".join([f"filepath eq '{file.strip()}'" for file in selected_files.split(",")])
 
@@ -295,7 +523,7 @@ def prepare_body_headers_with_data(request, selected_files):
         else:  
             filter = file_filter 
         
-        print("FILTER: ", filter)
+        logging.debug(f"Search filter: {filter}")
 
         body["dataSources"].append(
             {
@@ -407,18 +635,36 @@ def prepare_body_headers_with_data(request, selected_files):
 
     headers = {
         'Content-Type': 'application/json',
-        'api-key': AZURE_OPENAI_KEY,
+        'api-key': deployment.key,
         "x-ms-useragent": "GitHubSampleWebApp/PublicAPI/3.0.0"
     }
 
     return body, headers
 
 
-def stream_with_data(body, headers, endpoint, history_metadata={}):
-    s = requests.Session()
+def iter_upstream_lines(r):
+    # Chunked SSE responses are read in large buffers; a chunked read returns as soon as the
+    # upstream flushes, so this does not delay tokens
+    if SHOULD_RELAY_STREAM and r.raw.chunked:
+        return iter_sse_lines(r.iter_content(chunk_size=int(AZURE_OPENAI_STREAM_RELAY_BUFFER)))
+    return r.iter_lines(chunk_size=10)
+
+def stream_with_data(body, headers, endpoint, message_uuid, history_metadata={}):
     try:
-        with s.post(endpoint, json=body, headers=headers, stream=True) as r:
-            for line in r.iter_lines(chunk_size=10):
+        with http_clients.post(endpoint, json=body, headers=headers, stream=True) as r:
+            envelope = None
+            for line in iter_upstream_lines(r):
+                if not line:
+                    continue
+
+                # Fast path: splice plain content deltas into the prebuilt NDJSON envelope
+                if envelope is not None:
+                    raw_content = extract_content_delta(line)
+                    if raw_content is not None:
+                        if raw_content != DONE_LITERAL:
+                            yield envelope.wrap(raw_content)
+                        continue
+
                 response = {
                     "id": "",
                     "model": "",
@@ -430,47 +676,48 @@ def stream_with_data(body, headers, endpoint, history_metadata={}):
                     "apim-request-id": "",
                     'history_metadata': history_metadata
                 }
-                if line:
-                    if AZURE_OPENAI_PREVIEW_API_VERSION == '2023-06-01-preview':
-                        lineJson = json.loads(line.lstrip(b'data:').decode('utf-8'))
-                    else:
-                        try:
-                            rawResponse = json.loads(line.lstrip(b'data:').decode('utf-8'))
-                            lineJson = formatApiResponseStreaming(rawResponse)
-                        except json.decoder.JSONDecodeError:
-                            continue
-
-                    if 'error' in lineJson:
-                        yield format_as_ndjson(lineJson)
-                    response["id"] = message_uuid
-                    response["model"] = lineJson["model"]
-                    response["created"] = lineJson["created"]
-                    response["object"] = lineJson["object"]
-                    response["apim-request-id"] = r.headers.get('apim-request-id')
-
-                    role = lineJson["choices"][0]["messages"][0]["delta"].get("role")
-
-                    if role == "tool":
-                        response["choices"][0]["messages"].append(lineJson["choices"][0]["messages"][0]["delta"])
-                        yield format_as_ndjson(response)
-                    elif role == "assistant": 
-                        if response['apim-request-id'] and DEBUG_LOGGING: 
-                            logging.debug(f"RESPONSE apim-request-id: {response['apim-request-id']}")
+                if AZURE_OPENAI_PREVIEW_API_VERSION == '2023-06-01-preview':
+                    lineJson = json.loads(line.lstrip(b'data:').decode('utf-8'))
+                else:
+                    try:
+                        rawResponse = json.loads(line.lstrip(b'data:').decode('utf-8'))
+                        lineJson = formatApiResponseStreaming(rawResponse)
+                    except json.decoder.JSONDecodeError:
+                        continue
+
+                if 'error' in lineJson:
+                    yield format_as_ndjson(lineJson)
+                response["id"] = message_uuid
+                response["model"] = lineJson["model"]
+                response["created"] = lineJson["created"]
+                response["object"] = lineJson["object"]
+                response["apim-request-id"] = r.headers.get('apim-request-id')
+                if SHOULD_RELAY_STREAM and envelope is None:
+                    envelope = NdjsonEnvelope(response)
+
+                role = lineJson["choices"][0]["messages"][0]["delta"].get("role")
+
+                if role == "tool":
+                    response["choices"][0]["messages"].append(lineJson["choices"][0]["messages"][0]["delta"])
+                    yield format_as_ndjson(response)
+                elif role == "assistant": 
+                    if response['apim-request-id'] and DEBUG_LOGGING: 
+                        logging.debug(f"RESPONSE apim-request-id: {response['apim-request-id']}")
+                    response["choices"][0]["messages"].append({
+                        "role": "assistant",
+                        "content": ""
+                    })
+                    yield format_as_ndjson(response)
+                else:
+                    deltaText = lineJson["choices"][0]["messages"][0]["delta"]["content"]
+                    if deltaText != "[DONE]":
                         response["choices"][0]["messages"].append({
                             "role": "assistant",
-                            "content": ""
+                            "content": deltaText
                         })
                         yield format_as_ndjson(response)
-                    else:
-                        deltaText = lineJson["choices"][0]["messages"][0]["delta"]["content"]
-                        if deltaText != "[DONE]":
-                            response["choices"][0]["messages"].append({
-                                "role": "assistant",
-                                "content": deltaText
-                            })
-                            yield format_as_ndjson(response)
     except Exception as e:
-        yield format_as_ndjson({"error" + str(e)})
+        yield format_as_ndjson({"error": str(e)})
 
 def formatApiResponseNoStreaming(rawResponse):
     if 'error' in rawResponse:
@@ -543,14 +790,13 @@ def formatApiResponseStreaming(rawResponse):
 
     return response
 
-def conversation_with_data(request_body, selected_files):
-    body, headers = prepare_body_headers_with_data(request, selected_files)
-    base_url = AZURE_OPENAI_ENDPOINT if AZURE_OPENAI_ENDPOINT else f"https://{AZURE_OPENAI_RESOURCE}.openai.azure.com/"
-    endpoint = f"{base_url}openai/deployments/{AZURE_OPENAI_MODEL}/extensions/chat/completions?api-version={AZURE_OPENAI_PREVIEW_API_VERSION}"
+def conversation_with_data(request_body, selected_files, deployment, message_uuid):
+    body, headers = prepare_body_headers_with_data(request, selected_files, deployment)
+    endpoint = f"{deployment.base_url}openai/deployments/{deployment.model}/extensions/chat/completions?api-version={AZURE_OPENAI_PREVIEW_API_VERSION}"
     history_metadata = request_body.get("history_metadata", {})
 
     if not SHOULD_STREAM:
-        r = requests.post(endpoint, headers=headers, json=body)
+        r = http_clients.post(endpoint, headers=headers, json=body)
         status_code = r.status_code
         r = r.json()
         if AZURE_OPENAI_PREVIEW_API_VERSION == "2023-06-01-preview":
@@ -562,10 +808,58 @@ def conversation_with_data(request_body, selected_files):
             return Response(format_as_ndjson(result), status=status_code)
 
     else:
-        return Response(stream_with_data(body, headers, endpoint, history_metadata), mimetype='text/event-stream')
+        return Response(stream_with_data(body, headers, endpoint, message_uuid, history_metadata), mimetype='text/event-stream')
+
+def prefetch_selected_documents(request_body):
+    loaders = {}
+    selected_templates = request_body.get('selectedTemplates')
+    if selected_templates:
+        loaders["get_nda_template"] = lambda: get_nda_template(selected_templates)
+    selected_files = request_body.get('selectedItems')
+    if selected_files:
+        loaders["get_nda_document"] = lambda: get_nda_document(selected_files)
+    return document_prefetcher.prefetch(loaders)
+
+def validation_cache_key(request_body, deployment):
+    ## ETags come from warm DOCX text cache entries or a properties request; the documents are not downloaded
+    etags = {}
+    for name, container, selected in (
+        ("get_nda_template", NDA_TEMPPLATES_CONTAINER, request_body.get('selectedTemplates')),
+        ("get_nda_document", NDA_AGREEMENTS_CONTAINER, request_body.get('selectedItems'))
+    ):
+        etags[name] = docx_text_cache.etag(get_blob_service_client().get_blob_client(container, selected)) if selected else None
+
+    if not etags["get_nda_template"] and not etags["get_nda_document"]:
+        return None
+    return ValidationResultCache.make_key(
+        etags["get_nda_template"],
+        etags["get_nda_document"],
+        f"{deployment.name}/{deployment.model}",
+        NDA_VALIDATION_SYSTEM_MESSAGE,
+        request_body["messages"]
+    )
+
+def replay_validation_result(cached, message_uuid, history_metadata):
+    response_obj = {
+        "id": message_uuid,
+        "model": cached["model"],
+        "created": int(cached["created_at"]),
+        "object": "chat.completion.chunk",
+        "choices": [{
+            "messages": [{
+                "role": "assistant",
+                "content": cached["content"]
+            }]
+        }],
+        "history_metadata": history_metadata
+    }
+    yield format_as_ndjson(response_obj)
 
-def stream_without_data(response, request_body, history_metadata={}):
+def stream_without_data(response, request_body, message_uuid, history_metadata={}, prefetched={}, on_complete=None):
     responseText = ""
+    answer = []
+    model = None
+    function_called = False
     func_call = {
             "name": None,
             "arguments": "",
@@ -584,7 +878,8 @@ def stream_without_data(response, request_body, history_metadata={}):
                 if "arguments" in delta.function_call:
                     func_call["arguments"] += delta.function_call["arguments"]
             if line.choices[0].finish_reason == "function_call":
-                print(func_call)
+                function_called = True
+                logging.debug(f"Function call: {func_call}")
                 available_functions = {
                             "read_docx_from_blob": read_docx_from_blob,
                             "send_mail": send_mail,
@@ -603,7 +898,15 @@ def stream_without_data(response, request_body, history_metadata={}):
                     selected_files = request_body.get('selectedItems')
                     function_args['selected_documents'] = selected_files
 
-                responseText = function_to_call(**function_args)
+                responseText = document_prefetcher.result(prefetched, func_call['name'], lambda: function_to_call(**function_args))
+                if func_call['name'] == "get_nda_document":
+                    selected_templates = request_body.get('selectedTemplates')
+                    template_text = None
+                    template_index = None
+                    if selected_templates:
+                        template_text = document_prefetcher.result(prefetched, "get_nda_template", lambda: get_nda_template(selected_templates))
+                        template_index = get_template_index(selected_templates)
+                    responseText = agreement_context(template_text, responseText, template_index)
 
 
         else:
@@ -624,21 +927,88 @@ def stream_without_data(response, request_body, history_metadata={}):
             }],
             "history_metadata": history_metadata
         }
+        answer.append(responseText)
+        model = line["model"]
 
         yield format_as_ndjson(response_obj)
 
+    ## tool output is cheap to reproduce; only model-written answers are worth caching
+    if on_complete and not function_called:
+        on_complete("".join(answer), model)
+
+
+NDA_VALIDATION_SYSTEM_MESSAGE = "You are an experienced lawyer. \
+                I will provide you an internal template of mutually confidentiality agreements and \
+                then I will present you another template from a third party. \
+                I would like you to verify if the clauses in the third party \
+                NDA adhere to our template. Each word of the clause matters and must be reviewed carefully. \
+                For example, if the template states that an action should be taken 'immediately' \
+                but the prompt states 'promptly' this should be marked as non-conforming. \
+                Also, the provided document should be complete in terms of considered \
+                exceptions and should cover all cases referred in the template. \
+                If some cases or exceptions are not covered, then the clause should be marked \
+                an non-conforming. \
+                Further, I want you to verify if and to what extent the following \
+                general rules apply: ► Contracting party preferably local group entity if available and involved;\
+                otherwise PHX Pharma SE; ► Data protection provisions shall also apply to any personal data that may be \
+                part of the information provided; ► Authorized recipients to include affiliated companies and members \
+                of supervising bodies (typically Supervisory Board of PHOENIX Pharma SE); ► Affiliates limitation \
+                to PHX Pharma SE; ► Return and destruction typically upon receipt of written notice with \
+                adequate exceptions (e.g. for mandatory backups) and reasonable deadline (usually 30 days); \
+                ► Reciprocality of obligations (in full or partially) to be considered; \
+                ► Governing law and jurisdiction preferably local law, however, no US law or countries \
+                known as tax haven; \
+                ► Dispute resolution preferably arbitration (e.g. Frankfurt, London, Paris, Stockholm, Vienna, Zurich). \
+                ► Term typically up to 2 years from the execution date of the NDA; \
+                ► Liability regime to not comprise penalties or liquidated damages \
+                Here is the template: ### "
+DEFAULT_VALIDATION_QUESTION = "Verify the third party NDA against the template and the general rules. \
+List every clause as conforming or non-conforming and explain each non-conforming clause."
+
+def use_clause_validation(request_body):
+    if not request_body.get('selectedTemplates') or not request_body.get('selectedItems'):
+        return False
+    ## an explicit request validates by clause on any turn; VALIDATION_MODE only picks the first turn,
+    ## so follow-up questions about the answer are answered instead of validating again
+    if 'validationMode' in request_body:
+        return request_body['validationMode'] == "clauses"
+    first_turn = not any(message.get('role') == "assistant" for message in request_body.get('messages', []))
+    return VALIDATION_MODE == "clauses" and first_turn
+
+def conversation_without_data(request_body, deployment, message_uuid):
+    if use_clause_validation(request_body):
+        return conversation_by_clause(request_body, deployment, message_uuid)
+
+    use_cache = validation_cache is not None and not request_body.get('bypassCache', False)
+    history_metadata = request_body.get("history_metadata", {})
+
+    cache_key = None
+    if use_cache:
+        try:
+            cache_key = validation_cache_key(request_body, deployment)
+        except Exception as e:
+            logging.exception("Exception computing the validation cache key")
+        cached = validation_cache.get(cache_key) if cache_key else None
+        if cached:
+            history_metadata['validation_cache'] = "hit"
+            if not SHOULD_STREAM:
+                return jsonify(next(json.loads(line) for line in replay_validation_result(cached, message_uuid, history_metadata))), 200
+            return Response(replay_validation_result(cached, message_uuid, history_metadata), mimetype='text/event-stream')
+        history_metadata['validation_cache'] = "miss" if cache_key else "uncacheable"
+    else:
+        history_metadata['validation_cache'] = "bypass" if validation_cache is not None else "disabled"
+
+    ## only streamed responses serve tool calls; a cache hit has returned before any download starts
+    prefetched = prefetch_selected_documents(request_body) if SHOULD_STREAM else {}
+
+    def store_result(content, model):
+        if cache_key and content:
+            validation_cache.put(cache_key, content, model)
 
-def conversation_without_data(request_body):
-    openai.api_type = "azure"
-    openai.api_base = AZURE_OPENAI_ENDPOINT if AZURE_OPENAI_ENDPOINT else f"https://{AZURE_OPENAI_RESOURCE}.openai.azure.com/"
-    openai.api_version = "2023-08-01-preview"
-    openai.api_key = AZURE_OPENAI_KEY
-    
     selected_files = request_body.get('selectedItems')
     selected_templates = request_body.get('selectedTemplates')
 
-    print(selected_files)
-    print(selected_templates)
+    logging.debug(f"Selected agreements: {selected_files}, templates: {selected_templates}")
     functions= [  
             {
                 "name": "read_docx_from_blob",
@@ -706,31 +1076,7 @@ def conversation_without_data(request_body):
     messages = [ 
             {
             "role": "system",
-            "content": "You are an experienced lawyer. \
-                I will provide you an internal template of mutually confidentiality agreements and \
-                then I will present you another template from a third party. \
-                I would like you to verify if the clauses in the third party \
-                NDA adhere to our template. Each word of the clause matters and must be reviewed carefully. \
-                For example, if the template states that an action should be taken 'immediately' \
-                but the prompt states 'promptly' this should be marked as non-conforming. \
-                Also, the provided document should be complete in terms of considered \
-                exceptions and should cover all cases referred in the template. \
-                If some cases or exceptions are not covered, then the clause should be marked \
-                an non-conforming. \
-                Further, I want you to verify if and to what extent the following \
-                general rules apply: ► Contracting party preferably local group entity if available and involved;\
-                otherwise PHX Pharma SE; ► Data protection provisions shall also apply to any personal data that may be \
-                part of the information provided; ► Authorized recipients to include affiliated companies and members \
-                of supervising bodies (typically Supervisory Board of PHOENIX Pharma SE); ► Affiliates limitation \
-                to PHX Pharma SE; ► Return and destruction typically upon receipt of written notice with \
-                adequate exceptions (e.g. for mandatory backups) and reasonable deadline (usually 30 days); \
-                ► Reciprocality of obligations (in full or partially) to be considered; \
-                ► Governing law and jurisdiction preferably local law, however, no US law or countries \
-                known as tax haven; \
-                ► Dispute resolution preferably arbitration (e.g. Frankfurt, London, Paris, Stockholm, Vienna, Zurich). \
-                ► Term typically up to 2 years from the execution date of the NDA; \
-                ► Liability regime to not comprise penalties or liquidated damages \
-                Here is the template: ### "
+            "content": NDA_VALIDATION_SYSTEM_MESSAGE
         }
     ]
 
@@ -741,9 +1087,13 @@ def conversation_without_data(request_body):
                 "content": message["content"]
             })
 
-    print("OpenAI resource: ", AZURE_OPENAI_RESOURCE )
+    ## make sure prompt, history and document payloads leave room for the answer
+    messages, token_budget = TokenBudget(deployment.model_name, int(AZURE_OPENAI_MAX_TOKENS)).fit(messages, functions)
+    history_metadata['token_budget'] = token_budget
+
+    logging.debug(f"OpenAI resource: {deployment.resource}")
     response = openai.ChatCompletion.create(
-        engine=AZURE_OPENAI_MODEL,
+        **deployment.openai_kwargs("2023-08-01-preview"),
         messages = messages,
         functions=functions,
         function_call="auto",
@@ -754,8 +1104,6 @@ def conversation_without_data(request_body):
         stream=SHOULD_STREAM
     )
 
-    history_metadata = request_body.get("history_metadata", {})
-
     if not SHOULD_STREAM:
         response_obj = {
             "id": message_uuid,
@@ -770,65 +1118,342 @@ def conversation_without_data(request_body):
             }],
             "history_metadata": history_metadata
         }
+        if cache_key and response.choices[0].finish_reason != "function_call":
+            store_result(response.choices[0].message.content, response.model)
 
         return jsonify(response_obj), 200
     else:
-        return Response(stream_without_data(response, request_body, history_metadata), mimetype='text/event-stream')
+        return Response(stream_without_data(response, request_body, message_uuid, history_metadata, prefetched, store_result), mimetype='text/event-stream')
+
+def get_template_index(selected_templates):
+    ## the clause index of a template is built once per template version
+    try:
+        entry = read_docx_entry(NDA_TEMPPLATES_CONTAINER, selected_templates)
+        return template_indexes.get(entry.etag, lambda: build_template_index(split_clauses(entry.text)))
+    except Exception as e:
+        logging.exception("Exception building the template clause index")
+        return None
+
+def agreement_context(template_text, agreement_text, template_index=None):
+    ## the agreement as the model sees it: the full text or only its differences to the template,
+    ## followed by the general-rule facts so the model does not have to re-derive them
+    context = agreement_text
+    try:
+        if VALIDATION_AGREEMENT_CONTEXT == "diff" and (template_text or template_index):
+            context = "Differences of the third party NDA to the template:\n" + format_diff_context(redline(template_text, agreement_text, template_index))
+        elif template_text or template_index:
+            agreement_clauses = split_clauses(agreement_text)
+            template_clauses = template_index.clauses if template_index else split_clauses(template_text)
+            context += "\n\n" + format_alignment(agreement_clauses, align(template_clauses, agreement_clauses, template_index))
+    except Exception as e:
+        logging.exception("Exception comparing the agreement with the template")
+    if PRESCREEN_ENABLED:
+        try:
+            context += "\n\n" + format_findings(prescreen(agreement_text)["findings"])
+        except Exception as e:
+            logging.exception("Exception in pre-screening")
+    return context
+
+def build_validation_messages(template_text, agreement_text, question, template_index=None):
+    agreement_text = agreement_context(template_text, agreement_text, template_index)
+    return [
+        {
+            "role": "system",
+            "content": NDA_VALIDATION_SYSTEM_MESSAGE + template_text + " ###"
+        },
+        {
+            "role": "user",
+            "content": f"Here is the third party NDA: ### {agreement_text} ###\n{question}"
+        }
+    ]
+
+def validate_agreement(deployment, template_text, document_name, question, template_index=None):
+    agreement_text = get_nda_document(document_name)
+    messages, token_budget = TokenBudget(deployment.model_name, int(AZURE_OPENAI_MAX_TOKENS)).fit(
+        build_validation_messages(template_text, agreement_text, question, template_index)
+    )
+    completion = openai.ChatCompletion.create(
+        **deployment.openai_kwargs("2023-08-01-preview"),
+        messages=messages,
+        temperature=float(AZURE_OPENAI_TEMPERATURE),
+        max_tokens=int(AZURE_OPENAI_MAX_TOKENS),
+        top_p=float(AZURE_OPENAI_TOP_P),
+        stop=AZURE_OPENAI_STOP_SEQUENCE.split("|") if AZURE_OPENAI_STOP_SEQUENCE else None
+    )
+    return {
+        "content": completion.choices[0].message.content,
+        "token_budget": token_budget
+    }
+
+NDA_GENERAL_RULES_MESSAGE = NDA_VALIDATION_SYSTEM_MESSAGE.split("Here is the template:")[0]
+CLAUSE_VALIDATION_SYSTEM_MESSAGE = NDA_GENERAL_RULES_MESSAGE + "\
+                You will receive numbered pairs of a third party clause and the template clause it \
+                corresponds to, or no template clause if the template has no counterpart. \
+                Answer only with a JSON array containing one object per pair: \
+                {\"id\": <pair number>, \"conforming\": true or false, \"explanation\": \"<reason, empty when conforming>\"}"
+## changing the clause prompt invalidates every cached clause verdict
+CLAUSE_PROMPT_VERSION = hashlib.sha256(CLAUSE_VALIDATION_SYSTEM_MESSAGE.encode("utf-8")).hexdigest()[:16]
+
+def parse_clause_verdicts(content, pairs):
+    content = (content or "").strip()
+    if content.startswith("```"):
+        content = content.strip("`").partition("\n")[2]
+    try:
+        answers = json.loads(content)
+    except json.decoder.JSONDecodeError:
+        logging.warning("Clause verdicts are not valid JSON")
+        return {}
+
+    verdicts = {}
+    for answer in answers if isinstance(answers, list) else []:
+        try:
+            clause, _ = pairs[int(answer["id"]) - 1]
+        except (KeyError, TypeError, ValueError, IndexError):
+            continue
+        ## bool("false") is True, so only real booleans and their spelled-out strings count as a verdict
+        conforming = answer.get("conforming")
+        if isinstance(conforming, str):
+            conforming = {"true": True, "false": False}.get(conforming.strip().lower())
+        if not isinstance(conforming, bool):
+            continue
+        verdicts[clause.index] = {
+            "conforming": conforming,
+            "explanation": answer.get("explanation") or ""
+        }
+    return verdicts
+
+def judge_clauses(deployment, pairs):
+    prompt = "\n\n".join(
+        f"Pair {number}:\nThird party clause: ### {clause.text} ###\n"
+        f"Template clause: ### {template_clause.text if template_clause else 'none'} ###"
+        for number, (clause, template_clause) in enumerate(pairs, start=1)
+    )
+    messages, _ = TokenBudget(deployment.model_name, int(AZURE_OPENAI_MAX_TOKENS)).fit([
+        {"role": "system", "content": CLAUSE_VALIDATION_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ])
+    completion = openai.ChatCompletion.create(
+        **deployment.openai_kwargs("2023-08-01-preview"),
+        messages=messages,
+        temperature=float(AZURE_OPENAI_TEMPERATURE),
+        max_tokens=int(AZURE_OPENAI_MAX_TOKENS),
+        top_p=float(AZURE_OPENAI_TOP_P)
+    )
+    return parse_clause_verdicts(completion.choices[0].message.content, pairs)
+
+def iter_agreement_clause_verdicts(deployment, template_text, agreement_text, use_cache=True, template_index=None):
+    ## map: clause groups are judged in parallel, bounded per deployment by clause_limiter
+    return iter_clause_verdicts(
+        template_text,
+        agreement_text,
+        lambda pairs: judge_clauses(deployment, pairs),
+        clause_verdict_cache if use_cache else None,
+        f"{CLAUSE_PROMPT_VERSION}:{deployment.model_name}",
+        batch_size=int(CLAUSE_VALIDATION_BATCH_SIZE),
+        template_index=template_index,
+        concurrency=int(CLAUSE_VALIDATION_CONCURRENCY),
+        limiter=clause_limiter,
+        deployment_name=deployment.name
+    )
+
+def clause_report_content(report):
+    ## reduce: the per-clause verdicts in document order followed by the summary
+    return format_clause_report(report) + "\n\n" + reduce_clause_report(report)
+
+def validate_agreement_by_clause(deployment, template_text, agreement_text, use_cache=True, template_index=None):
+    for event in iter_agreement_clause_verdicts(deployment, template_text, agreement_text, use_cache, template_index):
+        if "report" in event:
+            report = event["report"]
+    report["content"] = clause_report_content(report)
+    return report
+
+def stream_clause_validation(events, deployment, message_uuid, history_metadata={}):
+    def chunk(content):
+        return format_as_ndjson({
+            "id": message_uuid,
+            "model": deployment.model_name,
+            "created": int(time.time()),
+            "object": "chat.completion.chunk",
+            "choices": [{
+                "messages": [{
+                    "role": "assistant",
+                    "content": content
+                }]
+            }],
+            "history_metadata": history_metadata
+        })
+
+    try:
+        ## each verdict is streamed as soon as its clause group finishes, the summary closes the answer
+        for event in events:
+            if "clause" in event:
+                yield chunk(format_clause_verdict(event["clause"]) + "\n")
+            else:
+                history_metadata['clause_validation'] = event["report"]["cache"]
+                yield chunk("\n" + reduce_clause_report(event["report"]))
+    except Exception as e:
+        yield format_as_ndjson({"error": str(e)})
+
+def conversation_by_clause(request_body, deployment, message_uuid):
+    selected_templates = request_body.get('selectedTemplates')
+    selected_files = request_body.get('selectedItems')
+    history_metadata = request_body.get("history_metadata", {})
+    events = iter_agreement_clause_verdicts(
+        deployment,
+        get_nda_template(selected_templates),
+        get_nda_document(selected_files),
+        use_cache=not request_body.get('bypassCache', False),
+        template_index=get_template_index(selected_templates)
+    )
+
+    if not SHOULD_STREAM:
+        report = next(event["report"] for event in events if "report" in event)
+        history_metadata['clause_validation'] = report["cache"]
+        return jsonify({
+            "id": message_uuid,
+            "model": deployment.model_name,
+            "created": int(time.time()),
+            "object": "chat.completion",
+            "choices": [{
+                "messages": [{
+                    "role": "assistant",
+                    "content": clause_report_content(report)
+                }]
+            }],
+            "history_metadata": history_metadata
+        }), 200
+    return Response(stream_clause_validation(events, deployment, message_uuid, history_metadata), mimetype='text/event-stream')
 
 def conversation_with_function(request_body):
-    print("Function calling....")
+    logging.debug("Function calling")
 
 @app.route("/conversation", methods=["GET", "POST"])
 def conversation():
     request_body = request.json
-    selected_gpt_version = request_body.get('selectedGPTVersion', 'GPT 3.5')
     selected_files = request_body.get('selectedItems')
-    selected_templates = request_body.get('selectedTemplates')
-    #print(selected_files)
-    #Some logic with the keys here
-    print(selected_gpt_version)
-    global AZURE_OPENAI_MODEL
-    global AZURE_OPENAI_RESOURCE
-    global AZURE_OPENAI_KEY
-    global AZURE_OPENAI_MODEL_NAME
-
-    if selected_gpt_version == "GPT 3.5":
-        
-        AZURE_OPENAI_MODEL = AZURE_OPENAI_MODEL_GPT3
-        AZURE_OPENAI_ENDPOINT = AZURE_OPENAI_ENDPOINT_GPT3     
-        AZURE_OPENAI_RESOURCE = AZURE_OPENAI_RESOURCE_GPT3
-        AZURE_OPENAI_KEY = AZURE_OPENAI_KEY_GPT3
-        AZURE_OPENAI_MODEL_NAME = AZURE_OPENAI_MODEL_NAME_GPT3
-
-    elif selected_gpt_version == "GPT 4.0":
-        AZURE_OPENAI_MODEL = AZURE_OPENAI_MODEL_GPT4
-        AZURE_OPENAI_ENDPOINT = AZURE_OPENAI_ENDPOINT_GPT4
-        AZURE_OPENAI_RESOURCE = AZURE_OPENAI_RESOURCE_GPT4
-        AZURE_OPENAI_KEY = AZURE_OPENAI_KEY_GPT4
-        AZURE_OPENAI_MODEL_NAME = AZURE_OPENAI_MODEL_NAME_GPT4
-   
     return conversation_internal(request_body, selected_files)
 
+def resolve_deployment(request_body):
+    selected_gpt_version = request_body.get('selectedGPTVersion', DEFAULT_GPT_VERSION)
+    logging.debug(f"Selected GPT version: {selected_gpt_version}")
+    return deployments.resolve(selected_gpt_version)
+
 def conversation_internal(request_body, selected_files):
     try:
+        deployment = resolve_deployment(request_body)
+        message_uuid = str(uuid.uuid4())
         use_data = should_use_data()
         if use_data:
-            return conversation_with_data(request_body, selected_files)
+            return conversation_with_data(request_body, selected_files, deployment, message_uuid)
         else:
             use_function = should_use_function()
             if use_function:
                 return conversation_with_function(request_body)
             else:
-                return conversation_without_data(request_body)
+                return conversation_without_data(request_body, deployment, message_uuid)
     except Exception as e:
         logging.exception("Exception in /conversation")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/validate/redline", methods=["POST"])
+def validate_redline():
+    request_body = request.json
+    template = request_body.get("template")
+    document = request_body.get("document")
+    if not template or not document:
+        return jsonify({"error": "template and document are required"}), 400
+
+    try:
+        result = redline(get_nda_template(template), get_nda_document(document), get_template_index(template))
+        if request_body.get("includeContext"):
+            result["context"] = format_diff_context(result)
+        return jsonify(result), 200
+    except Exception as e:
+        logging.exception("Exception in /validate/redline")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/validate/prescreen", methods=["POST"])
+def validate_prescreen():
+    request_body = request.json
+    document = request_body.get("document")
+    if not document:
+        return jsonify({"error": "document is required"}), 400
+
+    try:
+        return jsonify(prescreen(get_nda_document(document))), 200
+    except Exception as e:
+        logging.exception("Exception in /validate/prescreen")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/validate/clauses", methods=["POST"])
+def validate_clauses():
+    request_body = request.json
+    template = request_body.get("template")
+    document = request_body.get("document")
+    if not template or not document:
+        return jsonify({"error": "template and document are required"}), 400
+
+    try:
+        deployment = resolve_deployment(request_body)
+        template_text = get_nda_template(template)
+        agreement_text = get_nda_document(document)
+        use_cache = not request_body.get("bypassCache", False)
+        template_index = get_template_index(template)
+        if request_body.get("stream"):
+            events = iter_agreement_clause_verdicts(deployment, template_text, agreement_text, use_cache, template_index)
+            return Response((format_as_ndjson(event) for event in events), mimetype='text/event-stream')
+        return jsonify(validate_agreement_by_clause(deployment, template_text, agreement_text, use_cache, template_index)), 200
+    except Exception as e:
+        logging.exception("Exception in /validate/clauses")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/validate/batch", methods=["POST"])
+def validate_batch():
+    request_body = request.json
+    template = request_body.get("template")
+    documents = request_body.get("documents")
+
+    if not template:
+        return jsonify({"error": "template is required"}), 400
+    if not documents or not isinstance(documents, list):
+        return jsonify({"error": "documents must be a non-empty list of agreement blob names"}), 400
+    if len(documents) > int(BATCH_VALIDATION_MAX_DOCUMENTS):
+        return jsonify({"error": f"At most {BATCH_VALIDATION_MAX_DOCUMENTS} documents can be validated in one batch"}), 400
+
+    try:
+        deployment = resolve_deployment(request_body)
+        ## the template is extracted and indexed once and shared by every validation in the batch
+        template_text = get_nda_template(template)
+        template_index = get_template_index(template)
+    except Exception as e:
+        logging.exception("Exception in /validate/batch")
+        return jsonify({"error": str(e)}), 500
+
+    question = request_body.get("question", DEFAULT_VALIDATION_QUESTION)
+    if request_body.get("mode") == "clauses":
+        validate = lambda document_name: validate_agreement_by_clause(deployment, template_text, get_nda_document(document_name), template_index=template_index)
+    else:
+        validate = lambda document_name: validate_agreement(deployment, template_text, document_name, question, template_index)
+    results = run_batch(
+        documents,
+        validate,
+        batch_limiter,
+        deployment.name
+    )
+
+    def generate():
+        try:
+            for result in results:
+                yield format_as_ndjson(result)
+        finally:
+            ## the server closes the response when the client disconnects; stop validating the rest
+            results.close()
+
+    return Response(generate(), mimetype='text/event-stream')
+
 ## Conversation History API ## 
 @app.route("/history/generate", methods=["POST"])
 def add_conversation():
-    global message_uuid
-    message_uuid = str(uuid.uuid4())
     authenticated_user = get_authenticated_user_details(request_headers=request.headers)
     user_id = authenticated_user['user_principal_id']
 
@@ -842,37 +1467,53 @@ def add_conversation():
 
         # check for the conversation_id, if the conversation is not set, we will create a new one
         history_metadata = {}
+        messages = request.json["messages"]
+        if not (len(messages) > 0 and messages[-1]['role'] == "user"):
+            raise Exception("No user message found")
+
+        try:
+            expand_message_content(user_id, messages)
+        except KeyError:
+            return jsonify({"error": "The full content of an earlier message is no longer stored, start a new conversation"}), 404
+
         if not conversation_id:
-            title = generate_title(request.json["messages"])
-            conversation_dict = cosmos_conversation_client.create_conversation(user_id=user_id, title=title)
-            conversation_id = conversation_dict['id']
+            ## a provisional title costs nothing; the model's title replaces it in the background
+            title = heuristic_title(messages, request.json.get('selectedItems'))
+            conversation_id = str(uuid.uuid4())
+            created_at = datetime.utcnow().isoformat()
+            persist_history("create_conversation", user_id, {"conversation_id": conversation_id, "title": title, "created_at": created_at})
             history_metadata['title'] = title
-            history_metadata['date'] = conversation_dict['createdAt']
+            history_metadata['date'] = created_at
+            if title_generator:
+                title_generator.submit(messages, generated_title_writer(user_id, conversation_id, title), request.json.get('selectedItems'))
             
         ## Format the incoming message object in the "chat/completions" messages format
-        ## then write it to the conversation history in cosmos
-        messages = request.json["messages"]
-        if len(messages) > 0 and messages[-1]['role'] == "user":
-            cosmos_conversation_client.create_message(
-                uuid=str(uuid.uuid4()),
-                conversation_id=conversation_id,
-                user_id=user_id,
-                input_message=messages[-1]
-            )
-        else:
-            raise Exception("No user message found")
+        ## then queue it for the conversation history in cosmos
+        persist_history("create_messages", user_id, {
+            "conversation_id": conversation_id,
+            "messages": [(str(uuid.uuid4()), messages[-1])],
+            "created_at": datetime.utcnow().isoformat()
+        })
         
         # Submit request to Chat Completions for response
         request_body = request.json
         history_metadata['conversation_id'] = conversation_id
         request_body['history_metadata'] = history_metadata
-        return conversation_internal(request_body)
+        return conversation_internal(request_body, request_body.get('selectedItems'))
        
     except Exception as e:
         logging.exception("Exception in /history/generate")
         return jsonify({"error": str(e)}), 500
 
 
+def generated_title_writer(user_id, conversation_id, provisional_title):
+    def store(title):
+        ## queued behind the conversation's creation; skipped in Cosmos if the user renamed it meanwhile
+        if title != provisional_title:
+            persist_history("set_generated_title", user_id, {"conversation_id": conversation_id, "title": title, "provisional_title": provisional_title})
+    return store
+
+
 @app.route("/history/update", methods=["POST"])
 def update_conversation():
     authenticated_user = get_authenticated_user_details(request_headers=request.headers)
@@ -894,21 +1535,18 @@ def update_conversation():
         ## then write it to the conversation history in cosmos
         messages = request.json["messages"]
         if len(messages) > 0 and messages[-1]['role'] == "assistant":
+            new_messages = []
             if len(messages) > 1 and messages[-2].get('role', None) == "tool":
                 # write the tool message first
-                cosmos_conversation_client.create_message(
-                    uuid=str(uuid.uuid4()),
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    input_message=messages[-2]
-                )
-            # write the assistant message
-            cosmos_conversation_client.create_message(
-                uuid=message_uuid,
-                conversation_id=conversation_id,
-                user_id=user_id,
-                input_message=messages[-1]
-            )
+                new_messages.append((str(uuid.uuid4()), messages[-2]))
+            # write the assistant message, keeping the id it was streamed with
+            new_messages.append((messages[-1].get('id') or str(uuid.uuid4()), messages[-1]))
+            ## one transactional batch appends both messages and touches the conversation
+            persist_history("create_messages", user_id, {
+                "conversation_id": conversation_id,
+                "messages": new_messages,
+                "created_at": datetime.utcnow().isoformat()
+            })
         else:
             raise Exception("No bot messages found")
         
@@ -934,14 +1572,20 @@ def update_message():
         
         if not message_feedback:
             return jsonify({"error": "message_feedback is required"}), 400
-        
-        ## update the message in cosmos
-        updated_message = cosmos_conversation_client.update_message_feedback(user_id, message_id, message_feedback)
+
+        pending = history_writes_pending(user_id)
+        if pending:
+            return pending
+
+        ## patch the feedback field of the message in cosmos
+        updated_message = cosmos_conversation_client.update_message_feedback(user_id, message_id, message_feedback, etag=request.json.get("etag"))
         if updated_message:
-            return jsonify({"message": f"Successfully updated message with feedback {message_feedback}", "message_id": message_id}), 200
+            return jsonify({"message": f"Successfully updated message with feedback {message_feedback}", "message_id": message_id, "etag": updated_message.get("_etag")}), 200
         else:
             return jsonify({"error": f"Unable to update message {message_id}. It either does not exist or the user does not have access to it."}), 404
-        
+
+    except CosmosAccessConditionFailedError:
+        return jsonify({"error": f"Message {message_id} was changed since it was read"}), 409
     except Exception as e:
         logging.exception("Exception in /history/message_feedback")
         return jsonify({"error": str(e)}), 500
@@ -958,12 +1602,17 @@ def delete_conversation():
     try: 
         if not conversation_id:
             return jsonify({"error": "conversation_id is required"}), 400
-        
-        ## delete the conversation messages from cosmos first
-        deleted_messages = cosmos_conversation_client.delete_messages(conversation_id, user_id)
 
-        ## Now delete the conversation 
+        ## a conversation or messages still queued would be missing, or written back after the delete
+        pending = history_writes_pending(user_id)
+        if pending:
+            return pending
+
+        ## hide the conversation at once; it expires through its ttl and the messages are deleted in the background
         deleted_conversation = cosmos_conversation_client.delete_conversation(user_id, conversation_id)
+        if not deleted_conversation:
+            return jsonify({"error": f"Conversation {conversation_id} was not found. It either does not exist or the logged in user does not have access to it."}), 404
+        history_reclaimer.submit(f"messages of conversation {conversation_id}", cosmos_conversation_client.delete_messages, conversation_id, user_id)
 
         return jsonify({"message": "Successfully deleted conversation and messages", "conversation_id": conversation_id}), 200
     except Exception as e:
@@ -972,18 +1621,62 @@ def delete_conversation():
 
 @app.route("/history/list", methods=["GET"])
 def list_conversations():
-    offset = request.args.get("offset", 0)
+    ## Returns a JSON array of conversations; supports ?continuation_token=, ?page_size= and ?since=<updatedAt>.
+    ## The token for the next page, if any, is returned in the X-Continuation-Token header.
+    try:
+        offset = int(request.args.get("offset", 0))
+        page_size = int(request.args.get("page_size", 25))
+    except ValueError:
+        return jsonify({"error": "offset and page_size must be integers"}), 400
+    if offset < 0:
+        return jsonify({"error": "offset must not be negative"}), 400
+    ## max_item_count treats -1 as no limit, so keep the page size within 1..100
+    page_size = max(1, min(page_size, 100))
+    continuation_token = request.args.get("continuation_token")
+    since = request.args.get("since")
     authenticated_user = get_authenticated_user_details(request_headers=request.headers)
     user_id = authenticated_user['user_principal_id']
 
-    ## get the conversations from cosmos
-    conversations = cosmos_conversation_client.get_conversations(user_id, offset=offset, limit=25)
+    if since:
+        try:
+            since_time = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({"error": "since must be an ISO 8601 updatedAt value"}), 400
+        ## updatedAt is stored as naive UTC, and compared as a string
+        if since_time.tzinfo is not None:
+            since_time = since_time.astimezone(timezone.utc).replace(tzinfo=None)
+        since = since_time.isoformat()
+        ## deletions are only visible until the deleted conversations expire
+        if since_time < datetime.utcnow() - timedelta(seconds=int(AZURE_COSMOSDB_DELETED_TTL_SECONDS)):
+            return jsonify({"error": "since is older than the retention of deleted conversations, reload the full list"}), 410
+
+    pending = history_writes_pending(user_id)
+    if pending:
+        return pending
+
+    try:
+        ## offset paging is kept for clients that do not send continuation tokens yet; its cost grows with the offset
+        if offset and not continuation_token and not since:
+            conversations = cosmos_conversation_client.get_conversations(user_id, offset=offset, limit=page_size)
+            next_token = None
+        else:
+            conversations, next_token = cosmos_conversation_client.get_conversations_page(user_id, page_size, continuation_token=continuation_token, since=since)
+    except HistoryResetError:
+        return jsonify({"error": "The history was deleted since then, reload the full list"}), 410
+    except CosmosHttpResponseError as e:
+        ## Cosmos rejects a malformed or expired continuation token as a bad request
+        if continuation_token and e.status_code == 400:
+            return jsonify({"error": "continuation_token is malformed or expired, reload the list from the first page"}), 400
+        logging.exception("Exception in /history/list")
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        logging.exception("Exception in /history/list")
+        return jsonify({"error": str(e)}), 500
     if not isinstance(conversations, list):
         return jsonify({"error": f"No conversations for {user_id} were found"}), 404
 
-    ## return the conversation ids
-
-    return jsonify(conversations), 200
+    headers = {"X-Continuation-Token": next_token} if next_token else {}
+    return jsonify(conversations), 200, headers
 
 @app.route("/history/read", methods=["POST"])
 def get_conversation():
@@ -996,6 +1689,10 @@ def get_conversation():
     if not conversation_id:
         return jsonify({"error": "conversation_id is required"}), 400
 
+    pending = history_writes_pending(user_id)
+    if pending:
+        return pending
+
     ## get the conversation object and the related messages from cosmos
     conversation = cosmos_conversation_client.get_conversation(user_id, conversation_id)
     ## return the conversation id and the messages in the bot frontend format
@@ -1006,9 +1703,41 @@ def get_conversation():
     conversation_messages = cosmos_conversation_client.get_messages(user_id, conversation_id)
 
     ## format the messages in the bot frontend format
-    messages = [{'id': msg['id'], 'role': msg['role'], 'content': msg['content'], 'createdAt': msg['createdAt'], 'feedback': msg.get('feedback')} for msg in conversation_messages]
+    messages = [{'id': msg['id'], 'role': msg['role'], 'content': msg['content'], 'createdAt': msg['createdAt'], 'feedback': msg.get('feedback'), 'etag': msg.get('_etag')} for msg in conversation_messages]
+    ## offloaded bodies are only previewed; /history/message_content returns one when the user expands that message
+    for message, msg in zip(messages, conversation_messages):
+        if msg.get('contentRef'):
+            message['contentRef'] = msg['contentRef']
+            message['contentLength'] = msg.get('contentLength')
 
-    return jsonify({"conversation_id": conversation_id, "messages": messages}), 200
+    return jsonify({"conversation_id": conversation_id, "etag": conversation.get('_etag'), "messages": messages}), 200
+
+@app.route("/history/message_content", methods=["POST"])
+def get_message_content():
+    authenticated_user = get_authenticated_user_details(request_headers=request.headers)
+    user_id = authenticated_user['user_principal_id']
+
+    try:
+        conversation_id = request.json.get("conversation_id", None)
+        message_id = request.json.get("message_id", None)
+        if not conversation_id or not message_id:
+            return jsonify({"error": "conversation_id and message_id are required"}), 400
+
+        pending = history_writes_pending(user_id)
+        if pending:
+            return pending
+
+        ## the point read in the user's partition is what authorizes access to the shared content
+        message = cosmos_conversation_client.get_message(user_id, message_id)
+        if not message or message.get('conversationId') != conversation_id:
+            return jsonify({"error": f"Message {message_id} was not found. It either does not exist or the logged in user does not have access to it."}), 404
+
+        return jsonify({"id": message_id, "content": cosmos_conversation_client.get_message_content(message)}), 200
+    except KeyError:
+        return jsonify({"error": f"The content of message {message_id} is no longer stored"}), 404
+    except Exception as e:
+        logging.exception("Exception in /history/message_content")
+        return jsonify({"error": str(e)}), 500
 
 @app.route("/history/rename", methods=["POST"])
 def rename_conversation():
@@ -1021,17 +1750,21 @@ def rename_conversation():
     if not conversation_id:
         return jsonify({"error": "conversation_id is required"}), 400
     
-    ## get the conversation from cosmos
-    conversation = cosmos_conversation_client.get_conversation(user_id, conversation_id)
-    if not conversation:
-        return jsonify({"error": f"Conversation {conversation_id} was not found. It either does not exist or the logged in user does not have access to it."}), 404
-
-    ## update the title
     title = request.json.get("title", None)
     if not title:
         return jsonify({"error": "title is required"}), 400
-    conversation['title'] = title
-    updated_conversation = cosmos_conversation_client.upsert_conversation(conversation)
+
+    pending = history_writes_pending(user_id)
+    if pending:
+        return pending
+
+    ## patch the title in place; an etag from an earlier read makes the rename conditional
+    try:
+        updated_conversation = cosmos_conversation_client.rename_conversation(user_id, conversation_id, title, etag=request.json.get("etag"))
+    except CosmosAccessConditionFailedError:
+        return jsonify({"error": f"Conversation {conversation_id} was changed since it was read"}), 409
+    if not updated_conversation:
+        return jsonify({"error": f"Conversation {conversation_id} was not found. It either does not exist or the logged in user does not have access to it."}), 404
 
     return jsonify(updated_conversation), 200
 
@@ -1041,19 +1774,15 @@ def delete_all_conversations():
     authenticated_user = get_authenticated_user_details(request_headers=request.headers)
     user_id = authenticated_user['user_principal_id']
 
-    # get conversations for user
-    try:
-        conversations = cosmos_conversation_client.get_conversations(user_id, offset=0, limit=None)
-        if not conversations:
-            return jsonify({"error": f"No conversations for {user_id} were found"}), 404
-        
-        # delete each conversation
-        for conversation in conversations:
-            ## delete the conversation messages from cosmos first
-            deleted_messages = cosmos_conversation_client.delete_messages(conversation['id'], user_id)
+    ## queued conversations are only reclaimed if they reach Cosmos before the background job lists them
+    pending = history_writes_pending(user_id)
+    if pending:
+        return pending
 
-            ## Now delete the conversation 
-            deleted_conversation = cosmos_conversation_client.delete_conversation(user_id, conversation['id'])
+    # hide the whole history with one write, then mark the conversations deleted and reclaim the messages in the background
+    try:
+        deleted_before = cosmos_conversation_client.hide_conversations(user_id)
+        history_reclaimer.submit(f"conversations of user {user_id}", delete_user_history, user_id, deleted_before)
 
         return jsonify({"message": f"Successfully deleted conversation and messages for user {user_id}"}), 200
     
@@ -1062,6 +1791,12 @@ def delete_all_conversations():
         return jsonify({"error": str(e)}), 500
     
 
+def delete_user_history(user_id, deleted_before):
+    conversation_ids = cosmos_conversation_client.delete_conversations(user_id, created_before=deleted_before)
+    cosmos_conversation_client.delete_conversations_messages(user_id, conversation_ids)
+    return conversation_ids
+
+
 @app.route("/history/clear", methods=["POST"])
 def clear_messages():
     ## get the user id from the request headers
@@ -1073,7 +1808,11 @@ def clear_messages():
     try: 
         if not conversation_id:
             return jsonify({"error": "conversation_id is required"}), 400
-        
+
+        pending = history_writes_pending(user_id)
+        if pending:
+            return pending
+
         ## delete the conversation messages from cosmos
         deleted_messages = cosmos_conversation_client.delete_messages(conversation_id, user_id)
 
@@ -1087,10 +1826,28 @@ def ensure_cosmos():
     if not AZURE_COSMOSDB_ACCOUNT:
         return jsonify({"error": "CosmosDB is not configured"}), 404
     
-    if not cosmos_conversation_client or not cosmos_conversation_client.ensure():
+    if not cosmos_conversation_client or not cosmos_conversation_client.ensure(apply_indexing_policy=AZURE_COSMOSDB_APPLY_INDEXING_POLICY):
         return jsonify({"error": "CosmosDB is not working"}), 500
 
-    return jsonify({"message": "CosmosDB is configured and working"}), 200
+    return jsonify({"message": "CosmosDB is configured and working", "indexing_policy": cosmos_conversation_client.indexing_policy_status}), 200
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    return jsonify({
+        "upstream_http": http_clients.stats(),
+        "docx_cache": docx_text_cache.stats(),
+        "agreements_index": agreements_index.stats(),
+        "templates_index": templates_index.stats(),
+        "document_prefetch": document_prefetcher.stats(),
+        "validation_cache": validation_cache.stats() if validation_cache else None,
+        "clause_verdict_cache": clause_verdict_cache.stats() if clause_verdict_cache else None,
+        "template_clause_index": template_indexes.stats(),
+        "cosmos": cosmos_conversation_client.request_stats.stats() if cosmos_conversation_client else None,
+        "history_reclaim": history_reclaimer.stats(),
+        "history_write_queue": history_write_queue.stats() if history_write_queue else None,
+        "conversation_titles": title_generator.stats() if title_generator else None,
+        "history_content": history_content_store.stats() if history_content_store else None
+    }), 200
 
 @app.route("/frontend_settings", methods=["GET"])  
 def get_frontend_settings():
@@ -1100,22 +1857,20 @@ def get_frontend_settings():
         logging.exception("Exception in /frontend_settings")
         return jsonify({"error": str(e)}), 500  
 
-def generate_title(conversation_messages):
+def generate_title(conversation_messages, deployment, agreement_names=None):
     ## make sure the messages are sorted by _ts descending
     title_prompt = 'Summarize the conversation so far into a 4-word or less title. Do not use any quotation marks or punctuation. Respond with a json object in the format {{"title": string}}. Do not include any other commentary or description.'
+    ## the user messages rarely name the agreement; the selected files do
+    if agreement_names:
+        title_prompt = f'The conversation is about these agreement files: {", ".join(agreement_names)}. Name the agreement in the title. ' + title_prompt
 
     messages = [{'role': msg['role'], 'content': msg['content']} for msg in conversation_messages]
     messages.append({'role': 'user', 'content': title_prompt})
 
     try:
         ## Submit prompt to Chat Completions for response
-        base_url = AZURE_OPENAI_ENDPOINT if AZURE_OPENAI_ENDPOINT else f"https://{AZURE_OPENAI_RESOURCE}.openai.azure.com/"
-        openai.api_type = "azure"
-        openai.api_base = base_url
-        openai.api_version = "2023-03-15-preview"
-        openai.api_key = AZURE_OPENAI_KEY
         completion = openai.ChatCompletion.create(    
-            engine=AZURE_OPENAI_MODEL,
+            **deployment.openai_kwargs("2023-03-15-preview"),
             messages=messages,
             temperature=1,
             max_tokens=64 
@@ -1123,7 +1878,8 @@ def generate_title(conversation_messages):
         title = json.loads(completion['choices'][0]['message']['content'])['title']
         return title
     except Exception as e:
-        return messages[-2]['content']
+        logging.exception("Exception generating conversation title")
+        return None
     
 #To be used with Azure search index
 # @app.route('/get_files', methods=['GET'])
@@ -1146,55 +1902,51 @@ def generate_title(conversation_messages):
 
 #     return jsonify(filepaths)
 
+def list_blob_names(index):
+    ## Streams a JSON array of blob names; supports ?prefix=, ?limit= and ?continuation_token=.
+    ## The token for the next page, if any, is returned in the X-Continuation-Token header.
+    prefix = request.args.get("prefix", "")
+    limit = request.args.get("limit")
+    continuation_token = request.args.get("continuation_token")
+    try:
+        names, next_token = index.page(prefix=prefix, limit=int(limit) if limit else None, continuation_token=continuation_token)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid paging parameters: {e}"}), 400
+    except BlobIndexUnavailable as e:
+        ## a partial list would look complete to the UI, so none is returned
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    def generate():
+        yield "["
+        for i, name in enumerate(names):
+            yield ("," if i else "") + json.dumps(name, ensure_ascii=False)
+        yield "]"
+
+    headers = {"X-Continuation-Token": next_token} if next_token else {}
+    return Response(generate(), mimetype="application/json", headers=headers)
+
 @app.route('/get_files', methods=['GET'])  
 def get_filepaths():  
-    connection_string = AZURE_BLOB_CONNECTION_STRING 
-    container_name = NDA_AGREEMENTS_CONTAINER  
-  
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)  
-  
-    container_client = blob_service_client.get_container_client(container_name)  
-  
-    filepaths = []  
-    blob_list = container_client.list_blobs()  
-    for blob in blob_list:  
-        filepaths.append(blob.name)  
-      
-    print(jsonify(filepaths))  
-      
-    return jsonify(filepaths)
+    return list_blob_names(agreements_index)
 
 @app.route('/get_nda_templates', methods=['GET'])  
 def get_templates_filepath():  
-    connection_string = AZURE_BLOB_CONNECTION_STRING 
-    container_name = NDA_TEMPPLATES_CONTAINER
-  
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)  
-  
-    container_client = blob_service_client.get_container_client(container_name)  
-  
-    filepaths = []  
-    blob_list = container_client.list_blobs()  
-    for blob in blob_list:  
-        filepaths.append(blob.name)  
-      
-    print(jsonify(filepaths))  
-      
-    return jsonify(filepaths)
+    return list_blob_names(templates_index)
+
 
+def get_blob_service_client():
+    ## one client (and connection pool) for the whole process
+    global blob_service_client
+    if blob_service_client is None:
+        blob_service_client = BlobServiceClient.from_connection_string(AZURE_BLOB_CONNECTION_STRING)
+    return blob_service_client
+
+def read_docx_entry(container_name, blob_name):
+    blob_client = get_blob_service_client().get_blob_client(container_name, blob_name)  
+    return docx_text_cache.fetch(blob_client, extract_docx_text)
 
 def read_docx_from_blob (container_name, blob_name): 
-    connection_string = AZURE_BLOB_CONNECTION_STRING 
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)  
-    blob_client = blob_service_client.get_blob_client(container_name, blob_name)  
-  
-    download_stream = blob_client.download_blob()  
-    doc = Document(BytesIO(download_stream.readall()))  
-  
-    full_text = []  
-    for para in doc.paragraphs:  
-        full_text.append(para.text)  
-    return '\n'.join(full_text) 
+    return read_docx_entry(container_name, blob_name).text
 
 def get_nda_template(selected_templates):
     return read_docx_from_blob(NDA_TEMPPLATES_CONTAINER, selected_templates)
@@ -0,0 +1,117 @@
+import base64
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+
+def encode_continuation_token(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii")
+
+
+def decode_continuation_token(token: str) -> str:
+    return base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+
+
+class BlobIndexUnavailable(Exception):
+    """No complete listing of the container is available yet."""
+
+
+class BlobNameIndex():
+    """Sorted in-memory index of the blob names in one container.
+
+    The index is rebuilt on a background thread every `refresh_seconds` by listing the whole
+    container again: the list API has no modified-since filter, and only a full listing shows
+    deleted blobs. Readers always see a complete, consistent snapshot: until the first build
+    completes `page` waits for it, and raises BlobIndexUnavailable if it does not finish in time
+    or failed. A failed build is retried after `retry_seconds`, doubling up to `refresh_seconds`;
+    a failed later refresh keeps serving the previous snapshot and is reported in `stats`.
+    """
+
+    def __init__(self, get_container_client: Callable, refresh_seconds: float = 300, page_size: int = 5000, retry_seconds: float = 1):
+        self.get_container_client = get_container_client
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.page_size = page_size
+        self._names = []
+        self._complete = False
+        self._built = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self.last_refreshed = None
+        self.refresh_count = 0
+        self.last_error = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        retry_delay = self.retry_seconds
+        while True:
+            try:
+                self.refresh()
+                retry_delay = self.retry_seconds
+                wait = self.refresh_seconds
+            except Exception as e:
+                logging.exception("Exception refreshing blob name index")
+                self.last_error = str(e)
+                ## a transient error must not leave the listing unavailable for a whole refresh interval
+                wait = retry_delay
+                retry_delay = min(retry_delay * 2, self.refresh_seconds)
+            finally:
+                ## never leave readers waiting on a failed first build
+                self._built.set()
+            time.sleep(wait)
+
+    def refresh(self):
+        container_client = self.get_container_client()
+        names = []
+        for page in container_client.list_blobs(results_per_page=self.page_size).by_page():
+            names.extend(blob.name for blob in page)
+        names.sort()
+        self._names = names
+        self._complete = True
+        self.last_error = None
+        self._built.set()
+        self.last_refreshed = time.time()
+        self.refresh_count += 1
+
+    def page(self, prefix: str = "", limit: Optional[int] = None, continuation_token: Optional[str] = None, timeout: float = 30):
+        """Return (names, next_continuation_token) for names starting with prefix, in order."""
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be a positive integer")
+        self._ensure_started()
+        if not self._built.wait(timeout):
+            raise BlobIndexUnavailable("The blob list is still being built")
+        if not self._complete:
+            raise BlobIndexUnavailable(f"Listing the blobs failed: {self.last_error}")
+
+        names = self._names
+        if continuation_token:
+            start = bisect.bisect_right(names, decode_continuation_token(continuation_token))
+        else:
+            start = bisect.bisect_left(names, prefix)
+
+        result = []
+        for name in names[start:]:
+            if not name.startswith(prefix):
+                if name > prefix:
+                    break
+                continue
+            if limit is not None and len(result) >= limit:
+                return result, encode_continuation_token(result[-1])
+            result.append(name)
+        return result, None
+
+    def stats(self) -> dict:
+        return {
+            "names": len(self._names),
+            "complete": self._complete,
+            "last_refreshed": self.last_refreshed,
+            "refresh_count": self.refresh_count,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
+
+
+@dataclass
+class CachedBlobText():
+    container_name: str
+    blob_name: str
+    etag: str
+    text: str
+    size: int
+    validated_at: float
+
+
+class BlobTextCache():
+    """Byte-budget LRU cache of text extracted from blobs, validated against the blob ETag.
+
+    Within `ttl_seconds` of the last validation an entry is served without touching storage.
+    After that it is revalidated with a conditional GET (If-None-Match), which costs a single
+    round trip and no body download or re-extraction while the blob is unchanged.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 60):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+        self.etag_checks = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, entry: CachedBlobText):
+        key = (entry.container_name, entry.blob_name)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+                self.evictions += 1
+
+    def fetch(self, blob_client, extract: Callable[[bytes], str]) -> CachedBlobText:
+        key = (blob_client.container_name, blob_client.blob_name)
+        entry = self._lookup(key)
+
+        if entry is not None:
+            if time.monotonic() - entry.validated_at < self.ttl_seconds:
+                self.hits += 1
+                return entry
+            try:
+                downloader = blob_client.download_blob(etag=entry.etag, match_condition=MatchConditions.IfModified)
+            except ResourceNotModifiedError:
+                self.revalidations += 1
+                entry.validated_at = time.monotonic()
+                return entry
+        else:
+            downloader = blob_client.download_blob()
+
+        self.misses += 1
+        text = extract(downloader.readall())
+        entry = CachedBlobText(
+            container_name=key[0],
+            blob_name=key[1],
+            etag=downloader.properties.etag,
+            text=text,
+            size=len(text.encode("utf-8")),
+            validated_at=time.monotonic()
+        )
+        self._store(entry)
+        return entry
+
+    def etag(self, blob_client) -> str:
+        """Return the blob's current ETag without downloading it.
+
+        A fresh entry answers from memory; otherwise one properties request is made, which also
+        revalidates an entry whose ETag is unchanged.
+        """
+        key = (blob_client.container_name, blob_client.blob_name)
+        entry = self._lookup(key)
+        if entry is not None and time.monotonic() - entry.validated_at < self.ttl_seconds:
+            return entry.etag
+        etag = blob_client.get_blob_properties().etag
+        with self._lock:
+            self.etag_checks += 1
+        if entry is not None and entry.etag == etag:
+            entry.validated_at = time.monotonic()
+        return etag
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.revalidations + self.misses
+        return {
+            "entries": entries,
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "etag_checks": self.etag_checks,
+            "hit_rate": round((self.hits + self.revalidations) / lookups, 4) if lookups else 0.0
+        }
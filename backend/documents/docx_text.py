@@ -0,0 +1,98 @@
+import logging
+import zipfile
+from io import BytesIO
+from xml.etree.ElementTree import ParseError, iterparse
+
+from docx import Document
+
+WORDPROCESSING_NAMESPACES = (
+    "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+    "http://purl.oclc.org/ooxml/wordprocessingml/main",
+)
+CELL_SEPARATOR = " | "
+
+
+class UnsupportedDocxError(Exception):
+    pass
+
+
+def _local_name(tag):
+    namespace, _, name = tag[1:].partition("}")
+    if namespace not in WORDPROCESSING_NAMESPACES:
+        return None
+    return name
+
+
+def extract_docx_text_streaming(data: bytes) -> str:
+    """Extract paragraph and table text from a .docx without building the python-docx object model.
+
+    `word/document.xml` is streamed out of the zip and parsed incrementally. Paragraphs are
+    emitted one per line in document order; each table row becomes one line with its cells
+    joined by " | ", so signature blocks and schedules kept in tables are not lost.
+    """
+    lines = []
+    paragraphs = []
+    cells = []
+    rows = []
+
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        with archive.open("word/document.xml") as document_xml:
+            for event, elem in iterparse(document_xml, events=("start", "end")):
+                name = _local_name(elem.tag)
+                if name is None:
+                    continue
+
+                if event == "start":
+                    if name == "p":
+                        paragraphs.append([])
+                    elif name == "tc":
+                        cells.append([])
+                    elif name == "tr":
+                        rows.append([])
+                    elif name == "altChunk":
+                        raise UnsupportedDocxError("altChunk content is stored outside word/document.xml")
+                    continue
+
+                if name == "t" and paragraphs:
+                    paragraphs[-1].append(elem.text or "")
+                elif name == "tab" and paragraphs:
+                    paragraphs[-1].append("\t")
+                elif name in ("br", "cr") and paragraphs:
+                    paragraphs[-1].append("\n")
+                elif name == "noBreakHyphen" and paragraphs:
+                    paragraphs[-1].append("-")
+                elif name == "p":
+                    text = "".join(paragraphs.pop())
+                    if cells:
+                        cells[-1].append(text)
+                    else:
+                        lines.append(text)
+                    elem.clear()
+                elif name == "tc":
+                    rows[-1].append(" ".join(text for text in cells.pop() if text))
+                elif name == "tr":
+                    row = CELL_SEPARATOR.join(rows.pop())
+                    if cells:
+                        cells[-1].append(row)
+                    else:
+                        lines.append(row)
+                    elem.clear()
+
+    return "\n".join(lines)
+
+
+def extract_docx_text_python_docx(data: bytes) -> str:
+    doc = Document(BytesIO(data))
+
+    full_text = []
+    for para in doc.paragraphs:
+        full_text.append(para.text)
+    return '\n'.join(full_text)
+
+
+def extract_docx_text(data: bytes) -> str:
+    try:
+        return extract_docx_text_streaming(data)
+    except (zipfile.BadZipFile, KeyError, IndexError, ParseError, UnsupportedDocxError) as e:
+        logging.warning(f"Falling back to python-docx text extraction: {e}")
+        return extract_docx_text_python_docx(data)
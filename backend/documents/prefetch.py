@@ -0,0 +1,44 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+class DocumentPrefetcher():
+    """Starts document downloads and extraction on a thread pool before the model asks for them.
+
+    `prefetch` returns one future per tool name; `result` serves a tool call from its future
+    and falls back to calling the loader inline if the prefetch failed.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="document-prefetch")
+        self.prefetched = 0
+        self.served = 0
+        self.failed = 0
+
+    def prefetch(self, loaders: Dict[str, Callable[[], str]]) -> Dict[str, Future]:
+        futures = {}
+        for name, loader in loaders.items():
+            futures[name] = self.executor.submit(loader)
+            self.prefetched += 1
+        return futures
+
+    def result(self, futures: Dict[str, Future], name: str, loader: Callable[[], str]) -> str:
+        future = futures.get(name)
+        if future is None:
+            return loader()
+        try:
+            text = future.result()
+            self.served += 1
+            return text
+        except Exception:
+            logging.exception(f"Prefetch of {name} failed, loading inline")
+            self.failed += 1
+            return loader()
+
+    def stats(self) -> dict:
+        return {
+            "prefetched": self.prefetched,
+            "served": self.served,
+            "failed": self.failed
+        }
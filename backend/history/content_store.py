@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+
+class LocalContentBackend():
+    """Content-addressed gzip files under `root`, fanned out by the first two hex digits of the hash."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest + ".gz")
+
+    def put(self, digest: str, data: bytes) -> bool:
+        path = self._path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ## write aside and rename, so a reader never sees a partial file
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        return True
+
+    def get(self, digest: str) -> bytes:
+        try:
+            with open(self._path(digest), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            raise KeyError(digest)
+
+
+class BlobContentBackend():
+    """Content-addressed gzip blobs in one Blob Storage container."""
+
+    def __init__(self, get_container_client: Callable):
+        self.get_container_client = get_container_client
+
+    def put(self, digest: str, data: bytes) -> bool:
+        ## the name is the hash of the content, so an existing blob already holds the same bytes
+        try:
+            self.get_container_client().upload_blob(f"{digest}.gz", data, overwrite=False)
+            return True
+        except ResourceExistsError:
+            return False
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self.get_container_client().download_blob(f"{digest}.gz").readall()
+        except ResourceNotFoundError:
+            raise KeyError(digest)
+
+
+class MessageContentStore():
+    """Keeps large message bodies out of Cosmos, compressed and deduplicated by SHA-256.
+
+    `offload` stores a body of at least `threshold_bytes` (UTF-8) once per distinct content and
+    returns the fields that replace it in the message item: a `preview_chars` long `content`,
+    `contentRef` (the hash) and `contentLength`. `load` returns the full body for a reference.
+    Bodies are shared between messages and users and are not deleted with a conversation;
+    callers only hand out content they read through a message of the requesting user.
+    """
+
+    def __init__(self, backend, threshold_bytes: int = 8192, preview_chars: int = 280, max_known: int = 100000):
+        self.backend = backend
+        self.threshold_bytes = threshold_bytes
+        self.preview_chars = preview_chars
+        self.max_known = max_known
+        ## hashes this process stored or found, so repeated agreements skip the upload round trip
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+        self.offloaded = 0
+        self.deduplicated = 0
+        self.stored_bytes = 0
+        self.offloaded_bytes = 0
+        self.loads = 0
+
+    @staticmethod
+    def make_ref(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def offload(self, content: str) -> Optional[dict]:
+        data = (content or "").encode("utf-8")
+        if not self.threshold_bytes or len(data) < self.threshold_bytes:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            known = digest in self._known
+            if known:
+                self._known.move_to_end(digest)
+        stored = 0
+        if not known:
+            compressed = gzip.compress(data)
+            if self.backend.put(digest, compressed):
+                stored = len(compressed)
+            with self._lock:
+                self._known[digest] = True
+                while len(self._known) > self.max_known:
+                    self._known.popitem(last=False)
+        with self._lock:
+            self.offloaded += 1
+            self.offloaded_bytes += len(data)
+            if stored:
+                self.stored_bytes += stored
+            else:
+                self.deduplicated += 1
+        return {
+            'content': content[:self.preview_chars],
+            'contentRef': digest,
+            'contentLength': len(data)
+        }
+
+    def load(self, ref: str) -> str:
+        content = gzip.decompress(self.backend.get(ref)).decode("utf-8")
+        with self._lock:
+            self.loads += 1
+        return content
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "offloaded": self.offloaded,
+                "deduplicated": self.deduplicated,
+                "offloaded_bytes": self.offloaded_bytes,
+                "stored_bytes": self.stored_bytes,
+                "loads": self.loads
+            }
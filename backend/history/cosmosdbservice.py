@@ -1,13 +1,69 @@
+import json
+import logging
 import os
+import time
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from flask import Flask, request
+from azure.core import MatchConditions
 from azure.identity import DefaultAzureCredential  
 from azure.cosmos import CosmosClient, PartitionKey  
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosBatchOperationError, CosmosResourceNotFoundError
+
+from backend.history.request_stats import CosmosRequestStats
+
+## fields the history endpoints read; projecting them keeps the other Cosmos system properties and unused fields off the wire.
+## _etag is kept so a later rename or feedback can be made conditional on the version the client read
+CONVERSATION_FIELDS = "c.id, c.type, c.userId, c.title, c.createdAt, c.updatedAt, c._etag"
+MESSAGE_FIELDS = "c.id, c.role, c.content, c.contentRef, c.contentLength, c.createdAt, c.feedback, c._etag"
+## a transactional batch holds at most 100 operations
+BATCH_MAX_OPERATIONS = 100
+## message content is only ever read back, never filtered or sorted on, so indexing it only makes writes dearer;
+## the composite indexes serve the conversation list and message reads, which filter on the first paths and sort on the last
+INDEXING_POLICY = {
+    'indexingMode': 'consistent',
+    'automatic': True,
+    'includedPaths': [{'path': '/*'}],
+    'excludedPaths': [{'path': '/content/?'}, {'path': '/"_etag"/?'}],
+    'compositeIndexes': [
+        [{'path': '/userId', 'order': 'ascending'}, {'path': '/type', 'order': 'ascending'}, {'path': '/updatedAt', 'order': 'descending'}],
+        [{'path': '/conversationId', 'order': 'ascending'}, {'path': '/createdAt', 'order': 'ascending'}]
+    ]
+}
+INDEX_TRANSFORMATION_PROGRESS = 'x-ms-documentdb-collection-index-transformation-progress'
+## one item per user partition; conversations created up to its deletedBefore are hidden from every history read
+HISTORY_STATE_ID = 'history-state'
+
+
+class HistoryResetError(Exception):
+    """The user's whole history was deleted after the `since` a client asked for; it must reload the full list."""
+
+
+def indexing_policy_applied(policy: dict) -> bool:
+    """True when a container's indexing policy excludes and composite-indexes everything INDEXING_POLICY does."""
+    if not policy or policy.get('indexingMode', 'consistent').lower() != 'consistent':
+        return False
+    excluded = {path['path'] for path in policy.get('excludedPaths', [])}
+    composites = [[(path['path'], path.get('order', 'ascending')) for path in composite] for composite in policy.get('compositeIndexes', [])]
+    return (all(path['path'] in excluded for path in INDEXING_POLICY['excludedPaths'])
+            and all([(path['path'], path['order']) for path in composite] in composites for composite in INDEXING_POLICY['compositeIndexes']))
+
   
 class CosmosConversationClient():
+    ## set by ensure() once the composite indexes exist and are built; until then queries sort on one property
+    composite_indexes = False
+    indexing_policy_status = 'unknown'
+    ## until the indexes are built, queries re-check the index state at most this often
+    index_check_seconds = 300
+    _index_checked_at = None
+    cosmosdb_client = None
+    database_client = None
+    container_client = None
+    content_store = None
     
-    def __init__(self, cosmosdb_endpoint: str, credential: any, database_name: str, container_name: str, enable_message_feedback: bool = False):
+    def __init__(self, cosmosdb_endpoint: str, credential: any, database_name: str, container_name: str, enable_message_feedback: bool = False,
+                 deleted_ttl: int = 86400, bulk_concurrency: int = 4, content_store = None):
         self.cosmosdb_endpoint = cosmosdb_endpoint
         self.credential = credential
         self.database_name = database_name
@@ -16,26 +72,93 @@ class CosmosConversationClient():
         self.database_client = self.cosmosdb_client.get_database_client(database_name)
         self.container_client = self.database_client.get_container_client(container_name)
         self.enable_message_feedback = enable_message_feedback
+        self.deleted_ttl = deleted_ttl
+        self.bulk_concurrency = bulk_concurrency
+        self.content_store = content_store
+        self.request_stats = CosmosRequestStats()
+
+    def ensure(self, apply_indexing_policy = False):
+        """Check the container and whether it has INDEXING_POLICY, replacing its policy with it if asked.
 
-    def ensure(self):
+        Queries switch to the composite-index ORDER BY only once the policy is in place and Cosmos
+        reports the index transformation complete; `indexing_policy_status` is "applied",
+        "building" or "missing". Queries call it without `apply_indexing_policy` on their own,
+        at most every `index_check_seconds`, until the indexes are built.
+        """
         try:
             if not self.cosmosdb_client or not self.database_client or not self.container_client:
                 return False
             
-            container_info = self.container_client.read()
+            headers = {}
+            container_info = self.container_client.read(populate_quota_info=True, response_hook=lambda response_headers, _: headers.update(response_headers))
             if not container_info:
                 return False
-            
+
+            if 'defaultTtl' not in container_info:
+                logging.warning(f"Time to live is off on container {self.container_name}; deleted conversations stay stored as hidden tombstones")
+
+            if not indexing_policy_applied(container_info.get('indexingPolicy')):
+                if not apply_indexing_policy:
+                    logging.warning(f"Container {self.container_name} does not have the history indexing policy; set AZURE_COSMOSDB_APPLY_INDEXING_POLICY to apply it")
+                    self.composite_indexes = False
+                    self.indexing_policy_status = 'missing'
+                    return True
+                ## replacing a container is a full PUT: time to live and conflict resolution are passed back or they would be reset;
+                ## the partition key must match as provisioned, and a key without a version is a version 1 hash key
+                logging.info(f"Applying the history indexing policy to container {self.container_name}")
+                partition_key = container_info['partitionKey']
+                self.database_client.replace_container(
+                    self.container_name,
+                    partition_key=PartitionKey(path=partition_key['paths'][0], kind=partition_key.get('kind', 'Hash'), version=partition_key.get('version', 1)),
+                    indexing_policy=INDEXING_POLICY,
+                    default_ttl=container_info.get('defaultTtl'),
+                    conflict_resolution_policy=container_info.get('conflictResolutionPolicy')
+                )
+                headers = {}
+                container_info = self.container_client.read(populate_quota_info=True, response_hook=lambda response_headers, _: headers.update(response_headers))
+                if not indexing_policy_applied(container_info.get('indexingPolicy')):
+                    logging.error(f"The history indexing policy did not take effect on container {self.container_name}")
+                    self.composite_indexes = False
+                    self.indexing_policy_status = 'missing'
+                    return True
+
+            ## the new index is built in the background; a composite ORDER BY before it completes returns incomplete results
+            progress = int(headers.get(INDEX_TRANSFORMATION_PROGRESS, 100))
+            self.composite_indexes = progress >= 100
+            self.indexing_policy_status = 'applied' if self.composite_indexes else 'building'
             return True
         except:
+            logging.exception(f"Exception checking container {self.container_name}")
             return False
 
-    def create_conversation(self, user_id, title = ''):
+    def _use_composite_indexes(self):
+        ## checked lazily rather than at startup, so a policy still building at boot is picked up once it is built
+        if not self.composite_indexes and (self._index_checked_at is None or time.monotonic() - self._index_checked_at >= self.index_check_seconds):
+            ## stamped first, so concurrent requests do not all read the container
+            self._index_checked_at = time.monotonic()
+            self.ensure()
+        return self.composite_indexes
+
+    def _conversation_order(self, sort_order = 'DESC'):
+        ## a composite index only serves an ORDER BY that lists its paths, so the filtered properties are sorted on too
+        if not self._use_composite_indexes():
+            return f"order by c.updatedAt {sort_order}"
+        key_order = 'ASC' if sort_order.upper() == 'DESC' else 'DESC'
+        return f"order by c.userId {key_order}, c.type {key_order}, c.updatedAt {sort_order}"
+
+    def _message_order(self):
+        if not self._use_composite_indexes():
+            return "ORDER BY c.createdAt ASC"
+        return "ORDER BY c.conversationId ASC, c.createdAt ASC"
+
+    def create_conversation(self, user_id, title = '', conversation_id = None, created_at = None):
+        ## an id and timestamp chosen by the caller make a replayed create idempotent
+        created_at = created_at or datetime.utcnow().isoformat()
         conversation = {
-            'id': str(uuid.uuid4()),  
+            'id': conversation_id or str(uuid.uuid4()),  
             'type': 'conversation',
-            'createdAt': datetime.utcnow().isoformat(),  
-            'updatedAt': datetime.utcnow().isoformat(),  
+            'createdAt': created_at,  
+            'updatedAt': created_at,  
             'userId': user_id,
             'title': title
         }
@@ -54,24 +177,101 @@ class CosmosConversationClient():
             return False
 
     def delete_conversation(self, user_id, conversation_id):
-        conversation = self.container_client.read_item(item=conversation_id, partition_key=user_id)        
-        if conversation:
-            resp = self.container_client.delete_item(item=conversation_id, partition_key=user_id)
-            return resp
-        else:
-            return True
+        """Hide a conversation at once by marking it deleted; Cosmos expires it after `deleted_ttl` seconds.
+
+        Its messages are left for `delete_messages`, which the caller runs in the background.
+        Returns the marked conversation, or None when there is no such conversation.
+        """
+        return self._patch("delete_conversation", user_id, conversation_id, 'conversation', [
+            {'op': 'set', 'path': '/deleted', 'value': True},
+            {'op': 'set', 'path': '/ttl', 'value': self.deleted_ttl},
+            {'op': 'set', 'path': '/updatedAt', 'value': datetime.utcnow().isoformat()}
+        ])
+
+    def hide_conversations(self, user_id):
+        """Hide every conversation the user has created so far with a single write, however long the history.
+
+        Upserts the user's history state item with `deletedBefore` set to now; the history reads
+        drop conversations created up to then. `delete_conversations(user_id, deleted_before)`
+        then marks and expires them in the background. Returns `deletedBefore`.
+        """
+        deleted_before = datetime.utcnow().isoformat()
+        with self.request_stats.track("hide_conversations") as call:
+            self.container_client.upsert_item({'id': HISTORY_STATE_ID, 'type': 'historyState', 'userId': user_id,
+                                               'deletedBefore': deleted_before}, response_hook=call.hook)
+        return deleted_before
+
+    def get_deleted_before(self, user_id):
+        with self.request_stats.track("get_deleted_before") as call:
+            try:
+                state = self.container_client.read_item(item=HISTORY_STATE_ID, partition_key=user_id, response_hook=call.hook)
+            except CosmosResourceNotFoundError:
+                return None
+        return state.get('deletedBefore')
+
+    def delete_conversations(self, user_id, created_before = None):
+        """Mark every conversation of the user (created up to `created_before`, if given) deleted, up to 100 per transactional batch. Returns their ids."""
+        query = "SELECT c.id FROM c WHERE c.userId = @userId AND c.type='conversation' AND NOT IS_DEFINED(c.deleted)"
+        parameters = [{'name': '@userId', 'value': user_id}]
+        if created_before:
+            ## conversations started after a delete_all are not part of it
+            query += " AND c.createdAt <= @createdBefore"
+            parameters.append({'name': '@createdBefore', 'value': created_before})
+        conversation_ids = self._query_ids("delete_conversations", user_id, query, parameters)
+        deleted_at = datetime.utcnow().isoformat()
+        patch_operations = [
+            {'op': 'set', 'path': '/deleted', 'value': True},
+            {'op': 'set', 'path': '/ttl', 'value': self.deleted_ttl},
+            {'op': 'set', 'path': '/updatedAt', 'value': deleted_at}
+        ]
+        self._execute_in_batches("delete_conversations", user_id,
+                                 [("patch", (conversation_id, patch_operations)) for conversation_id in conversation_ids])
+        return conversation_ids
 
-        
     def delete_messages(self, conversation_id, user_id):
-        ## get a list of all the messages in the conversation
-        messages = self.get_messages(user_id, conversation_id)
-        response_list = []
-        if messages:
-            for message in messages:
-                resp = self.container_client.delete_item(item=message['id'], partition_key=user_id)
-                response_list.append(resp)
-            return response_list
+        """Delete all messages of a conversation with concurrent transactional batches. Returns the deleted ids."""
+        return self.delete_conversations_messages(user_id, [conversation_id])
+
+    def delete_conversations_messages(self, user_id, conversation_ids):
+        """Delete the messages of many conversations, finding them 100 conversations per query. Returns the deleted ids."""
+        message_ids = []
+        for start in range(0, len(conversation_ids), BATCH_MAX_OPERATIONS):
+            message_ids.extend(self._query_ids("delete_messages", user_id,
+                                               "SELECT c.id FROM c WHERE ARRAY_CONTAINS(@conversationIds, c.conversationId) AND c.type='message' AND c.userId = @userId",
+                                               [{'name': '@conversationIds', 'value': conversation_ids[start:start + BATCH_MAX_OPERATIONS]},
+                                                {'name': '@userId', 'value': user_id}]))
+        self._execute_in_batches("delete_messages", user_id, [("delete", (message_id,)) for message_id in message_ids])
+        return message_ids
+
+    def _query_ids(self, operation, user_id, query, parameters):
+        with self.request_stats.track(operation) as call:
+            return [item['id'] for item in self.container_client.query_items(query=query, parameters=parameters,
+                                                                             partition_key=user_id, response_hook=call.hook)]
 
+    def _execute_in_batches(self, operation, user_id, operations):
+        def execute(chunk):
+            with self.request_stats.track(operation) as call:
+                call.sent(chunk)
+                try:
+                    self.container_client.execute_item_batch(batch_operations=chunk, partition_key=user_id, response_hook=call.hook)
+                except CosmosBatchOperationError:
+                    ## one item removed in the meantime fails the whole batch; retry those items one by one
+                    for name, arguments in chunk:
+                        try:
+                            if name == "delete":
+                                self.container_client.delete_item(item=arguments[0], partition_key=user_id, response_hook=call.hook)
+                            else:
+                                self.container_client.patch_item(item=arguments[0], partition_key=user_id, patch_operations=arguments[1], response_hook=call.hook)
+                        except CosmosResourceNotFoundError:
+                            pass
+
+        chunks = [operations[start:start + BATCH_MAX_OPERATIONS] for start in range(0, len(operations), BATCH_MAX_OPERATIONS)]
+        if len(chunks) <= 1:
+            for chunk in chunks:
+                execute(chunk)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.bulk_concurrency, len(chunks)), thread_name_prefix="history-bulk") as executor:
+            list(executor.map(execute, chunks))
 
     def get_conversations(self, user_id, limit, sort_order = 'DESC', offset = 0):
         parameters = [
@@ -80,72 +280,178 @@ class CosmosConversationClient():
                 'value': user_id
             }
         ]
-        query = f"SELECT * FROM c where c.userId = @userId and c.type='conversation' order by c.updatedAt {sort_order}"
+        deleted_before = self.get_deleted_before(user_id)
+        query = f"SELECT {CONVERSATION_FIELDS} FROM c where c.userId = @userId and c.type='conversation' and NOT IS_DEFINED(c.deleted)"
+        if deleted_before:
+            query += " and c.createdAt > @deletedBefore"
+            parameters.append({'name': '@deletedBefore', 'value': deleted_before})
+        query += f" {self._conversation_order(sort_order)}"
         if limit is not None:
             query += f" offset {offset} limit {limit}" 
             
-        conversations = list(self.container_client.query_items(query=query, parameters=parameters,
-                                                                               enable_cross_partition_query =True))
+        with self.request_stats.track("get_conversations") as call:
+            conversations = list(self.container_client.query_items(query=query, parameters=parameters,
+                                                                   partition_key=user_id, response_hook=call.hook))
         ## if no conversations are found, return None
         if len(conversations) == 0:
             return []
         else:
             return conversations
 
-    def get_conversation(self, user_id, conversation_id):
+    def get_conversations_page(self, user_id, page_size, continuation_token=None, since=None):
+        """Return one page of the user's conversations, most recently updated first, and the next page's token.
+
+        A page costs the same at any depth because the query resumes from the token instead of
+        skipping an OFFSET. With `since` (an `updatedAt` value) only conversations updated after it
+        are returned, deleted ones included with `deleted` set so the client can drop them; if the
+        whole history was deleted after `since`, HistoryResetError is raised instead.
+        """
         parameters = [
-            {
-                'name': '@conversationId',
-                'value': conversation_id
-            },
             {
                 'name': '@userId',
                 'value': user_id
             }
         ]
-        query = f"SELECT * FROM c where c.id = @conversationId and c.type='conversation' and c.userId = @userId"
-        conversation = list(self.container_client.query_items(query=query, parameters=parameters,
-                                                                               enable_cross_partition_query =True))
-        ## if no conversations are found, return None
-        if len(conversation) == 0:
-            return None
+        deleted_before = self.get_deleted_before(user_id)
+        if since:
+            if deleted_before and deleted_before > since:
+                raise HistoryResetError(f"The history was deleted at {deleted_before}")
+            query = f"SELECT {CONVERSATION_FIELDS}, c.deleted FROM c where c.userId = @userId and c.type='conversation' and c.updatedAt > @since {self._conversation_order()}"
+            parameters.append({'name': '@since', 'value': since})
         else:
-            return conversation[0]
+            query = f"SELECT {CONVERSATION_FIELDS} FROM c where c.userId = @userId and c.type='conversation' and NOT IS_DEFINED(c.deleted)"
+            if deleted_before:
+                query += " and c.createdAt > @deletedBefore"
+                parameters.append({'name': '@deletedBefore', 'value': deleted_before})
+            query += f" {self._conversation_order()}"
+
+        with self.request_stats.track("get_conversations_page") as call:
+            pages = self.container_client.query_items(query=query, parameters=parameters, partition_key=user_id,
+                                                      max_item_count=page_size, response_hook=call.hook).by_page(continuation_token)
+            conversations = list(next(pages, []))
+        if since and deleted_before:
+            ## touched after an earlier delete_all, e.g. by a late queued write: still deleted for the client
+            for conversation in conversations:
+                if conversation['createdAt'] <= deleted_before:
+                    conversation['deleted'] = True
+        return conversations, pages.continuation_token
+
+    def get_conversation(self, user_id, conversation_id):
+        ## the conversation id and the partition key are both known, so this is a point read
+        with self.request_stats.track("get_conversation") as call:
+            try:
+                conversation = self.container_client.read_item(item=conversation_id, partition_key=user_id, response_hook=call.hook)
+            except CosmosResourceNotFoundError:
+                return None
+        ## messages share the container, so an id alone does not make a conversation
+        if conversation.get('type') != 'conversation' or conversation.get('deleted'):
+            return None
+        deleted_before = self.get_deleted_before(user_id)
+        if deleted_before and conversation['createdAt'] <= deleted_before:
+            return None
+        return conversation
  
     def create_message(self, uuid, conversation_id, user_id, input_message: dict):
-        message = {
-            'id': uuid,
-            'type': 'message',
-            'userId' : user_id,
-            'createdAt': datetime.utcnow().isoformat(),
-            'updatedAt': datetime.utcnow().isoformat(),
-            'conversationId' : conversation_id,
-            'role': input_message['role'],
-            'content': input_message['content']
-        }
+        return self.create_messages(conversation_id, user_id, [(uuid, input_message)])[0]
 
-        if self.enable_message_feedback:
-            message['feedback'] = ''
-        
-        resp = self.container_client.upsert_item(message)  
-        if resp:
-            ## update the parent conversations's updatedAt field with the current message's createdAt datetime value
-            conversation = self.get_conversation(user_id, conversation_id)
-            conversation['updatedAt'] = message['createdAt']
-            self.upsert_conversation(conversation)
-            return resp
-        else:
-            return False
+    def create_messages(self, conversation_id, user_id, input_messages: list, created_at = None):
+        """Append (id, message) pairs to a conversation and bump its updatedAt in one transactional batch.
+
+        All operations target the user's partition, so the messages and the conversation touch
+        commit or fail together in a single round trip. Messages are upserted by id and stamped
+        from `created_at` (an ISO timestamp, default now), so replaying the call is harmless.
+        With a `content_store`, large bodies are stored there first and the items keep a preview
+        and a `contentRef`; a body the store fails to take is kept inline. Returns the created
+        message documents.
+        """
+        now = datetime.fromisoformat(created_at) if created_at else datetime.utcnow()
+        operations = []
+        for position, (message_id, input_message) in enumerate(input_messages):
+            ## distinct timestamps keep the tool message before the assistant message
+            created_at = (now + timedelta(microseconds=position)).isoformat()
+            message = {
+                'id': message_id,
+                'type': 'message',
+                'userId' : user_id,
+                'createdAt': created_at,
+                'updatedAt': created_at,
+                'conversationId' : conversation_id,
+                'role': input_message['role'],
+                'content': input_message['content']
+            }
+            if self.content_store:
+                try:
+                    message.update(self.content_store.offload(input_message['content']) or {})
+                except Exception:
+                    ## a body the store did not take stays inline, so the message is never left as only its preview
+                    logging.exception(f"Exception offloading the content of message {message_id}, keeping it inline")
+            if self.enable_message_feedback:
+                message['feedback'] = ''
+            operations.append(("upsert", (message,)))
+
+        ## update the parent conversations's updatedAt field with the last message's createdAt datetime value
+        operations.append(("patch", (conversation_id, [{'op': 'set', 'path': '/updatedAt', 'value': created_at}])))
+
+        with self.request_stats.track("create_messages") as call:
+            call.sent(operations)
+            results = self.container_client.execute_item_batch(batch_operations=operations, partition_key=user_id, response_hook=call.hook)
+        return [result.get('resourceBody') for result in results[:-1]]
     
-    def update_message_feedback(self, user_id, message_id, feedback):
-        message = self.container_client.read_item(item=message_id, partition_key=user_id)
+    def _patch(self, operation, user_id, item_id, item_type, patch_operations, etag=None, condition=None):
+        """Apply partial-document patch operations to one item of `item_type` in the user's partition.
+
+        Only the operations travel over the wire and the item is neither read nor rewritten by
+        the client. With `etag` the patch only applies if the item is unchanged since it was read
+        and CosmosAccessConditionFailedError is raised otherwise. Returns the patched document,
+        or None when the item does not exist, is of another type, was deleted or fails `condition`
+        (an extra filter predicate clause).
+        """
+        conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified} if etag else {}
+        with self.request_stats.track(operation) as call:
+            call.sent(patch_operations)
+            try:
+                return self.container_client.patch_item(item=item_id, partition_key=user_id, patch_operations=patch_operations,
+                                                        filter_predicate=f"FROM c WHERE c.type = '{item_type}' AND NOT IS_DEFINED(c.deleted)"
+                                                                         + (f" AND {condition}" if condition else ""),
+                                                        response_hook=call.hook, **conditions)
+            except CosmosResourceNotFoundError:
+                return None
+            except CosmosAccessConditionFailedError:
+                ## without an etag the only precondition is the filter
+                if etag:
+                    raise
+                return None
+
+    def rename_conversation(self, user_id, conversation_id, title, etag=None, expected_title=None):
+        ## expected_title only replaces a title nobody changed since, e.g. a generated title over the provisional one
+        condition = f"c.title = {json.dumps(expected_title)}" if expected_title is not None else None
+        return self._patch("rename_conversation", user_id, conversation_id, 'conversation',
+                           [{'op': 'set', 'path': '/title', 'value': title}], etag, condition)
+
+    def update_message_feedback(self, user_id, message_id, feedback, etag=None):
+        message = self._patch("update_message_feedback", user_id, message_id, 'message',
+                              [{'op': 'set', 'path': '/feedback', 'value': feedback}], etag)
         if message:
-            message['feedback'] = feedback
-            resp = self.container_client.upsert_item(message)
-            return resp
+            return message
         else:
             return False
 
+    def get_message(self, user_id, message_id):
+        with self.request_stats.track("get_message") as call:
+            try:
+                message = self.container_client.read_item(item=message_id, partition_key=user_id, response_hook=call.hook)
+            except CosmosResourceNotFoundError:
+                return None
+        if message.get('type') != 'message':
+            return None
+        return message
+
+    def get_message_content(self, message):
+        ## the full body of a message whose content was offloaded, or the content it holds
+        if message.get('contentRef') and self.content_store:
+            return self.content_store.load(message['contentRef'])
+        return message['content']
+
     def get_messages(self, user_id, conversation_id):
         parameters = [
             {
@@ -157,12 +463,12 @@ class CosmosConversationClient():
                 'value': user_id
             }
         ]
-        query = f"SELECT * FROM c WHERE c.conversationId = @conversationId AND c.type='message' AND c.userId = @userId ORDER BY c.timestamp ASC"
-        messages = list(self.container_client.query_items(query=query, parameters=parameters,
-                                                                     enable_cross_partition_query =True))
+        query = f"SELECT {MESSAGE_FIELDS} FROM c WHERE c.conversationId = @conversationId AND c.type='message' AND c.userId = @userId {self._message_order()}"
+        with self.request_stats.track("get_messages") as call:
+            messages = list(self.container_client.query_items(query=query, parameters=parameters,
+                                                              partition_key=user_id, response_hook=call.hook))
         ## if no messages are found, return false
         if len(messages) == 0:
             return []
         else:
             return messages
-
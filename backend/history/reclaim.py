@@ -0,0 +1,47 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class HistoryReclaimer():
+    """Runs history clean-up in the background so delete endpoints return immediately.
+
+    Conversations are hidden before a job is submitted, by a logical delete or, for a whole
+    history, by the user's `deletedBefore` marker; the job only reclaims storage, so a job lost
+    to a restart leaves hidden or orphaned items but no visible history.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history-reclaim")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, description: str, job: Callable, *args):
+        with self._lock:
+            self.pending += 1
+        return self.executor.submit(self._run, description, job, *args)
+
+    def _run(self, description: str, job: Callable, *args):
+        try:
+            result = job(*args)
+            with self._lock:
+                self.completed += 1
+            return result
+        except Exception:
+            logging.exception(f"Exception reclaiming {description}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed
+            }
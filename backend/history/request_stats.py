@@ -0,0 +1,83 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from azure.core.paging import ItemPaged
+
+
+class CosmosCall():
+    """Round trips, request units (RU) and request payload of one history operation.
+
+    `hook` is passed as `response_hook` to every SDK call the operation makes; the SDK invokes
+    it once per HTTP response, so paged queries count one round trip per page. Writes report
+    the body they send with `sent`.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.round_trips = 0
+        self.request_charge = 0.0
+        self.elapsed_ms = 0.0
+        self.request_bytes = 0
+
+    def sent(self, body):
+        self.request_bytes += len(json.dumps(body))
+
+    def hook(self, headers, result):
+        ## query_items also calls the hook once up front with the previous response's headers
+        if isinstance(result, ItemPaged):
+            return
+        self.round_trips += 1
+        self.request_charge += float(headers.get("x-ms-request-charge", 0) or 0)
+
+    def as_dict(self) -> dict:
+        return {
+            "operation": self.operation,
+            "round_trips": self.round_trips,
+            "request_charge": round(self.request_charge, 2),
+            "request_bytes": self.request_bytes,
+            "elapsed_ms": round(self.elapsed_ms, 2)
+        }
+
+
+class CosmosRequestStats():
+    """Per-operation totals of round trips, RU, payload and latency for /stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    @contextmanager
+    def track(self, operation: str):
+        call = CosmosCall(operation)
+        start = time.perf_counter()
+        try:
+            yield call
+        finally:
+            call.elapsed_ms = (time.perf_counter() - start) * 1000
+            self.record(call)
+            logging.debug(f"Cosmos {operation}: {call.round_trips} round trip(s), {call.request_charge:.2f} RU, {call.request_bytes} bytes sent, {call.elapsed_ms:.1f} ms")
+
+    def record(self, call: CosmosCall):
+        with self._lock:
+            totals = self._operations.setdefault(call.operation, {"calls": 0, "round_trips": 0, "request_charge": 0.0, "request_bytes": 0, "elapsed_ms": 0.0})
+            totals["calls"] += 1
+            totals["round_trips"] += call.round_trips
+            totals["request_charge"] += call.request_charge
+            totals["request_bytes"] += call.request_bytes
+            totals["elapsed_ms"] += call.elapsed_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                operation: {
+                    "calls": totals["calls"],
+                    "round_trips_per_call": round(totals["round_trips"] / totals["calls"], 2),
+                    "request_charge_per_call": round(totals["request_charge"] / totals["calls"], 2),
+                    "request_bytes_per_call": round(totals["request_bytes"] / totals["calls"]),
+                    "elapsed_ms_per_call": round(totals["elapsed_ms"] / totals["calls"], 2)
+                }
+                for operation, totals in self._operations.items()
+            }
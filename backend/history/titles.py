@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Union
+
+TITLE_MAX_WORDS = 6
+TITLE_MAX_CHARS = 60
+UNTITLED = "New conversation"
+MARKUP = re.compile(r"[\"'`*#_>\[\](){}]")
+
+
+def _clip(words: List[str]) -> str:
+    title = " ".join(words[:TITLE_MAX_WORDS]).rstrip(".,;:!?")
+    if len(title) > TITLE_MAX_CHARS:
+        title = title[:TITLE_MAX_CHARS - 3].rstrip() + "..."
+    return title
+
+
+def selected_names(selected_items: Optional[Union[str, list]]) -> List[str]:
+    """The file names, without folder and extension, of the agreements selected for a conversation."""
+    if isinstance(selected_items, str):
+        selected_items = selected_items.split(",")
+    names = [os.path.splitext(os.path.basename(item.strip()))[0] for item in selected_items or []]
+    return [name for name in names if name]
+
+
+def heuristic_title(messages: List[dict], selected_items: Optional[Union[str, list]] = None) -> str:
+    """Title a new conversation without a model call, from the selected agreement or the first user message."""
+    ## the selected agreement names the conversation better than a generic request to validate it
+    for name in selected_names(selected_items):
+        words = re.sub(r"[_\-]+", " ", name).split()
+        if words:
+            return _clip(words)
+
+    content = next((message.get('content') or '' for message in messages if message.get('role') == 'user'), '')
+    words = MARKUP.sub(" ", content).split()
+    return _clip(words) if words else UNTITLED
+
+
+class TitleGenerator():
+    """Generates conversation titles with a model in the background and caches them by opening request.
+
+    `generate(messages, names)` returns a title or None, where `names` are the selected agreements
+    (see `selected_names`); `submit` calls `on_title` with the title once it is known.
+    Conversations opened with the same first message about the same agreements reuse the cached
+    title without a model call; the same request about another agreement gets its own title.
+    """
+
+    def __init__(self, generate: Callable[[List[dict], List[str]], Optional[str]], max_workers: int = 2, max_entries: int = 1024):
+        self.generate = generate
+        self.max_entries = max_entries
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conversation-title")
+        self._titles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.generated = 0
+        self.failed = 0
+
+    @staticmethod
+    def make_key(messages: List[dict], names: Optional[List[str]] = None) -> str:
+        content = " ".join(" ".join((message.get('content') or '').lower().split()) for message in messages if message.get('role') == 'user')
+        ## "validate this NDA" about different agreements must not share a title
+        content += "\n" + "\n".join(sorted(name.lower() for name in names or []))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def submit(self, messages: List[dict], on_title: Callable[[str], None], selected_items: Optional[Union[str, list]] = None) -> Future:
+        return self.executor.submit(self._title, messages, on_title, selected_names(selected_items))
+
+    def _title(self, messages: List[dict], on_title: Callable[[str], None], names: List[str]):
+        key = self.make_key(messages, names)
+        with self._lock:
+            title = self._titles.get(key)
+            if title is not None:
+                self._titles.move_to_end(key)
+                self.hits += 1
+        if title is None:
+            try:
+                title = self.generate(messages, names)
+            except Exception:
+                logging.exception("Exception generating conversation title")
+                title = None
+            with self._lock:
+                if not title:
+                    self.failed += 1
+                    return None
+                self.generated += 1
+                self._titles[key] = title
+                while len(self._titles) > self.max_entries:
+                    self._titles.popitem(last=False)
+        try:
+            on_title(title)
+        except Exception:
+            logging.exception("Exception storing conversation title")
+        return title
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached": len(self._titles),
+                "hits": self.hits,
+                "generated": self.generated,
+                "failed": self.failed
+            }
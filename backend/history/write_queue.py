@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+
+class HistoryWriteQueue():
+    """Durable write-behind spool for chat history writes, flushed to Cosmos by a background thread.
+
+    `enqueue` commits the write to a SQLite file in WAL mode and returns; the flusher replays
+    writes oldest first through `handlers[kind](user_id, payload)`. A write is removed only after
+    its handler succeeded, so delivery is at least once and handlers must be idempotent (the
+    payload carries the item ids and timestamps). The writes of one user are applied in order:
+    after a failure the user's later writes wait for the retry, which backs off exponentially
+    up to `max_retry_delay` seconds. After `max_attempts` failures a write is kept as a dead
+    letter and the user's next writes proceed. Writes of different users are flushed
+    `flush_concurrency` at a time. Several processes can share the file; claimed
+    writes are leased for `lease_seconds`, so writes of a process that died are taken over.
+    """
+
+    def __init__(self, path: str, handlers: Dict[str, Callable[[str, dict], object]], max_attempts: int = 8,
+                 retry_delay: float = 1.0, max_retry_delay: float = 300.0, lease_seconds: float = 60.0,
+                 poll_interval: float = 1.0, claim_limit: int = 100, flush_concurrency: int = 4):
+        self.path = path
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.claim_limit = claim_limit
+        self.executor = ThreadPoolExecutor(max_workers=flush_concurrency, thread_name_prefix="history-flush")
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS history_writes ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, user_id TEXT NOT NULL, payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, "
+            "leased_by TEXT, lease_until REAL NOT NULL DEFAULT 0, dead INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS history_writes_pending ON history_writes (dead, seq)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS history_writes_user ON history_writes (user_id, dead)")
+        self.flushed = 0
+        self.retries = 0
+        self.dead_letters = 0
+        self.last_lag_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="history-write-behind", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, kind: str, user_id: str, payload: dict):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown history write {kind}")
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO history_writes (kind, user_id, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (kind, user_id, json.dumps(payload), time.time())
+            )
+        self._wake.set()
+
+    def _claim(self) -> List[tuple]:
+        ## choose, in one write transaction, the oldest writes whose user has nothing earlier in flight or waiting
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT seq, kind, user_id, payload, enqueued_at, attempts, next_attempt_at, lease_until "
+                    "FROM history_writes WHERE dead = 0 ORDER BY seq LIMIT ?", (self.claim_limit * 4,)
+                ).fetchall()
+                blocked = set()
+                claimed = []
+                for seq, kind, user_id, payload, enqueued_at, attempts, next_attempt_at, lease_until in rows:
+                    if user_id in blocked:
+                        continue
+                    if lease_until > now or next_attempt_at > now:
+                        blocked.add(user_id)
+                        continue
+                    claimed.append((seq, kind, user_id, payload, enqueued_at, attempts))
+                    if len(claimed) == self.claim_limit:
+                        break
+                self._connection.executemany(
+                    "UPDATE history_writes SET leased_by = ?, lease_until = ? WHERE seq = ?",
+                    [(self.owner, now + self.lease_seconds, row[0]) for row in claimed]
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def _apply(self, claimed: List[tuple]):
+        by_user = {}
+        for row in claimed:
+            by_user.setdefault(row[2], []).append(row)
+        list(self.executor.map(self._apply_user, by_user.values()))
+
+    def _apply_user(self, rows: List[tuple]):
+        for position, (seq, kind, user_id, payload, enqueued_at, attempts) in enumerate(rows):
+            try:
+                self.handlers[kind](user_id, json.loads(payload))
+            except Exception as e:
+                self._failed(seq, kind, attempts + 1, e)
+                ## keep the user's order: release the later writes for the next round
+                with self._lock:
+                    self._connection.executemany("UPDATE history_writes SET lease_until = 0 WHERE seq = ?", [(row[0],) for row in rows[position + 1:]])
+                return
+            with self._lock:
+                self._connection.execute("DELETE FROM history_writes WHERE seq = ?", (seq,))
+                self.flushed += 1
+                self.last_lag_ms = (time.time() - enqueued_at) * 1000
+
+    def _failed(self, seq: int, kind: str, attempts: int, error: Exception):
+        with self._lock:
+            if attempts >= self.max_attempts:
+                logging.error(f"History write {seq} ({kind}) failed {attempts} times, keeping it as a dead letter: {error}")
+                self._connection.execute("UPDATE history_writes SET attempts = ?, dead = 1, lease_until = 0, last_error = ? WHERE seq = ?",
+                                         (attempts, str(error), seq))
+                self.dead_letters += 1
+                return
+            delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+            logging.warning(f"History write {seq} ({kind}) failed, retrying in {delay:.0f} s: {error}")
+            self._connection.execute("UPDATE history_writes SET attempts = ?, next_attempt_at = ?, lease_until = 0, last_error = ? WHERE seq = ?",
+                                     (attempts, time.time() + delay, str(error), seq))
+            self.retries += 1
+
+    def _run(self):
+        while not self._stopped.is_set():
+            ## cleared before claiming, so a write enqueued meanwhile is not left waiting for the poll
+            self._wake.clear()
+            try:
+                claimed = self._claim()
+                if claimed:
+                    self._apply(claimed)
+                    continue
+            except Exception:
+                logging.exception("Exception flushing history writes")
+            self._wake.wait(self.poll_interval)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until no write is pending (dead letters aside); returns False on timeout."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.stats()["depth"] == 0:
+                return True
+            self._wake.set()
+            time.sleep(0.01)
+        return False
+
+    def pending(self, user_id: str) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM history_writes WHERE user_id = ? AND dead = 0", (user_id,)).fetchone()[0]
+
+    def flush_user(self, user_id: str, timeout: float = 5.0) -> bool:
+        """Wait until no write of `user_id` is pending, retrying a backed-off write now; returns False on timeout.
+
+        Lets a read or an update of the user's history see the writes the user just made.
+        """
+        if not self.pending(user_id):
+            return True
+        with self._lock:
+            self._connection.execute("UPDATE history_writes SET next_attempt_at = 0 WHERE user_id = ? AND dead = 0", (user_id,))
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self._wake.set()
+            time.sleep(0.01)
+            if not self.pending(user_id):
+                return True
+        return False
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self.executor.shutdown()
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            depth, oldest = self._connection.execute("SELECT COUNT(*), MIN(enqueued_at) FROM history_writes WHERE dead = 0").fetchone()
+            dead = self._connection.execute("SELECT COUNT(*) FROM history_writes WHERE dead = 1").fetchone()[0]
+        return {
+            "depth": depth,
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "dead_letters": dead,
+            "flushed": self.flushed,
+            "retries": self.retries,
+            "last_flush_lag_ms": round(self.last_lag_ms, 2)
+        }
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Optional
+
+
+@dataclass(frozen=True)
+class Deployment():
+    """Connection settings for one Azure OpenAI model deployment."""
+    name: str
+    model: Optional[str]
+    model_name: Optional[str]
+    key: Optional[str]
+    resource: Optional[str] = None
+    endpoint: Optional[str] = None
+
+    @property
+    def base_url(self) -> str:
+        return self.endpoint if self.endpoint else f"https://{self.resource}.openai.azure.com/"
+
+    def openai_kwargs(self, api_version: str) -> dict:
+        ## per-call credentials for openai.ChatCompletion.create, so the module-level openai
+        ## settings are never touched while serving a request
+        return {
+            "engine": self.model,
+            "api_type": "azure",
+            "api_base": self.base_url,
+            "api_version": api_version,
+            "api_key": self.key
+        }
+
+
+class DeploymentRegistry():
+    """Immutable set of deployments built once at startup and resolved per request."""
+
+    def __init__(self, deployments: Iterable[Deployment], default: str):
+        self._deployments = MappingProxyType({deployment.name: deployment for deployment in deployments})
+        if default not in self._deployments:
+            raise ValueError(f"Default deployment {default} is not registered")
+        self.default = default
+
+    def resolve(self, name: Optional[str]) -> Deployment:
+        return self._deployments.get(name, self._deployments[self.default])
+
+    def get(self, name: str) -> Optional[Deployment]:
+        return self._deployments.get(name)
+
+    def names(self) -> list:
+        return list(self._deployments.keys())
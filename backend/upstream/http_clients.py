@@ -0,0 +1,85 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpClientRegistry():
+    """Process-wide registry of pooled, keep-alive HTTP sessions, one per upstream host.
+
+    Every call site that talks to Azure OpenAI, Azure Cognitive Search or Microsoft Graph goes
+    through the session for its host, so TCP and TLS connections are reused across chat turns
+    instead of being opened for every request.
+    """
+
+    def __init__(self, pool_maxsize: int = 10, connect_timeout: float = 10, read_timeout: float = 230):
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.pool_hits = 0
+        self.pool_misses = 0
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_session(self, url: str) -> requests.Session:
+        key = self._host_key(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                self.pool_misses += 1
+                session = self._new_session()
+                self._sessions[key] = session
+            else:
+                self.pool_hits += 1
+            return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        return self.get_session(url).request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        hosts = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for key, session in sessions:
+            connections_opened = 0
+            requests_sent = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    pool = pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    connections_opened += pool.num_connections
+                    requests_sent += pool.num_requests
+            hosts[key] = {
+                "connections_opened": connections_opened,
+                "requests": requests_sent,
+                "connections_reused": max(requests_sent - connections_opened, 0)
+            }
+
+        return {
+            "pool_hits": self.pool_hits,
+            "pool_misses": self.pool_misses,
+            "pool_maxsize": self.pool_maxsize,
+            "hosts": hosts
+        }
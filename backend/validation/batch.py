@@ -0,0 +1,80 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class DeploymentConcurrencyLimiter():
+    """Process-wide cap on concurrent batch validations per model deployment."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, deployment_name: str):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(deployment_name, threading.BoundedSemaphore(self.limit))
+        with semaphore:
+            yield
+
+
+def run_batch(documents: List[str], validate: Callable[[str], dict], limiter: DeploymentConcurrencyLimiter, deployment_name: str) -> Iterator[dict]:
+    """Validate documents concurrently and yield one result per document as it completes.
+
+    The last item is a summary with throughput and per-document latency percentiles. Closing
+    the generator early, e.g. when the client disconnects, cancels the validations that have
+    not started; the ones in flight finish in the background.
+    """
+    def timed(document):
+        with limiter.slot(deployment_name):
+            start = time.perf_counter()
+            try:
+                result = validate(document)
+            except Exception as e:
+                result = {"error": str(e)}
+            result["document"] = document
+            result["latency_s"] = round(time.perf_counter() - start, 3)
+            return result
+
+    start = time.perf_counter()
+    latencies = []
+    failed = 0
+    executor = ThreadPoolExecutor(max_workers=max(min(limiter.limit, len(documents)), 1))
+    futures = [executor.submit(timed, document) for document in documents]
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            latencies.append(result["latency_s"])
+            if "error" in result:
+                failed += 1
+            yield result
+    finally:
+        ## nothing left to wait for after a normal finish; after an early close this drops the queued documents
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    yield {
+        "summary": {
+            "documents": len(documents),
+            "failed": failed,
+            "elapsed_s": round(elapsed, 3),
+            "documents_per_s": round(len(documents) / elapsed, 3) if elapsed else 0.0,
+            "latency_p50_s": percentile(latencies, 50),
+            "latency_p90_s": percentile(latencies, 90),
+            "latency_p99_s": percentile(latencies, 99),
+            "deployment": deployment_name,
+            "concurrency": limiter.limit
+        }
+    }
@@ -0,0 +1,197 @@
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from backend.validation.clauses import Clause, align_clauses
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+TERM = re.compile(r"[a-z0-9]+")
+# TF-IDF cosine below which an agreement clause counts as having no template counterpart
+MIN_COSINE_SIMILARITY = 0.3
+
+
+def _term_matrix(rows: List[int], columns: List[int], shape: Tuple[int, int]):
+    ## sublinear term frequency keeps long boilerplate from dominating; sparse with scipy, dense numpy otherwise
+    if sparse is not None:
+        matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape)
+        matrix.sum_duplicates()
+        matrix.data = np.log1p(matrix.data)
+        return matrix
+    flat = np.asarray(rows, dtype=np.int64) * shape[1] + np.asarray(columns, dtype=np.int64)
+    return np.log1p(np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape).astype(np.float32))
+
+
+def _scale_columns(matrix, weights):
+    if sparse is not None:
+        return sparse.csr_matrix(matrix.multiply(weights[None, :]))
+    return matrix * weights
+
+
+def _scale_rows(matrix, weights):
+    if sparse is not None:
+        return sparse.csr_matrix(matrix.multiply(weights[:, None]))
+    return matrix * weights[:, None]
+
+
+def _squared_row_norms(matrix):
+    if sparse is not None:
+        return np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+    return (matrix ** 2).sum(axis=1)
+
+
+def _document_frequency(matrix, width: int):
+    if sparse is not None:
+        return np.bincount(matrix.indices, minlength=width)
+    return (matrix > 0).sum(axis=0)
+
+
+class TemplateClauseIndex():
+    """TF-IDF matrix of the clauses of one template, built once and reused for every agreement.
+
+    The vocabulary is the template's; agreement terms the template never uses only add to the
+    agreement clause's norm, which is all they can contribute to a cosine with template clauses.
+    The matrices are scipy sparse when scipy is installed and dense numpy arrays otherwise.
+    """
+
+    def __init__(self, clauses: List[Clause]):
+        self.clauses = clauses
+        self.by_digest = {}
+        for clause in clauses:
+            self.by_digest.setdefault(clause.digest, clause)
+
+        self.vocabulary = {}
+        rows, columns = [], []
+        for row, clause in enumerate(clauses):
+            for term in TERM.findall(clause.normalized):
+                rows.append(row)
+                columns.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+
+        width = len(self.vocabulary)
+        frequencies = _term_matrix(rows, columns, (len(clauses), width))
+        ## smoothed idf as in scikit-learn; unseen terms get the weight of a term used in no clause
+        self.idf = (np.log((1 + len(clauses)) / (1 + _document_frequency(frequencies, width))) + 1).astype(np.float32)
+        self.unseen_idf = float(np.log(1 + len(clauses))) + 1
+        weights = _scale_columns(frequencies, self.idf)
+        norms = np.sqrt(_squared_row_norms(weights))
+        self.matrix = _scale_rows(weights, 1 / np.where(norms == 0, 1, norms)).T
+
+    def align(self, agreement_clauses: List[Clause]) -> List[Tuple[Optional[Clause], float]]:
+        """Return (template clause or None, cosine similarity) for every agreement clause."""
+        if not agreement_clauses or not self.clauses:
+            return [(None, 0.0)] * len(agreement_clauses)
+
+        rows, columns = [], []
+        unseen = np.zeros(len(agreement_clauses), dtype=np.float32)
+        for row, clause in enumerate(agreement_clauses):
+            unseen_counts = {}
+            for term in TERM.findall(clause.normalized):
+                column = self.vocabulary.get(term)
+                if column is None:
+                    unseen_counts[term] = unseen_counts.get(term, 0) + 1
+                else:
+                    rows.append(row)
+                    columns.append(column)
+            unseen[row] = sum((math.log1p(count) * self.unseen_idf) ** 2 for count in unseen_counts.values())
+
+        weights = _scale_columns(_term_matrix(rows, columns, (len(agreement_clauses), len(self.vocabulary))), self.idf)
+        norms = np.sqrt(_squared_row_norms(weights) + unseen)
+        similarity = weights @ self.matrix
+        if sparse is not None:
+            similarity = similarity.toarray()
+        similarity /= np.where(norms == 0, 1, norms)[:, None]
+        best = similarity.argmax(axis=1)
+        scores = similarity[np.arange(len(agreement_clauses)), best]
+
+        aligned = []
+        for clause, column, score in zip(agreement_clauses, best.tolist(), scores.tolist()):
+            if clause.digest in self.by_digest:
+                aligned.append((self.by_digest[clause.digest], 1.0))
+            elif score >= MIN_COSINE_SIMILARITY:
+                aligned.append((self.clauses[column], round(score, 4)))
+            else:
+                aligned.append((None, round(score, 4)))
+        return aligned
+
+
+class TemplateIndexCache():
+    """LRU of template clause indexes keyed by the template blob ETag."""
+
+    def __init__(self, max_templates: int = 32):
+        self.max_templates = max_templates
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag: str, build: Callable[[], TemplateClauseIndex]) -> TemplateClauseIndex:
+        with self._lock:
+            index = self._indexes.get(etag)
+            if index is not None:
+                self._indexes.move_to_end(etag)
+                self.hits += 1
+                return index
+            self.misses += 1
+        index = build()
+        with self._lock:
+            self._indexes[etag] = index
+            self._indexes.move_to_end(etag)
+            while len(self._indexes) > self.max_templates:
+                self._indexes.popitem(last=False)
+        return index
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "templates": len(self._indexes),
+                "max_templates": self.max_templates,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+def build_template_index(clauses: List[Clause]) -> Optional[TemplateClauseIndex]:
+    if np is None:
+        return None
+    return TemplateClauseIndex(clauses)
+
+
+def align(template_clauses: List[Clause], agreement_clauses: List[Clause], index: Optional[TemplateClauseIndex] = None) -> List[Tuple[Optional[Clause], Optional[float]]]:
+    """Align agreement clauses with template clauses, vectorized when numpy is available.
+
+    Without numpy the pairwise word-overlap alignment is used and no similarity is reported.
+    """
+    if index is None and np is not None:
+        index = TemplateClauseIndex(template_clauses)
+    if index is not None:
+        return index.align(agreement_clauses)
+    logging.debug("numpy unavailable, aligning clauses pairwise")
+    return [(clause, None) for clause in align_clauses(template_clauses, agreement_clauses)]
+
+
+def _title(clause: Clause) -> str:
+    title = clause.heading or clause.text.splitlines()[0]
+    return title if len(title) <= 60 else title[:57] + "..."
+
+
+def format_alignment(agreement_clauses: List[Clause], aligned: List[Tuple[Optional[Clause], Optional[float]]]) -> str:
+    """One line per agreement clause naming its template counterpart, for the model's context."""
+    lines = ["Clause alignment of the third party NDA to the template:"]
+    for clause, (template_clause, similarity) in zip(agreement_clauses, aligned):
+        if template_clause is None:
+            lines.append(f"- {clause.index + 1}. {_title(clause)} -> no template counterpart")
+        else:
+            score = f" (similarity {similarity:.2f})" if similarity is not None else ""
+            lines.append(f"- {clause.index + 1}. {_title(clause)} -> template {template_clause.index + 1}. {_title(template_clause)}{score}")
+    return "\n".join(lines)
@@ -0,0 +1,228 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend.validation.batch import DeploymentConcurrencyLimiter
+from backend.validation.clause_alignment import TemplateClauseIndex, align
+from backend.validation.clauses import Clause, split_clauses
+
+NO_TEMPLATE_CLAUSE = ""
+
+
+class ClauseVerdictCache():
+    """Persistent SQLite store of per-clause verdicts shared by all agreements.
+
+    A verdict is keyed by the digest of the normalized agreement clause, the digest of the
+    template clause it was judged against and the prompt version, so boilerplate reused word
+    for word by another counterparty is judged once. Least recently used verdicts are evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS clause_verdicts ("
+            "clause_digest TEXT NOT NULL, template_digest TEXT NOT NULL, prompt_version TEXT NOT NULL, "
+            "verdict TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL, "
+            "PRIMARY KEY (clause_digest, template_digest, prompt_version))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS clause_verdicts_last_used_at ON clause_verdicts (last_used_at)")
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: List[Tuple[str, str]], prompt_version: str) -> Dict[Tuple[str, str], dict]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for clause_digest, template_digest in set(keys):
+                row = self._connection.execute(
+                    "SELECT verdict FROM clause_verdicts WHERE clause_digest = ? AND template_digest = ? AND prompt_version = ?",
+                    (clause_digest, template_digest, prompt_version)
+                ).fetchone()
+                if row is not None:
+                    found[(clause_digest, template_digest)] = json.loads(row[0])
+            if found:
+                self._connection.executemany(
+                    "UPDATE clause_verdicts SET last_used_at = ? WHERE clause_digest = ? AND template_digest = ? AND prompt_version = ?",
+                    [(now, clause_digest, template_digest, prompt_version) for clause_digest, template_digest in found]
+                )
+                self._connection.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, verdicts: Dict[Tuple[str, str], dict], prompt_version: str):
+        if not verdicts:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO clause_verdicts (clause_digest, template_digest, prompt_version, verdict, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(clause_digest, template_digest, prompt_version, json.dumps(verdict), now, now)
+                 for (clause_digest, template_digest), verdict in verdicts.items()]
+            )
+            excess = self._connection.execute("SELECT COUNT(*) FROM clause_verdicts").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM clause_verdicts WHERE rowid IN (SELECT rowid FROM clause_verdicts ORDER BY last_used_at LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM clause_verdicts").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def iter_clause_verdicts(
+    template_text: str,
+    agreement_text: str,
+    judge: Callable[[List[Tuple[Clause, Optional[Clause]]]], Dict[int, dict]],
+    cache: Optional[ClauseVerdictCache],
+    prompt_version: str,
+    batch_size: int = 8,
+    template_index: Optional[TemplateClauseIndex] = None,
+    concurrency: int = 1,
+    limiter: Optional[DeploymentConcurrencyLimiter] = None,
+    deployment_name: str = ""
+) -> Iterator[dict]:
+    """Judge every agreement clause against its template clause, reusing cached verdicts.
+
+    `judge` receives a list of (agreement clause, template clause or None) pairs and returns
+    verdicts keyed by agreement clause index; only clauses without a cached verdict are sent,
+    in groups of `batch_size` judged `concurrency` at a time. Yields `{"clause": ...}` for
+    every clause as soon as its verdict is known (cached ones first) and a final
+    `{"report": ...}` with all clauses in document order. Verdicts missing from the judge's
+    answer are reported as errors and not cached.
+    """
+    template_clauses = template_index.clauses if template_index else split_clauses(template_text)
+    agreement_clauses = split_clauses(agreement_text)
+    aligned = [template_clause for template_clause, _ in align(template_clauses, agreement_clauses, template_index)]
+    keys = [(clause.digest, template_clause.digest if template_clause else NO_TEMPLATE_CLAUSE)
+            for clause, template_clause in zip(agreement_clauses, aligned)]
+
+    def entry(clause, template_clause, verdict):
+        return dict(
+            verdict,
+            index=clause.index,
+            heading=clause.heading,
+            text=clause.text,
+            template_heading=template_clause.heading if template_clause else None,
+            template_index=template_clause.index if template_clause else None
+        )
+
+    cached = cache.get_many(keys, prompt_version) if cache else {}
+    entries = {}
+    novel = []
+    clauses_by_key = {}
+    for clause, template_clause, key in zip(agreement_clauses, aligned, keys):
+        if key in cached:
+            entries[clause.index] = entry(clause, template_clause, dict(cached[key], cached=True))
+            yield {"clause": entries[clause.index]}
+            continue
+        if key not in clauses_by_key:
+            ## the same boilerplate repeated inside one agreement is judged once
+            clauses_by_key[key] = []
+            novel.append((clause, template_clause))
+        clauses_by_key[key].append((clause, template_clause))
+    hits = len(entries)
+
+    def judge_group(group):
+        if limiter is None:
+            return judge(group)
+        with limiter.slot(deployment_name):
+            return judge(group)
+
+    size = max(batch_size, 1)
+    groups = [novel[start:start + size] for start in range(0, len(novel), size)]
+    with ThreadPoolExecutor(max_workers=max(min(concurrency, len(groups)), 1), thread_name_prefix="clause-validation") as executor:
+        futures = {executor.submit(judge_group, group): group for group in groups}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                judged = future.result()
+                error = "No verdict returned for this clause"
+            except Exception as e:
+                logging.exception("Exception judging clauses")
+                judged = {}
+                error = str(e)
+
+            judged_by_key = {keys[index]: verdict for index, verdict in judged.items()}
+            if cache:
+                cache.put_many(judged_by_key, prompt_version)
+            for clause, _ in group:
+                key = keys[clause.index]
+                verdict = dict(judged_by_key[key], cached=False) if key in judged_by_key else {"error": error, "cached": False}
+                for same_clause, template_clause in clauses_by_key[key]:
+                    entries[same_clause.index] = entry(same_clause, template_clause, verdict)
+                    yield {"clause": entries[same_clause.index]}
+
+    yield {
+        "report": {
+            "clauses": [entries[clause.index] for clause in agreement_clauses],
+            "cache": {
+                "clauses": len(agreement_clauses),
+                "hits": hits,
+                "misses": len(agreement_clauses) - hits,
+                "judged": len(novel),
+                "hit_ratio": round(hits / len(agreement_clauses), 4) if agreement_clauses else 0.0
+            }
+        }
+    }
+
+
+def validate_by_clause(*args, **kwargs) -> dict:
+    """Run `iter_clause_verdicts` to completion and return its report."""
+    for event in iter_clause_verdicts(*args, **kwargs):
+        if "report" in event:
+            return event["report"]
+
+
+def _clause_title(clause: dict) -> str:
+    return clause["heading"] or clause["text"].splitlines()[0][:80]
+
+
+def format_clause_verdict(clause: dict) -> str:
+    title = _clause_title(clause)
+    if "error" in clause:
+        return f"- {title}: not validated ({clause['error']})"
+    if clause.get("conforming"):
+        return f"- {title}: conforming"
+    return f"- {title}: non-conforming. {clause.get('explanation', '')}".rstrip()
+
+
+def reduce_clause_report(report: dict) -> str:
+    """Merge the per-clause verdicts into the summary that closes a clause-by-clause validation."""
+    clauses = report["clauses"]
+    failed = [clause for clause in clauses if "error" in clause]
+    non_conforming = [clause for clause in clauses if "error" not in clause and not clause.get("conforming")]
+    lines = [f"Summary: {len(non_conforming)} of {len(clauses)} clauses are non-conforming"
+             + (f", {len(failed)} could not be validated" if failed else "") + "."]
+    lines.extend(f"- {_clause_title(clause)}" for clause in non_conforming)
+    return "\n".join(lines)
+
+
+def format_clause_report(report: dict) -> str:
+    return "\n".join(format_clause_verdict(clause) for clause in report["clauses"])
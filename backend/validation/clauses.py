@@ -0,0 +1,101 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+# "1.", "1.2", "12.3.1)", "(a)", "a)", "§ 4", "Article 7", "Section 2.1", "IV."
+NUMBERING = re.compile(
+    r"^\s*(?:(?:article|section|clause)\s+\d+(?:\.\d+)*|§\s*\d+(?:\.\d+)*|\d+(?:\.\d+)*\.?\)?|\(?[a-z]\)|[ivxlc]+\.)\s+",
+    re.IGNORECASE
+)
+HEADING_MAX_WORDS = 8
+ALIGNMENT_MIN_SIMILARITY = 0.2
+QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-", "\u00a0": " "})
+WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class Clause:
+    index: int
+    heading: str
+    text: str
+    normalized: str
+    digest: str
+
+
+def normalize_clause(text: str) -> str:
+    ## numbering, case, typographic quotes and whitespace differ between counterparties without changing the wording
+    text = NUMBERING.sub("", text.translate(QUOTES))
+    return WHITESPACE.sub(" ", text).strip().lower()
+
+
+def clause_digest(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    return 0 < len(words) <= HEADING_MAX_WORDS and not line.rstrip().endswith((".", ";", ":", ","))
+
+
+def split_clauses(text: str) -> List[Clause]:
+    """Split extracted agreement text (one paragraph per line) into clauses.
+
+    A clause starts at a numbered paragraph or at a short heading line; the paragraphs that
+    follow belong to it until the next one. Word list numbering is not part of the extracted
+    text, so headings carry most documents. Text before the first boundary (title, parties)
+    becomes a clause of its own.
+    """
+    blocks = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        starts_clause = bool(NUMBERING.match(line)) or _is_heading(line)
+        previous_is_heading = bool(blocks) and len(blocks[-1]) == 1 and _is_heading(blocks[-1][0])
+        if not blocks or (starts_clause and not previous_is_heading):
+            blocks.append([line])
+        else:
+            blocks[-1].append(line)
+
+    clauses = []
+    for lines in blocks:
+        heading = lines[0] if len(lines) > 1 and _is_heading(lines[0]) else ""
+        body = "\n".join(lines)
+        normalized = normalize_clause(" ".join(lines))
+        clauses.append(Clause(
+            index=len(clauses),
+            heading=heading,
+            text=body,
+            normalized=normalized,
+            digest=clause_digest(normalized)
+        ))
+    return clauses
+
+
+def _words(clause: Clause) -> set:
+    return set(re.findall(r"[a-z0-9]+", clause.normalized))
+
+
+def align_clauses(template_clauses: List[Clause], agreement_clauses: List[Clause]) -> List[Optional[Clause]]:
+    """Return, for every agreement clause, the most similar template clause (Jaccard on words), or None."""
+    by_digest = {}
+    for template_clause in template_clauses:
+        by_digest.setdefault(template_clause.digest, template_clause)
+    template_words = None
+    aligned = []
+    for clause in agreement_clauses:
+        if clause.digest in by_digest:
+            aligned.append(by_digest[clause.digest])
+            continue
+        if template_words is None:
+            template_words = [_words(template_clause) for template_clause in template_clauses]
+        words = _words(clause)
+        best, best_score = None, 0.0
+        for template_clause, candidate in zip(template_clauses, template_words):
+            union = len(words | candidate)
+            score = len(words & candidate) / union if union else 0.0
+            if score > best_score:
+                best, best_score = template_clause, score
+        aligned.append(best if best_score >= ALIGNMENT_MIN_SIMILARITY else None)
+    return aligned
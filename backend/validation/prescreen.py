@@ -0,0 +1,183 @@
+import re
+import time
+from typing import List, Optional
+
+# Rule statuses: "pass" and "fail" are decided locally, "review" needs a lawyer or the model
+PASS = "pass"
+FAIL = "fail"
+REVIEW = "review"
+
+ALLOWED_ARBITRATION_SEATS = ("frankfurt", "london", "paris", "stockholm", "vienna", "zurich", "zürich")
+MAX_TERM_MONTHS = 24
+MAX_RETURN_DAYS = 30
+EVIDENCE_CHARS = 300
+
+US_JURISDICTIONS = (
+    "united states", "united states of america", "u.s.", "u.s.a.", "usa", "us law", "us federal",
+    "alabama", "alaska", "arizona", "arkansas", "california", "colorado", "connecticut", "delaware",
+    "district of columbia", "florida", "state of georgia", "hawaii", "idaho", "illinois", "indiana", "iowa",
+    "kansas", "kentucky", "louisiana", "maine", "maryland", "massachusetts", "michigan", "minnesota",
+    "mississippi", "missouri", "montana", "nebraska", "nevada", "new hampshire", "new jersey",
+    "new mexico", "new york", "north carolina", "north dakota", "ohio", "oklahoma", "oregon",
+    "pennsylvania", "rhode island", "south carolina", "south dakota", "tennessee", "texas", "utah",
+    "vermont", "virginia", "washington", "west virginia", "wisconsin", "wyoming",
+)
+TAX_HAVENS = (
+    "andorra", "anguilla", "antigua", "bahamas", "barbados", "belize", "bermuda", "british virgin islands",
+    "cayman islands", "cook islands", "curaçao", "dominica", "gibraltar", "grenada", "guernsey",
+    "isle of man", "jersey", "labuan", "liechtenstein", "macau", "marshall islands", "mauritius", "monaco",
+    "montserrat", "nauru", "niue", "panama", "saint kitts", "saint lucia", "samoa", "san marino",
+    "seychelles", "turks and caicos", "vanuatu",
+)
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "fourteen": 14, "fifteen": 15, "eighteen": 18, "twenty": 20,
+    "twenty-four": 24, "thirty": 30, "thirty-six": 36, "forty-five": 45, "sixty": 60, "ninety": 90,
+}
+
+
+def _alternation(phrases) -> str:
+    ## longest first so "new jersey" wins over "jersey" and "united states of america" over "united states"
+    return "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+
+
+QUANTITY = r"(?P<number>\d+|" + _alternation(NUMBER_WORDS) + r")(?:\s*\(\s*\d+\s*\))?"
+SENTENCES = re.compile(r"(?<=[.;])\s+|\n+")
+GOVERNING_LAW = re.compile(r"\b(?:governed by|governing law|subject to the laws? of|construed in accordance with)\b", re.IGNORECASE)
+JURISDICTIONS = re.compile(r"(?<![\w.])(?:(?P<us>" + _alternation(US_JURISDICTIONS) + r")|(?P<haven>" + _alternation(TAX_HAVENS) + r"))(?![\w])", re.IGNORECASE)
+LAWS_OF = re.compile(r"laws? of (?:the )?(?P<place>[A-Z][\w.\- ]{1,60}?)(?=[,.;()]|\s+(?:and|without|excluding|applicable)\b|$)")
+NATIONAL_LAW = re.compile(r"\b(?P<place>(?!This\b|Such\b|Applicable\b|Governing\b)[A-Z][a-z]+) (?:substantive )?law\b")
+ARBITRATION = re.compile(r"\barbitrat\w*", re.IGNORECASE)
+SEATS = re.compile(r"\b(?P<seat>" + _alternation(ALLOWED_ARBITRATION_SEATS) + r")\b", re.IGNORECASE)
+SEAT_OF = re.compile(r"\b(?:seat|place|venue) of (?:the )?arbitration (?:shall be|is|will be)\s+(?:in\s+)?(?P<place>[A-Z][\w\- ]{1,40}?)(?=[,.;()]|\s|$)")
+TERM = re.compile(r"\b(?:term|period|duration|in (?:full )?force|remain in effect|terminate|expire)\b", re.IGNORECASE)
+DURATION = re.compile(QUANTITY + r"\s+(?P<unit>years?|months?)\b", re.IGNORECASE)
+RETURN_DESTRUCTION = re.compile(r"\b(?:return|destroy|destruction|delete|deletion|erase)\w*", re.IGNORECASE)
+DEADLINE = re.compile(QUANTITY + r"\s+(?:business\s+|calendar\s+|working\s+)?(?P<unit>days?|weeks?|months?)\b", re.IGNORECASE)
+WRITTEN_NOTICE = re.compile(r"\b(?:written (?:notice|request)|request in writing|upon (?:written )?request)\b", re.IGNORECASE)
+BACKUPS = re.compile(r"\bback-?ups?\b|\barchiv\w*|\bretain\w* (?:a )?cop(?:y|ies)\b", re.IGNORECASE)
+PENALTIES = re.compile(r"\b(?:liquidated damages|contractual penalt(?:y|ies)|penalty|penalties|penalty clause)\b", re.IGNORECASE)
+NEGATION = re.compile(r"\b(?:no|not|neither|nor|without|exclud\w*)\b[^.;]{0,40}$", re.IGNORECASE)
+
+
+def _number(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBER_WORDS[value.lower()]
+
+
+def _evidence(sentence: str) -> str:
+    sentence = " ".join(sentence.split())
+    return sentence if len(sentence) <= EVIDENCE_CHARS else sentence[:EVIDENCE_CHARS - 3] + "..."
+
+
+def _finding(rule: str, status: str, value, evidence: Optional[str], detail: str) -> dict:
+    return {"rule": rule, "status": status, "value": value, "evidence": evidence, "detail": detail}
+
+
+def _governing_law(sentences: List[str]) -> dict:
+    mentions = [sentence for sentence in sentences if GOVERNING_LAW.search(sentence)]
+    for sentence in mentions:
+        jurisdiction = JURISDICTIONS.search(sentence)
+        if jurisdiction and jurisdiction.group("us"):
+            return _finding("governing_law", FAIL, jurisdiction.group(0), _evidence(sentence), "US law is not acceptable")
+        if jurisdiction:
+            return _finding("governing_law", FAIL, jurisdiction.group(0), _evidence(sentence), "Law of a country known as tax haven")
+        place = LAWS_OF.search(sentence) or NATIONAL_LAW.search(sentence)
+        if place:
+            return _finding("governing_law", PASS, place.group("place").strip(), _evidence(sentence), "Neither US law nor a tax haven")
+    if mentions:
+        return _finding("governing_law", REVIEW, None, _evidence(mentions[0]), "Governing law clause without a recognizable jurisdiction")
+    return _finding("governing_law", REVIEW, None, None, "No governing law clause found")
+
+
+def _arbitration(sentences: List[str]) -> dict:
+    mentions = [sentence for sentence in sentences if ARBITRATION.search(sentence)]
+    for sentence in mentions:
+        seat = SEATS.search(sentence)
+        if seat:
+            return _finding("arbitration_seat", PASS, seat.group("seat"), _evidence(sentence), "Arbitration seat is an accepted location")
+    for sentence in mentions:
+        seat = SEAT_OF.search(sentence)
+        if seat:
+            return _finding("arbitration_seat", FAIL, seat.group("place").strip(), _evidence(sentence),
+                            "Arbitration seat is not Frankfurt, London, Paris, Stockholm, Vienna or Zurich")
+    if mentions:
+        return _finding("arbitration_seat", REVIEW, None, _evidence(mentions[0]), "Arbitration without a recognizable seat")
+    return _finding("arbitration_seat", REVIEW, None, None, "No arbitration agreed; disputes go to the courts")
+
+
+def _term(sentences: List[str]) -> dict:
+    longest = None
+    for sentence in sentences:
+        if not TERM.search(sentence):
+            continue
+        for duration in DURATION.finditer(sentence):
+            months = _number(duration.group("number")) * (12 if duration.group("unit").lower().startswith("year") else 1)
+            if longest is None or months > longest[0]:
+                longest = (months, sentence)
+    if longest is None:
+        return _finding("term", REVIEW, None, None, "No term found")
+    months, sentence = longest
+    if months > MAX_TERM_MONTHS:
+        return _finding("term", FAIL, months, _evidence(sentence), f"Term of {months} months exceeds 2 years")
+    return _finding("term", PASS, months, _evidence(sentence), f"Term of {months} months")
+
+
+def _return_destruction(sentences: List[str]) -> dict:
+    mentions = [sentence for sentence in sentences if RETURN_DESTRUCTION.search(sentence)]
+    for sentence in mentions:
+        deadline = DEADLINE.search(sentence)
+        if not deadline:
+            continue
+        unit = deadline.group("unit").lower()
+        days = _number(deadline.group("number")) * (30 if unit.startswith("month") else 7 if unit.startswith("week") else 1)
+        notes = []
+        if not WRITTEN_NOTICE.search(sentence):
+            notes.append("not tied to a written notice")
+        if not any(BACKUPS.search(other) for other in mentions):
+            notes.append("no exception for mandatory backups")
+        detail = f"Deadline of {days} days" + (f"; {', '.join(notes)}" if notes else "")
+        return _finding("return_destruction", FAIL if days > MAX_RETURN_DAYS else PASS, days, _evidence(sentence), detail)
+    if mentions:
+        return _finding("return_destruction", REVIEW, None, _evidence(mentions[0]), "Return or destruction without a deadline")
+    return _finding("return_destruction", REVIEW, None, None, "No return or destruction clause found")
+
+
+def _penalties(sentences: List[str]) -> dict:
+    for sentence in sentences:
+        for penalty in PENALTIES.finditer(sentence):
+            if NEGATION.search(sentence[:penalty.start()]):
+                continue
+            return _finding("penalties", FAIL, penalty.group(0), _evidence(sentence), "Liability regime contains penalties or liquidated damages")
+    return _finding("penalties", PASS, None, None, "No penalties or liquidated damages found")
+
+
+def prescreen(text: str) -> dict:
+    """Check the agreement text against the general NDA rules with compiled patterns.
+
+    Every rule yields one finding with a status, the extracted value and the sentence it was
+    found in. The findings are hints for the model and the reviewer, not a legal assessment.
+    """
+    start = time.perf_counter()
+    sentences = [sentence for sentence in SENTENCES.split(text or "") if sentence.strip()]
+    findings = [
+        _governing_law(sentences),
+        _arbitration(sentences),
+        _term(sentences),
+        _return_destruction(sentences),
+        _penalties(sentences),
+    ]
+    return {
+        "findings": findings,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+
+
+def format_findings(findings: List[dict]) -> str:
+    lines = ["Automated pre-screening of the general rules (verify each finding against the agreement text):"]
+    for finding in findings:
+        line = f"- {finding['rule']}: {finding['status']}. {finding['detail']}."
+        if finding["evidence"]:
+            line += f' Evidence: "{finding["evidence"]}"'
+        lines.append(line)
+    return "\n".join(lines)
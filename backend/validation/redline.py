@@ -0,0 +1,249 @@
+import re
+import time
+from typing import List, Optional, Tuple
+
+from backend.validation.clause_alignment import TemplateClauseIndex, align
+from backend.validation.clauses import Clause, split_clauses
+
+EQUAL = "equal"
+DELETE = "delete"
+INSERT = "insert"
+
+TOKEN = re.compile(r"\w+(?:['’-]\w+)*|[^\w\s]")
+CONTEXT_TOKENS = 6
+MISSING_PREVIEW_TOKENS = 30
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Split text into word and punctuation tokens with their character spans."""
+    return [(match.group(), match.start(), match.end()) for match in TOKEN.finditer(text)]
+
+
+def _bisect(a: List[int], b: List[int], a0: int, a1: int, b0: int, b1: int, ops: list):
+    ## Myers' middle snake: walk forward and backward diagonals until they overlap, then recurse on both halves
+    n, m = a1 - a0, b1 - b0
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    length = 2 * max_d + 2
+    forward = [-1] * length
+    backward = [-1] * length
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+
+    for d in range(max_d):
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a0 + x1] == b[b0 + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1_end += 2
+            elif y1 > m:
+                k1_start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < length and backward[k2_offset] != -1 and x1 >= n - backward[k2_offset]:
+                    _diff(a, b, a0, a0 + x1, b0, b0 + y1, ops)
+                    _diff(a, b, a0 + x1, a1, b0 + y1, b1, ops)
+                    return
+
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]):
+                x2 = backward[k2_offset + 1]
+            else:
+                x2 = backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a1 - x2 - 1] == b[b1 - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            backward[k2_offset] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < length and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        _diff(a, b, a0, a0 + x1, b0, b0 + y1, ops)
+                        _diff(a, b, a0 + x1, a1, b0 + y1, b1, ops)
+                        return
+
+    _append(ops, DELETE, a0, a1, b0, b0)
+    _append(ops, INSERT, a1, a1, b0, b1)
+
+
+def _append(ops: list, tag: str, i1: int, i2: int, j1: int, j2: int):
+    if i1 == i2 and j1 == j2:
+        return
+    if ops and ops[-1][0] == tag:
+        ops[-1] = (tag, ops[-1][1], i2, ops[-1][3], j2)
+    else:
+        ops.append((tag, i1, i2, j1, j2))
+
+
+def _diff(a: List[int], b: List[int], a0: int, a1: int, b0: int, b1: int, ops: list):
+    prefix = 0
+    while a0 + prefix < a1 and b0 + prefix < b1 and a[a0 + prefix] == b[b0 + prefix]:
+        prefix += 1
+    _append(ops, EQUAL, a0, a0 + prefix, b0, b0 + prefix)
+    a0 += prefix
+    b0 += prefix
+
+    suffix = 0
+    while a1 - suffix > a0 and b1 - suffix > b0 and a[a1 - suffix - 1] == b[b1 - suffix - 1]:
+        suffix += 1
+
+    if a0 == a1 - suffix:
+        _append(ops, INSERT, a0, a0, b0, b1 - suffix)
+    elif b0 == b1 - suffix:
+        _append(ops, DELETE, a0, a1 - suffix, b0, b0)
+    else:
+        _bisect(a, b, a0, a1 - suffix, b0, b1 - suffix, ops)
+    _append(ops, EQUAL, a1 - suffix, a1, b1 - suffix, b1)
+
+
+def diff_tokens(a: List[str], b: List[str]) -> List[Tuple[str, int, int, int, int]]:
+    """Myers O((N+M)D) diff in linear space; returns (tag, i1, i2, j1, j2) opcodes like difflib."""
+    ids = {}
+    a_ids = [ids.setdefault(token, len(ids)) for token in a]
+    b_ids = [ids.setdefault(token, len(ids)) for token in b]
+    ops = []
+    _diff(a_ids, b_ids, 0, len(a_ids), 0, len(b_ids), ops)
+    return ops
+
+
+def _span(text: str, tokens: list, start: int, end: int) -> str:
+    ## a run of tokens keeps the whitespace up to the next token so the redline reads like the original
+    if start == end:
+        return ""
+    stop = tokens[end][1] if end < len(tokens) else len(text)
+    return text[tokens[start][1]:stop]
+
+
+def diff_clause(template_clause: Clause, agreement_clause: Clause) -> dict:
+    template_tokens = tokenize(template_clause.text)
+    agreement_tokens = tokenize(agreement_clause.text)
+    ops = []
+    inserted = deleted = 0
+    for tag, i1, i2, j1, j2 in diff_tokens([t[0] for t in template_tokens], [t[0] for t in agreement_tokens]):
+        if tag == EQUAL:
+            ops.append({"op": EQUAL, "text": _span(agreement_clause.text, agreement_tokens, j1, j2)})
+            continue
+        if tag == DELETE:
+            deleted += i2 - i1
+            ops.append({"op": DELETE, "text": _span(template_clause.text, template_tokens, i1, i2)})
+        else:
+            inserted += j2 - j1
+            ops.append({"op": INSERT, "text": _span(agreement_clause.text, agreement_tokens, j1, j2)})
+    return {"ops": ops, "inserted_words": inserted, "deleted_words": deleted}
+
+
+def redline(template_text: str, agreement_text: str, template_index: Optional[TemplateClauseIndex] = None) -> dict:
+    """Word-level redline of the agreement against the template, anchored on aligned clauses.
+
+    Every agreement clause is diffed against the template clause it was aligned with, which
+    keeps each diff small and lets reordered clauses match. Agreement clauses without a template
+    counterpart are reported as `added`, template clauses nobody matched as `missing`.
+    `template_index` skips splitting and indexing a template that was already indexed.
+    """
+    start = time.perf_counter()
+    template_clauses = template_index.clauses if template_index else split_clauses(template_text)
+    agreement_clauses = split_clauses(agreement_text)
+    aligned = align(template_clauses, agreement_clauses, template_index)
+
+    clauses = []
+    matched = set()
+    for clause, (template_clause, similarity) in zip(agreement_clauses, aligned):
+        entry = {
+            "index": clause.index,
+            "heading": clause.heading,
+            "template_index": template_clause.index if template_clause else None,
+            "template_heading": template_clause.heading if template_clause else None,
+            "similarity": similarity
+        }
+        if template_clause is None:
+            entry.update(status="added", ops=[{"op": INSERT, "text": clause.text}], inserted_words=len(tokenize(clause.text)), deleted_words=0)
+        elif template_clause.text == clause.text:
+            entry.update(status="identical", ops=[{"op": EQUAL, "text": clause.text}], inserted_words=0, deleted_words=0)
+        else:
+            entry.update(diff_clause(template_clause, clause))
+            entry["status"] = "changed" if entry["inserted_words"] or entry["deleted_words"] else "identical"
+        if template_clause is not None:
+            matched.add(template_clause.index)
+        clauses.append(entry)
+
+    missing = [{"template_index": clause.index, "template_heading": clause.heading, "text": clause.text}
+               for clause in template_clauses if clause.index not in matched]
+    return {
+        "clauses": clauses,
+        "missing": missing,
+        "summary": {
+            "clauses": len(clauses),
+            "identical": sum(1 for clause in clauses if clause["status"] == "identical"),
+            "changed": sum(1 for clause in clauses if clause["status"] == "changed"),
+            "added": sum(1 for clause in clauses if clause["status"] == "added"),
+            "missing": len(missing),
+            "inserted_words": sum(clause["inserted_words"] for clause in clauses),
+            "deleted_words": sum(clause["deleted_words"] for clause in clauses),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+    }
+
+
+def _clip(text: str, keep: int, from_end: bool) -> str:
+    words = text.split()
+    if len(words) <= keep:
+        return text.strip()
+    return "... " + " ".join(words[-keep:]) if from_end else " ".join(words[:keep]) + " ..."
+
+
+def _title(entry: dict) -> str:
+    return entry.get("heading") or entry.get("template_heading") or f"clause {entry['index'] + 1}"
+
+
+def format_diff_context(result: dict, context_tokens: int = CONTEXT_TOKENS) -> str:
+    """Compact diff-only description of the redline for the model: only changes plus a few words around them."""
+    lines = []
+    identical = [_title(entry) for entry in result["clauses"] if entry["status"] == "identical"]
+    if identical:
+        lines.append("Clauses identical to the template: " + "; ".join(identical))
+
+    for entry in result["clauses"]:
+        if entry["status"] == "added":
+            lines.append(f"Clause not in the template ({_title(entry)}): {entry['ops'][0]['text']}")
+        elif entry["status"] == "changed":
+            changes = []
+            ops = entry["ops"]
+            position = 0
+            while position < len(ops):
+                if ops[position]["op"] == EQUAL:
+                    position += 1
+                    continue
+                ## a replacement is a delete next to an insert; keep them in one hunk
+                end = position
+                while end < len(ops) and ops[end]["op"] != EQUAL:
+                    end += 1
+                before = _clip(ops[position - 1]["text"], context_tokens, True) if position else ""
+                after = _clip(ops[end]["text"], context_tokens, False) if end < len(ops) else ""
+                edits = " ".join(f"[-{op['text'].strip()}-]" if op["op"] == DELETE else f"[+{op['text'].strip()}+]" for op in ops[position:end])
+                changes.append(f"{before} {edits} {after}".strip())
+                position = end
+            lines.append(f"Changed clause ({_title(entry)}), template text [-removed-] and agreement text [+added+]:\n  " + "\n  ".join(changes))
+
+    for entry in result["missing"]:
+        lines.append(f"Template clause missing in the agreement ({entry['template_heading'] or 'clause ' + str(entry['template_index'] + 1)}): "
+                     + _clip(entry["text"], MISSING_PREVIEW_TOKENS, False))
+    return "\n".join(lines)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class ValidationResultCache():
+    """Persistent SQLite cache of validation answers.
+
+    Entries are keyed by a hash of the template and agreement blob ETags, the deployment, the
+    system prompt and the conversation, so any change to a document, model or prompt misses.
+    The least recently used entries are evicted once the stored answers exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, model TEXT, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used_at ON results (last_used_at)")
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(template_etag: Optional[str], agreement_etag: Optional[str], deployment: str, system_prompt: str, messages: list) -> str:
+        ## only role and content identify the question; ids and dates differ on every request
+        conversation = [[m.get("role"), m.get("content")] for m in messages if m]
+        payload = json.dumps({
+            "template_etag": template_etag,
+            "agreement_etag": agreement_etag,
+            "deployment": deployment,
+            "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+            "conversation": hashlib.sha256(json.dumps(conversation, ensure_ascii=False).encode("utf-8")).hexdigest()
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute("SELECT content, model, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE results SET last_used_at = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+            self.hits += 1
+            return {"content": row[0], "model": row[1], "created_at": row[2]}
+
+    def put(self, key: str, content: str, model: Optional[str]):
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results (key, content, model, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, content, model, size, now, now)
+            )
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._connection.execute("SELECT key, size FROM results ORDER BY last_used_at LIMIT 1").fetchone()
+                self._connection.execute("DELETE FROM results WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+                self.evictions += 1
+            self._connection.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
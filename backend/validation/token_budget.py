@@ -0,0 +1,145 @@
+import json
+import logging
+import threading
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context windows of the Azure OpenAI chat models, longest matching prefix wins
+CONTEXT_WINDOWS = {
+    "gpt-35-turbo": 4096,
+    "gpt-35-turbo-16k": 16384,
+    "gpt-35-turbo-1106": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106": 128000,
+    "gpt-4-turbo": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Per-message overhead of the chat format and the tokens that prime the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+MIN_TRUNCATED_TOKENS = 256
+TRUNCATION_MARKER = "\n[... truncated to fit the model context window ...]"
+OMITTED_NOTE = "{count} earlier message(s) of this conversation were omitted to fit the model context window."
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def get_encoding():
+    ## all supported chat models use cl100k_base; None means "estimate from characters"
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed or tiktoken is None:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logging.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+                _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def context_window(model_name: Optional[str]) -> int:
+    name = (model_name or "").lower()
+    matches = [prefix for prefix in CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+class TokenBudget():
+    """Fits a chat request into the context window of one deployment.
+
+    The system prompt, the function definitions and `max_response_tokens` for the answer are
+    always reserved. The remaining budget is filled with the conversation from the newest
+    message backwards; the message that no longer fits is truncated if a useful part of it
+    fits, and everything older is replaced by a one-line note.
+    """
+
+    def __init__(self, model_name: str, max_response_tokens: int, max_context_tokens: Optional[int] = None):
+        self.model_name = model_name
+        self.max_response_tokens = max_response_tokens
+        self.context_window = max_context_tokens or context_window(model_name)
+
+    @staticmethod
+    def count_message(message: dict) -> int:
+        return TOKENS_PER_MESSAGE + count_tokens(message.get("role", "")) + count_tokens(message.get("content") or "")
+
+    @staticmethod
+    def count_functions(functions: Optional[list]) -> int:
+        return count_tokens(json.dumps(functions)) if functions else 0
+
+    def fit(self, messages: list, functions: Optional[list] = None):
+        """Return (messages, breakdown) where messages fit the context window."""
+        system_messages = [m for m in messages if m.get("role") == "system"]
+        conversation = [m for m in messages if m.get("role") != "system"]
+
+        system_tokens = sum(self.count_message(m) for m in system_messages)
+        function_tokens = self.count_functions(functions)
+        note_tokens = self.count_message({"role": "system", "content": OMITTED_NOTE.format(count=0)})
+        available = self.context_window - self.max_response_tokens - system_tokens - function_tokens - TOKENS_PER_REPLY - note_tokens
+
+        kept = []
+        used = {"history": 0, "tool": 0}
+        truncated = 0
+        for message in reversed(conversation):
+            tokens = self.count_message(message)
+            remaining = available - used["history"] - used["tool"]
+            if tokens > remaining:
+                if remaining >= MIN_TRUNCATED_TOKENS or not kept:
+                    content_budget = max(remaining - TOKENS_PER_MESSAGE - count_tokens(message.get("role", "")) - count_tokens(TRUNCATION_MARKER), 0)
+                    message = dict(message, content=truncate_to_tokens(message.get("content") or "", content_budget) + TRUNCATION_MARKER)
+                    tokens = self.count_message(message)
+                    truncated += 1
+                    kept.append(message)
+                    used["tool" if message.get("role") in ("tool", "function") else "history"] += tokens
+                break
+            kept.append(message)
+            used["tool" if message.get("role") in ("tool", "function") else "history"] += tokens
+
+        kept.reverse()
+        dropped = len(conversation) - len(kept)
+        fitted = list(system_messages)
+        if dropped:
+            fitted.append({"role": "system", "content": OMITTED_NOTE.format(count=dropped)})
+        fitted.extend(kept)
+
+        prompt_tokens = system_tokens + function_tokens + used["history"] + used["tool"] + TOKENS_PER_REPLY + (note_tokens if dropped else 0)
+        breakdown = {
+            "model_name": self.model_name,
+            "context_window": self.context_window,
+            "reserved_for_answer": self.max_response_tokens,
+            "system": system_tokens,
+            "functions": function_tokens,
+            "history": used["history"],
+            "tool": used["tool"],
+            "prompt": prompt_tokens,
+            "dropped_messages": dropped,
+            "truncated_messages": truncated,
+            "estimated": get_encoding() is None
+        }
+        return fitted, breakdown
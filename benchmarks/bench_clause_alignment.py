@@ -0,0 +1,88 @@
+"""Compare vectorized TF-IDF clause alignment with the pairwise word-overlap alignment.
+
+    python benchmarks/bench_clause_alignment.py --paragraphs 600 --runs 5
+
+The agreement is the template shuffled, with every clause lightly reworded and some
+clauses added that the template does not have.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.validation.clause_alignment import TemplateClauseIndex  # noqa: E402
+from backend.validation.clauses import align_clauses, split_clauses  # noqa: E402
+
+
+def build_paragraphs(count, rng, vocabulary, first_number=1):
+    return [f"{first_number + i}. " + " ".join(rng.choice(vocabulary) for _ in range(rng.randint(30, 90))) + "."
+            for i in range(count)]
+
+
+def reword(paragraph, rng, vocabulary):
+    words = paragraph.split()
+    for _ in range(max(len(words) // 10, 1)):
+        words[rng.randrange(1, len(words))] = rng.choice(vocabulary)
+    return " ".join(words)
+
+
+def timed(function, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, round(statistics.median(timings), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=600)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"term{i}" for i in range(4000)]
+    template = build_paragraphs(args.paragraphs, rng, vocabulary)
+    agreement = [reword(paragraph, rng, vocabulary) for paragraph in template]
+    ## paragraph numbers survive rewording, so they identify the correct template clause
+    expected = {paragraph.split()[0]: index for index, paragraph in enumerate(template)}
+    agreement += build_paragraphs(args.paragraphs // 10, rng, vocabulary, first_number=args.paragraphs + 1)
+    rng.shuffle(agreement)
+
+    template_clauses = split_clauses("\n".join(template))
+    agreement_clauses = split_clauses("\n".join(agreement))
+
+    index, build_ms = timed(lambda: TemplateClauseIndex(template_clauses), args.runs)
+    vectorized, align_ms = timed(lambda: index.align(agreement_clauses), args.runs)
+    pairwise, pairwise_ms = timed(lambda: align_clauses(template_clauses, agreement_clauses), 1)
+
+    def accuracy(aligned):
+        correct = total = 0
+        for clause, template_clause in zip(agreement_clauses, aligned):
+            number = clause.text.split()[0]
+            if number not in expected:
+                continue
+            total += 1
+            correct += template_clause is not None and template_clause.index == expected[number]
+        return round(correct / total, 4) if total else 0.0
+
+    print(json.dumps({
+        "template_clauses": len(template_clauses),
+        "agreement_clauses": len(agreement_clauses),
+        "vectorized_index_build_ms": build_ms,
+        "vectorized_align_ms": align_ms,
+        "pairwise_align_ms": pairwise_ms,
+        "vectorized_accuracy": accuracy([template_clause for template_clause, _ in vectorized]),
+        "pairwise_accuracy": accuracy(pairwise)
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare the streaming DOCX extractor with python-docx on a generated long agreement.
+
+    python benchmarks/bench_docx_extract.py --clauses 600 --runs 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+
+from backend.documents.docx_text import extract_docx_text_python_docx, extract_docx_text_streaming  # noqa: E402
+
+CLAUSE = ("The Receiving Party shall return or destroy all Confidential Information within thirty (30) days "
+          "upon receipt of written notice, save for copies retained in mandatory backups, and shall confirm "
+          "such destruction in writing to the Disclosing Party without undue delay. ")
+
+
+def build_agreement(clauses):
+    doc = Document()
+    doc.add_heading("Mutual Non-Disclosure Agreement", 0)
+    for i in range(clauses):
+        doc.add_heading(f"{i + 1}. Clause", level=2)
+        doc.add_paragraph(CLAUSE * 3)
+        if i % 50 == 0:
+            table = doc.add_table(rows=4, cols=2)
+            for row in table.rows:
+                row.cells[0].text = "Signed for and on behalf of"
+                row.cells[1].text = "Name / Title / Date"
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(extract, data, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        text = extract(data)
+    elapsed = (time.perf_counter() - start) / runs
+
+    tracemalloc.start()
+    extract(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return text, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clauses", type=int, default=600)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    data = build_agreement(args.clauses)
+    for name, extract in (("python-docx", extract_docx_text_python_docx), ("streaming", extract_docx_text_streaming)):
+        text, elapsed, peak = measure(extract, data, args.runs)
+        print(json.dumps({
+            "extractor": name,
+            "docx_bytes": len(data),
+            "text_chars": len(text),
+            "ms_per_document": round(elapsed * 1000, 2),
+            "peak_memory_kb": round(peak / 1024)
+        }))
+
+
+if __name__ == "__main__":
+    main()
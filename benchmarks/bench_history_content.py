@@ -0,0 +1,94 @@
+"""Compare history writes and reads with message bodies stored inline and offloaded.
+
+    python benchmarks/bench_history_content.py --conversations 25 --nda-words 4000 --runs 10
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there, with a local content-addressed store in a temporary directory. Each conversation
+holds a user, tool (the NDA text, the same few agreements across conversations) and
+assistant message. `list` reads the messages of every listed conversation, as the history
+panel does; `open` reads one conversation and loads its offloaded bodies, as expanding all of its
+answers does.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.content_store import LocalContentBackend, MessageContentStore  # noqa: E402
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from bench_history_queries import NDA_WORDS, client  # noqa: E402
+from cosmos_standin import StandInContainer, _kb  # noqa: E402
+
+
+def run(history, container, conversations, agreements, runs, rng):
+    user_id = "user-1"
+    ids = []
+    for _ in range(conversations):
+        conversation_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        history.create_conversation(user_id, "NDA review", conversation_id)
+        history.create_messages(conversation_id, user_id, [
+            (str(uuid.UUID(int=rng.getrandbits(128))), {'role': 'user', 'content': 'Please validate the NDA.'}),
+            (str(uuid.UUID(int=rng.getrandbits(128))), {'role': 'tool', 'content': rng.choice(agreements)}),
+            (str(uuid.UUID(int=rng.getrandbits(128))), {'role': 'assistant', 'content': 'The NDA is valid. ' * 40})
+        ])
+        ids.append(conversation_id)
+    write_charge = history.request_stats.stats()["create_messages"]["request_charge_per_call"]
+    largest_item_kb = max(_kb(item) for item in container.partitions[user_id].values())
+
+    listed = {"request_charge": 0.0, "response_kb": 0.0, "ms": 0.0}
+    opened = {"request_charge": 0.0, "response_kb": 0.0, "ms": 0.0}
+    for _ in range(runs):
+        for totals, conversation_ids in ((listed, ids), (opened, [rng.choice(ids)])):
+            history.request_stats = type(history.request_stats)()
+            container.response_bytes = 0
+            start = time.perf_counter()
+            for conversation_id in conversation_ids:
+                messages = history.get_messages(user_id, conversation_id)
+                for message in messages if totals is opened else []:
+                    history.get_message_content(message)
+            totals["ms"] += (time.perf_counter() - start) * 1000 / runs
+            totals["request_charge"] += sum(stats["request_charge_per_call"] * stats["calls"] for stats in history.request_stats.stats().values()) / runs
+            totals["response_kb"] += container.response_bytes / 1024 / runs
+    return {
+        "create_messages_request_charge": write_charge,
+        "largest_item_kb": largest_item_kb,
+        "list": {key: round(value, 2) for key, value in listed.items()},
+        "open": {key: round(value, 2) for key, value in opened.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=25)
+    parser.add_argument("--agreements", type=int, default=5)
+    parser.add_argument("--nda-words", type=int, default=4000)
+    parser.add_argument("--threshold-bytes", type=int, default=8192)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for name in ("inline", "offloaded"):
+            rng = random.Random(args.seed)
+            agreements = [" ".join(rng.choice(NDA_WORDS) for _ in range(args.nda_words)) for _ in range(args.agreements)]
+            container = StandInContainer(round_trip_ms=args.round_trip_ms)
+            history = client(CosmosConversationClient, container)
+            if name == "offloaded":
+                history.content_store = MessageContentStore(LocalContentBackend(os.path.join(root, "content")), threshold_bytes=args.threshold_bytes)
+            results[name] = run(history, container, args.conversations, agreements, args.runs, rng)
+            if history.content_store:
+                results[name]["content_store"] = history.content_store.stats()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare /history/delete_all before and after logical deletion with background bulk reclaim.
+
+    python benchmarks/bench_history_delete.py --conversations 200 --messages 6
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there, for one user with a long history. `before` is the original serial loop: list every
+conversation, then query and delete its messages one item at a time and read and delete the
+conversation. `after` reports how long the endpoint takes to hide the history and answer, how
+many conversations a list right after it still shows, when every conversation is marked
+deleted and when all messages are reclaimed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from backend.history.reclaim import HistoryReclaimer  # noqa: E402
+from bench_history_queries import client, seed  # noqa: E402
+from cosmos_standin import StandInContainer  # noqa: E402
+
+
+def delete_all_serially(history, user_id):
+    for conversation in history.get_conversations(user_id, offset=0, limit=None):
+        with history.request_stats.track("delete_all") as call:
+            for message in history.get_messages(user_id, conversation['id']):
+                history.container_client.delete_item(item=message['id'], partition_key=user_id, response_hook=call.hook)
+            history.container_client.read_item(item=conversation['id'], partition_key=user_id, response_hook=call.hook)
+            history.container_client.delete_item(item=conversation['id'], partition_key=user_id, response_hook=call.hook)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--nda-words", type=int, default=4000)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--bulk-concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    rng = random.Random(args.seed)
+    container = StandInContainer(round_trip_ms=args.round_trip_ms)
+    seed(container, 1, args.conversations, args.messages, args.nda_words, rng)
+    history = client(CosmosConversationClient, container)
+    start = time.perf_counter()
+    delete_all_serially(history, "user-0")
+    results["before"] = {"endpoint_ms": round((time.perf_counter() - start) * 1000, 1), "items_left": len(container.partitions["user-0"])}
+
+    rng = random.Random(args.seed)
+    container = StandInContainer(round_trip_ms=args.round_trip_ms)
+    seed(container, 1, args.conversations, args.messages, args.nda_words, rng)
+    history = client(CosmosConversationClient, container)
+    history.deleted_ttl = 86400
+    history.bulk_concurrency = args.bulk_concurrency
+    reclaimer = HistoryReclaimer()
+    timings = {}
+
+    def delete_user_history(user_id, deleted_before):
+        conversation_ids = history.delete_conversations(user_id, created_before=deleted_before)
+        timings["marked_after_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        history.delete_conversations_messages(user_id, conversation_ids)
+
+    start = time.perf_counter()
+    deleted_before = history.hide_conversations("user-0")
+    job = reclaimer.submit("benchmark history", delete_user_history, "user-0", deleted_before)
+    timings["endpoint_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    timings["visible_after_endpoint"] = len(history.get_conversations_page("user-0", 25)[0])
+    job.result()
+    timings["reclaimed_after_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    timings["visible_conversations"] = len(history.get_conversations("user-0", offset=0, limit=None))
+    timings["items_left"] = len(container.partitions["user-0"])
+    results["after"] = dict(timings, cosmos=history.request_stats.stats())
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
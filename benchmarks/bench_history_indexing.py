@@ -0,0 +1,71 @@
+"""Compare request units of history writes and queries before and after the tuned indexing policy.
+
+    python benchmarks/bench_history_indexing.py --users 50 --conversations 40 --messages 6 --runs 30
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there. `before` keeps the default index-everything policy, `after` lets
+`CosmosConversationClient.ensure` apply INDEXING_POLICY, which excludes message content from
+indexing and adds the composite indexes the list and message queries sort through. Each run
+appends a user, tool (the NDA text) and assistant message to a conversation, lists the
+user's conversations and reads the messages back.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from bench_history_queries import NDA_WORDS, client, seed  # noqa: E402
+from cosmos_standin import StandInContainer, StandInDatabase  # noqa: E402
+
+
+def run(history, ids, runs, nda_words, rng):
+    for _ in range(runs):
+        user_id = rng.choice(list(ids))
+        conversation_id = rng.choice(ids[user_id])
+        history.create_messages(conversation_id, user_id, [
+            (str(uuid.UUID(int=rng.getrandbits(128))), {'role': 'user', 'content': 'Please validate the NDA.'}),
+            (str(uuid.UUID(int=rng.getrandbits(128))), {'role': 'tool', 'content': " ".join(rng.choice(NDA_WORDS) for _ in range(nda_words))}),
+            (str(uuid.UUID(int=rng.getrandbits(128))), {'role': 'assistant', 'content': 'The NDA is valid.'})
+        ])
+        history.get_conversations(user_id, offset=0, limit=25)
+        history.get_messages(user_id, conversation_id)
+    return {
+        operation: {"request_charge_per_call": stats["request_charge_per_call"], "elapsed_ms_per_call": stats["elapsed_ms_per_call"]}
+        for operation, stats in history.request_stats.stats().items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--nda-words", type=int, default=4000)
+    parser.add_argument("--physical-partitions", type=int, default=8)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for name in ("before", "after"):
+        rng = random.Random(args.seed)
+        container = StandInContainer(args.physical_partitions, args.round_trip_ms)
+        ids = seed(container, args.users, args.conversations, args.messages, args.nda_words, rng)
+        history = client(CosmosConversationClient, container)
+        history.cosmosdb_client = container
+        history.database_client = StandInDatabase(container)
+        history.container_name = "conversations"
+        history.ensure(apply_indexing_policy=name == "after")
+        results[name] = dict(run(history, ids, args.runs, args.nda_words, rng), indexing_policy=history.indexing_policy_status)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare /history/list page costs with OFFSET paging, continuation tokens and `since` refreshes.
+
+    python benchmarks/bench_history_list.py --conversations 3000 --depths 0 10 50 100
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there, for one user with a long history. For every page depth it reports the RU and latency
+of fetching that page with `offset` and with the continuation token of the previous page.
+`refresh` compares re-downloading the first page with asking for what changed `since` the
+newest `updatedAt` the client has, after a couple of conversations were touched.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from bench_history_queries import client, seed  # noqa: E402
+from cosmos_standin import StandInContainer  # noqa: E402
+
+
+def measure(history, operation, call):
+    history.request_stats = type(history.request_stats)()
+    start = time.perf_counter()
+    result = call()
+    stats = history.request_stats.stats()[operation]
+    return result, {"request_charge": stats["request_charge_per_call"], "ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=3000)
+    parser.add_argument("--page-size", type=int, default=25)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 10, 50, 100])
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    container = StandInContainer(round_trip_ms=args.round_trip_ms)
+    seed(container, 1, args.conversations, 0, 0, rng)
+    history = client(CosmosConversationClient, container)
+
+    pages = {}
+    token = None
+    for depth in range(max(args.depths) + 1):
+        (conversations, next_token), token_cost = measure(history, "get_conversations_page",
+                                                          lambda: history.get_conversations_page("user-0", args.page_size, continuation_token=token))
+        if depth in args.depths:
+            _, offset_cost = measure(history, "get_conversations",
+                                     lambda: history.get_conversations("user-0", offset=depth * args.page_size, limit=args.page_size))
+            pages[f"page {depth}"] = {"offset": offset_cost, "continuation_token": token_cost}
+        token = next_token
+
+    first_page, _ = history.get_conversations_page("user-0", args.page_size)
+    since = max(conversation["updatedAt"] for conversation in first_page)
+    for user_id, items in container.partitions.items():
+        for item in rng.sample(list(items.values()), 2):
+            item["updatedAt"] = (datetime.fromisoformat(since) + timedelta(seconds=1)).isoformat()
+    _, reload_cost = measure(history, "get_conversations_page", lambda: history.get_conversations_page("user-0", args.page_size))
+    (changed, _), since_cost = measure(history, "get_conversations_page", lambda: history.get_conversations_page("user-0", args.page_size, since=since))
+    refresh = {"first_page": dict(reload_cost, conversations=len(first_page)), "since": dict(since_cost, conversations=len(changed))}
+
+    print(json.dumps({"pages": pages, "refresh": refresh}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
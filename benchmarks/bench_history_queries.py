@@ -0,0 +1,124 @@
+"""Compare request units and latency of the history reads before and after partition scoping.
+
+    python benchmarks/bench_history_queries.py --users 200 --conversations 40 --messages 6 --runs 30
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there. `before` replays the original cross-partition `SELECT *` queries, `after` is the
+current CosmosConversationClient. Each conversation holds user, tool (the NDA text)
+and assistant messages.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from backend.history.request_stats import CosmosRequestStats  # noqa: E402
+from cosmos_standin import StandInContainer  # noqa: E402
+
+NDA_WORDS = "the receiving party shall keep confidential information secret and return or destroy it within thirty days".split()
+
+
+class OriginalQueries(CosmosConversationClient):
+    """The history reads as they were: cross-partition queries returning whole documents."""
+
+    def get_conversations(self, user_id, limit, sort_order='DESC', offset=0):
+        query = f"SELECT * FROM c where c.userId = @userId and c.type='conversation' order by c.updatedAt {sort_order}"
+        if limit is not None:
+            query += f" offset {offset} limit {limit}"
+        with self.request_stats.track("get_conversations") as call:
+            return list(self.container_client.query_items(query=query, parameters=[{'name': '@userId', 'value': user_id}],
+                                                          enable_cross_partition_query=True, response_hook=call.hook))
+
+    def get_conversation(self, user_id, conversation_id):
+        query = "SELECT * FROM c where c.id = @conversationId and c.type='conversation' and c.userId = @userId"
+        parameters = [{'name': '@conversationId', 'value': conversation_id}, {'name': '@userId', 'value': user_id}]
+        with self.request_stats.track("get_conversation") as call:
+            conversation = list(self.container_client.query_items(query=query, parameters=parameters,
+                                                                  enable_cross_partition_query=True, response_hook=call.hook))
+        return conversation[0] if conversation else None
+
+    def get_messages(self, user_id, conversation_id):
+        query = "SELECT * FROM c WHERE c.conversationId = @conversationId AND c.type='message' AND c.userId = @userId ORDER BY c.timestamp ASC"
+        parameters = [{'name': '@conversationId', 'value': conversation_id}, {'name': '@userId', 'value': user_id}]
+        with self.request_stats.track("get_messages") as call:
+            return list(self.container_client.query_items(query=query, parameters=parameters,
+                                                          enable_cross_partition_query=True, response_hook=call.hook))
+
+
+def client(cls, container):
+    instance = cls.__new__(cls)
+    instance.container_client = container
+    instance.enable_message_feedback = True
+    instance.request_stats = CosmosRequestStats()
+    return instance
+
+
+def seed(container, users, conversations, messages, nda_words, rng):
+    ids = {}
+    start = datetime(2023, 9, 1)
+    for user in range(users):
+        user_id = f"user-{user}"
+        for _ in range(conversations):
+            conversation_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            created = start + timedelta(minutes=rng.randrange(100000))
+            container.seed({'id': conversation_id, 'type': 'conversation', 'userId': user_id, 'title': 'NDA review',
+                            'createdAt': created.isoformat(), 'updatedAt': created.isoformat()})
+            for position in range(messages):
+                role = ("user", "tool", "assistant")[position % 3]
+                content = " ".join(rng.choice(NDA_WORDS) for _ in range(nda_words)) if role == "tool" else "Please validate the NDA."
+                created_at = (created + timedelta(seconds=position)).isoformat()
+                container.seed({'id': str(uuid.UUID(int=rng.getrandbits(128))), 'type': 'message', 'userId': user_id,
+                                'conversationId': conversation_id, 'role': role, 'content': content, 'feedback': '',
+                                'createdAt': created_at, 'updatedAt': created_at})
+            ids.setdefault(user_id, []).append(conversation_id)
+    return ids
+
+
+def run(history, container, ids, runs, rng):
+    container.response_bytes = 0
+    ordered = 0
+    for _ in range(runs):
+        user_id = rng.choice(list(ids))
+        conversation_id = rng.choice(ids[user_id])
+        history.get_conversations(user_id, offset=0, limit=25)
+        history.get_conversation(user_id, conversation_id)
+        messages = history.get_messages(user_id, conversation_id)
+        ordered += [message['createdAt'] for message in messages] == sorted(message['createdAt'] for message in messages)
+    return dict(history.request_stats.stats(), response_kb_per_run=round(container.response_bytes / runs / 1024, 1),
+                messages_in_order=f"{ordered}/{runs}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--nda-words", type=int, default=4000)
+    parser.add_argument("--physical-partitions", type=int, default=8)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for name, cls in (("before", OriginalQueries), ("after", CosmosConversationClient)):
+        rng = random.Random(args.seed)
+        container = StandInContainer(args.physical_partitions, args.round_trip_ms)
+        ids = seed(container, args.users, args.conversations, args.messages, args.nda_words, rng)
+        ## messages are stored newest first so an ordering on a missing field shows up
+        for items in container.partitions.values():
+            for key in reversed(list(items)):
+                items[key] = items.pop(key)
+        results[name] = run(client(cls, container), container, ids, args.runs, rng)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
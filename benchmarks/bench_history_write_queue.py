@@ -0,0 +1,90 @@
+"""Compare the time a request spends saving history with direct Cosmos writes and the write-behind queue.
+
+    python benchmarks/bench_history_write_queue.py --writes 200 --round-trip-ms 15
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there. Every write is the tool and assistant message pair of /history/update. `direct`
+times create_messages in the request; `queued` times enqueue and reports how long the
+background flusher took to drain the queue.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from backend.history.write_queue import HistoryWriteQueue  # noqa: E402
+from bench_history_queries import NDA_WORDS, client, seed  # noqa: E402
+from cosmos_standin import StandInContainer  # noqa: E402
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {"p50_ms": round(statistics.median(timings), 3), "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--nda-words", type=int, default=4000)
+    parser.add_argument("--round-trip-ms", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    container = StandInContainer(round_trip_ms=args.round_trip_ms)
+    seed(container, 20, 5, 0, 0, rng)
+    history = client(CosmosConversationClient, container)
+    conversations = [(user_id, item["id"]) for user_id, items in container.partitions.items() for item in items.values()]
+    tool_content = " ".join(rng.choice(NDA_WORDS) for _ in range(args.nda_words))
+
+    def payload(conversation_id):
+        return {
+            "conversation_id": conversation_id,
+            "messages": [(str(uuid.uuid4()), {"role": "tool", "content": tool_content}),
+                         (str(uuid.uuid4()), {"role": "assistant", "content": "The NDA conforms to the template."})],
+            "created_at": datetime.utcnow().isoformat()
+        }
+
+    def write_messages(user_id, body):
+        history.create_messages(body["conversation_id"], user_id, [tuple(message) for message in body["messages"]], created_at=body["created_at"])
+
+    direct = []
+    for _ in range(args.writes):
+        user_id, conversation_id = rng.choice(conversations)
+        start = time.perf_counter()
+        write_messages(user_id, payload(conversation_id))
+        direct.append((time.perf_counter() - start) * 1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        queue = HistoryWriteQueue(path=os.path.join(directory, "queue.sqlite3"), handlers={"create_messages": write_messages}, poll_interval=0.05)
+        queued = []
+        start_all = time.perf_counter()
+        for _ in range(args.writes):
+            user_id, conversation_id = rng.choice(conversations)
+            start = time.perf_counter()
+            queue.enqueue("create_messages", user_id, payload(conversation_id))
+            queued.append((time.perf_counter() - start) * 1000)
+        depth_after_enqueue = queue.stats()["depth"]
+        queue.flush(timeout=600)
+        drained_ms = (time.perf_counter() - start_all) * 1000
+        stats = queue.stats()
+        queue.close()
+
+    print(json.dumps({
+        "direct": percentiles(direct),
+        "queued": dict(percentiles(queued), depth_after_enqueue=depth_after_enqueue, drained_after_ms=round(drained_ms, 1), queue=stats)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compare request units, payload and latency of rename and feedback writes before and after patching.
+
+    python benchmarks/bench_history_writes.py --users 50 --runs 30
+
+Runs against the in-memory stand-in in cosmos_standin.py, whose cost model is described
+there. `before` reads the whole document and upserts it back with the changed field,
+`after` is the current CosmosConversationClient, which sends one patch operation.
+`request_bytes_per_call` is the body the client uploads.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.history.cosmosdbservice import CosmosConversationClient  # noqa: E402
+from bench_history_queries import client, seed  # noqa: E402
+from cosmos_standin import StandInContainer  # noqa: E402
+
+
+class ReadModifyWrite(CosmosConversationClient):
+    """Rename and feedback as they were: read the whole document, then upsert all of it."""
+
+    def rename_conversation(self, user_id, conversation_id, title, etag=None):
+        with self.request_stats.track("rename_conversation") as call:
+            conversation = self.container_client.read_item(item=conversation_id, partition_key=user_id, response_hook=call.hook)
+            conversation['title'] = title
+            call.sent(conversation)
+            return self.container_client.upsert_item(conversation, response_hook=call.hook)
+
+    def update_message_feedback(self, user_id, message_id, feedback, etag=None):
+        with self.request_stats.track("update_message_feedback") as call:
+            message = self.container_client.read_item(item=message_id, partition_key=user_id, response_hook=call.hook)
+            message['feedback'] = feedback
+            call.sent(message)
+            return self.container_client.upsert_item(message, response_hook=call.hook)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--nda-words", type=int, default=4000)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for name, cls in (("before", ReadModifyWrite), ("after", CosmosConversationClient)):
+        rng = random.Random(args.seed)
+        container = StandInContainer(round_trip_ms=args.round_trip_ms)
+        seed(container, args.users, args.conversations, args.messages, args.nda_words, rng)
+        history = client(cls, container)
+        items = [(user_id, item) for user_id, documents in container.partitions.items() for item in documents.values()]
+        conversations = [(user_id, item["id"]) for user_id, item in items if item["type"] == "conversation"]
+        ## feedback is given on answers, which are stored next to the tool message with the NDA text
+        answers = [(user_id, item["id"]) for user_id, item in items if item.get("role") == "assistant"]
+        for run in range(args.runs):
+            history.rename_conversation(*rng.choice(conversations), f"Renamed {run}")
+            history.update_message_feedback(*rng.choice(answers), rng.choice(["positive", "negative"]))
+        results[name] = history.request_stats.stats()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Compare the sync and gevent gunicorn worker classes on concurrent /conversation streams.
+
+A fake Azure OpenAI endpoint streams a fixed number of tokens with a per-token delay, the app
+is started under gunicorn with each worker class in turn and the same number of workers, and
+a pool of clients opens concurrent streaming /conversation requests against it.
+
+    python benchmarks/bench_serving.py --concurrency 200 --workers 2
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_upstream_handler(tokens, token_delay):
+    class FakeAzureOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i in range(tokens):
+                chunk = {
+                    "id": "bench",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": "gpt-35-turbo",
+                    "choices": [{"index": 0, "finish_reason": None, "delta": {"content": f"tok{i} "}}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return FakeAzureOpenAIHandler
+
+
+def start_app(worker_class, workers, port, upstream_port):
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{upstream_port}/",
+        "AZURE_OPENAI_MODEL_GPT3": "bench",
+        "AZURE_OPENAI_KEY_GPT3": "bench",
+        "AZURE_OPENAI_MODEL_NAME_GPT3": "gpt-35-turbo-16k",
+        "AZURE_OPENAI_STREAM": "true",
+        "AZURE_SEARCH_SERVICE": "",
+        "AZURE_COSMOSDB_ACCOUNT": "",
+        "GUNICORN_WORKER_CLASS": worker_class,
+        "GUNICORN_WORKERS": str(workers),
+    })
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/frontend_settings", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def run_stream(port):
+    body = {"messages": [{"role": "user", "content": "hello"}], "selectedGPTVersion": "GPT 3.5"}
+    start = time.perf_counter()
+    first_byte = None
+    with requests.post(f"http://127.0.0.1:{port}/conversation", json=body, stream=True, timeout=300) as r:
+        for chunk in r.iter_content(chunk_size=None):
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - start
+    return first_byte or 0.0, time.perf_counter() - start
+
+
+def bench(worker_class, args, upstream_port):
+    port = free_port()
+    proc = start_app(worker_class, args.workers, port, upstream_port)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda _: run_stream(port), range(args.concurrency)))
+        wall = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    ttfb = sorted(r[0] for r in results)
+    total = sorted(r[1] for r in results)
+    return {
+        "worker_class": worker_class,
+        "streams": len(results),
+        "wall_s": round(wall, 2),
+        "streams_per_s": round(len(results) / wall, 2),
+        "ttfb_p50_s": round(statistics.median(ttfb), 3),
+        "ttfb_p95_s": round(ttfb[int(len(ttfb) * 0.95) - 1], 3),
+        "latency_p50_s": round(statistics.median(total), 3),
+        "latency_p95_s": round(total[int(len(total) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--worker-classes", default="sync,gevent")
+    args = parser.parse_args()
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), make_upstream_handler(args.tokens, args.token_delay))
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+    try:
+        for worker_class in args.worker_classes.split(","):
+            print(json.dumps(bench(worker_class, args, upstream.server_address[1])))
+    finally:
+        upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
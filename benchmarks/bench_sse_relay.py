@@ -0,0 +1,97 @@
+"""Measure per-token CPU cost of stream_with_data with and without the SSE relay fast path.
+
+The upstream response is simulated in memory: the legacy path gets the same bytes through
+iter_lines(chunk_size=10), the relay path through large chunked reads.
+
+    python benchmarks/bench_sse_relay.py --tokens 2000 --streams 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def build_payload(tokens):
+    lines = [
+        {"id": "b", "model": "gpt-4", "created": 1, "object": "extensions.chat.completion.chunk",
+         "choices": [{"index": 0, "delta": {"role": "assistant"}, "end_turn": False}]}
+    ]
+    for i in range(tokens):
+        lines.append({"id": "b", "model": "gpt-4", "created": 1, "object": "extensions.chat.completion.chunk",
+                      "choices": [{"index": 0, "delta": {"content": f" clause{i}"}, "end_turn": False}]})
+    lines.append({"id": "b", "model": "gpt-4", "created": 1, "object": "extensions.chat.completion.chunk",
+                  "choices": [{"index": 0, "delta": {}, "end_turn": True}]})
+    return "".join(f"data: {json.dumps(line)}\n\n" for line in lines).encode("utf-8")
+
+
+class FakeRaw():
+    chunked = True
+
+
+class FakeResponse():
+    headers = {"apim-request-id": "bench"}
+    raw = FakeRaw()
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.payload), chunk_size):
+            yield self.payload[i:i + chunk_size]
+
+    def iter_lines(self, chunk_size):
+        pending = b""
+        for chunk in self.iter_content(chunk_size):
+            pending += chunk
+            lines = pending.splitlines()
+            pending = lines.pop() if lines and not pending.endswith(b"\n") else b""
+            yield from lines
+        if pending:
+            yield pending
+
+
+def run(payload, streams, relay, tokens):
+    app.SHOULD_RELAY_STREAM = relay
+
+    @contextmanager
+    def fake_post(*args, **kwargs):
+        yield FakeResponse(payload)
+
+    app.http_clients.post = fake_post
+    first_bytes = []
+    start = time.process_time()
+    for _ in range(streams):
+        stream_start = time.perf_counter()
+        output = app.stream_with_data({}, {}, "http://bench", "bench", {})
+        next(output)
+        first_bytes.append(time.perf_counter() - stream_start)
+        for _ in output:
+            pass
+    cpu = time.process_time() - start
+    return {
+        "mode": "relay" if relay else "legacy",
+        "cpu_us_per_token": round(cpu / (streams * tokens) * 1e6, 2),
+        "ttfb_ms": round(sum(first_bytes) / len(first_bytes) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--streams", type=int, default=50)
+    args = parser.parse_args()
+
+    app.AZURE_OPENAI_PREVIEW_API_VERSION = "2023-08-01-preview"
+    payload = build_payload(args.tokens)
+    for relay in (False, True):
+        print(json.dumps(run(payload, args.streams, relay, args.tokens)))
+
+
+if __name__ == "__main__":
+    main()
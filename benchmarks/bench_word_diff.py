@@ -0,0 +1,106 @@
+"""Time the clause-anchored word-level redline on generated long agreements.
+
+    python benchmarks/bench_word_diff.py --pages 30 --edits 80 --runs 20
+
+`ms_*` time the full redline (clause split, alignment and per-clause diffs);
+`unanchored_diff_ms_median` times the Myers diff alone over both whole documents.
+
+A page is about 500 words. The agreement is the template with word substitutions,
+insertions, deletions, a few reordered clauses and one dropped clause.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.validation.redline import diff_tokens, format_diff_context, redline, tokenize  # noqa: E402
+
+WORDS_PER_PAGE = 500
+VOCABULARY = ("the receiving party shall disclosing confidential information within days notice written "
+              "return destroy copies agreement obligations affiliates recipients law arbitration term years "
+              "immediately promptly reasonable efforts purpose evaluation business relationship third").split()
+
+
+def build_template(pages, rng):
+    clauses = []
+    words = 0
+    while words < pages * WORDS_PER_PAGE:
+        body = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(60, 140))).capitalize() + "."
+        clauses.append([f"{len(clauses) + 1}. Clause heading {len(clauses) + 1}", body])
+        words += len(body.split())
+    return clauses
+
+
+def build_agreement(template, edits, rng):
+    clauses = [[heading, body.split()] for heading, body in template]
+    for _ in range(edits):
+        words = rng.choice(clauses)[1]
+        position = rng.randrange(len(words))
+        action = rng.random()
+        if action < 0.6:
+            words[position] = rng.choice(VOCABULARY)
+        elif action < 0.8:
+            words.insert(position, rng.choice(VOCABULARY))
+        elif len(words) > 1:
+            del words[position]
+    del clauses[rng.randrange(len(clauses))]
+    for _ in range(3):
+        i, j = rng.randrange(len(clauses)), rng.randrange(len(clauses))
+        clauses[i], clauses[j] = clauses[j], clauses[i]
+    return [[heading, " ".join(words)] for heading, words in clauses]
+
+
+def as_text(clauses):
+    return "\n".join(f"{heading}\n{body}" for heading, body in clauses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--edits", type=int, default=80)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    template = build_template(args.pages, rng)
+    template_text = as_text(template)
+    agreement_text = as_text(build_agreement(template, args.edits, rng))
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = redline(template_text, agreement_text)
+        timings.append((time.perf_counter() - start) * 1000)
+    context = format_diff_context(result)
+
+    ## the diff engine alone on the whole documents, without clause anchoring
+    template_tokens = [token for token, _, _ in tokenize(template_text)]
+    agreement_tokens = [token for token, _, _ in tokenize(agreement_text)]
+    engine_timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        diff_tokens(template_tokens, agreement_tokens)
+        engine_timings.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "pages": args.pages,
+        "template_words": len(template_text.split()),
+        "agreement_words": len(agreement_text.split()),
+        "clauses": result["summary"]["clauses"],
+        "changed_clauses": result["summary"]["changed"],
+        "ms_median": round(statistics.median(timings), 2),
+        "ms_max": round(max(timings), 2),
+        "unanchored_diff_ms_median": round(statistics.median(engine_timings), 2),
+        "agreement_chars": len(agreement_text),
+        "diff_context_chars": len(context)
+    }))
+
+
+if __name__ == "__main__":
+    main()
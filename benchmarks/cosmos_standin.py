@@ -0,0 +1,294 @@
+"""In-memory stand-in for a Cosmos DB container, used by the history benchmarks.
+
+It implements the container methods the history service calls, charges request units
+with a simple cost model and sleeps for a simulated network round trip, so the RU and
+latency figures reported through `response_hook` can be compared before and after a
+change without an account or the emulator. The numbers are a model, not a measurement:
+
+- a point read costs 1 RU per started KB of the item;
+- a query costs 2.3 RU for every physical partition it visits, plus 0.1 RU per started KB
+  of every document it loads; a partition-scoped query visits one physical partition, a
+  cross-partition query fans out to all of them, one round trip each;
+- a write costs 5.5 RU per started KB plus 0.01 RU per indexed term; terms under a path the
+  indexing policy excludes are not indexed; a patch is charged as a write of the patched
+  document, so it saves the read and the upload, not the write itself;
+- a filtered query sorted on another property reads the sort index for every matching
+  document, 0.02 RU each, unless its ORDER BY is served by a composite index; an ORDER BY on
+  several properties without a matching composite index is rejected, as Cosmos does;
+- a paged query (`by_page`) charges each page for the documents on that page only;
+- every round trip sleeps `round_trip_ms` plus the response size over `bytes_per_ms`.
+"""
+import json
+import math
+import operator
+import re
+import time
+import zlib
+
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
+
+SYSTEM_FIELDS = ("_rid", "_self", "_etag", "_attachments", "_ts")
+QUERY = re.compile(
+    r"SELECT\s+(?P<fields>.+?)\s+FROM\s+c(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>c\.\w+(?:\s+(?:ASC|DESC))?(?:\s*,\s*c\.\w+(?:\s+(?:ASC|DESC))?)*))?"
+    r"(?:\s+OFFSET\s+(?P<offset>\d+)\s+LIMIT\s+(?P<limit>\d+))?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+CONDITION = re.compile(r"c\.(?P<field>\w+)\s*(?P<operator>>=|<=|=|>|<)\s*(?:@(?P<parameter>\w+)|'(?P<literal>[^']*)')")
+CONTAINS = re.compile(r"ARRAY_CONTAINS\(@(?P<parameter>\w+),\s*c\.(?P<field>\w+)\)", re.IGNORECASE)
+UNDEFINED = re.compile(r"NOT IS_DEFINED\(c\.(?P<field>\w+)\)", re.IGNORECASE)
+OPERATORS = {"=": operator.eq, ">": operator.gt, "<": operator.lt, ">=": operator.ge, "<=": operator.le}
+TERM = re.compile(r"\w+")
+SORT_KEY = re.compile(r"c\.(?P<field>\w+)(?:\s+(?P<direction>ASC|DESC))?", re.IGNORECASE)
+DEFAULT_INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [{"path": '/"_etag"/?'}]
+}
+TYPE_FILTER = re.compile(r"FROM c WHERE c\.type = '(?P<type>\w+)'(?P<live> AND NOT IS_DEFINED\(c\.deleted\))?")
+
+
+def _kb(document) -> int:
+    return max(math.ceil(len(json.dumps(document)) / 1024), 1)
+
+
+def _indexed_terms(value, excluded=()) -> int:
+    if isinstance(value, dict):
+        return sum(_indexed_terms(item) for key, item in value.items() if key not in SYSTEM_FIELDS and key not in excluded)
+    if isinstance(value, list):
+        return sum(_indexed_terms(item) for item in value)
+    if isinstance(value, str):
+        return len(TERM.findall(value))
+    return 1
+
+
+class StandInContainer():
+    """Items of one container, partitioned by `userId`."""
+
+    def __init__(self, physical_partitions: int = 8, round_trip_ms: float = 2.0, bytes_per_ms: float = 50000):
+        self.physical_partitions = physical_partitions
+        self.round_trip_ms = round_trip_ms
+        self.bytes_per_ms = bytes_per_ms
+        self.partitions = {}
+        self.response_bytes = 0
+        self.indexing_policy = dict(DEFAULT_INDEXING_POLICY)
+        self.default_ttl = None
+
+    def _write_charge(self, document) -> float:
+        ## only top-level excluded paths such as /content/? are modelled
+        excluded = [path["path"].strip("/").rstrip("?").rstrip("/").strip('"') for path in self.indexing_policy.get("excludedPaths", [])]
+        return 5.5 * _kb(document) + 0.01 * _indexed_terms(document, excluded)
+
+    def _composite_index(self, sort_keys) -> bool:
+        ## a composite index serves an ORDER BY in its own order or fully reversed
+        wanted = [(field, direction) for field, direction in sort_keys]
+        reversed_wanted = [(field, "descending" if direction == "ascending" else "ascending") for field, direction in sort_keys]
+        for composite in self.indexing_policy.get("compositeIndexes", []):
+            paths = [(path["path"].strip("/"), path.get("order", "ascending")) for path in composite]
+            if paths in (wanted, reversed_wanted):
+                return True
+        return False
+
+    def seed(self, item: dict):
+        """Store an item without charging for it."""
+        self.partitions.setdefault(item["userId"], {})[item["id"]] = dict(item, _etag=f'"{time.monotonic_ns()}"')
+
+    def _physical_partition(self, partition_key) -> int:
+        return zlib.crc32(str(partition_key).encode()) % self.physical_partitions
+
+    def _respond(self, charge: float, body, response_hook):
+        size = len(json.dumps(body))
+        self.response_bytes += size
+        time.sleep((self.round_trip_ms + size / self.bytes_per_ms) / 1000)
+        if response_hook:
+            response_hook({"x-ms-request-charge": str(round(charge, 2))}, body)
+        return body
+
+    def read(self, response_hook=None, **kwargs):
+        properties = {"id": "conversations", "partitionKey": {"paths": ["/userId"], "kind": "Hash"}, "indexingPolicy": self.indexing_policy}
+        if self.default_ttl is not None:
+            properties["defaultTtl"] = self.default_ttl
+        return self._respond(1.0, properties, response_hook)
+
+    def read_item(self, item, partition_key, response_hook=None, **kwargs):
+        document = self.partitions.get(partition_key, {}).get(item)
+        if document is None:
+            self._respond(1.0, {}, response_hook)
+            raise CosmosResourceNotFoundError(message=f"Entity with the specified id {item} does not exist in the system.")
+        return self._respond(_kb(document), dict(document), response_hook)
+
+    def upsert_item(self, body, response_hook=None, **kwargs):
+        self.seed(body)
+        return self._respond(self._write_charge(body), dict(self.partitions[body["userId"]][body["id"]]), response_hook)
+
+    def delete_item(self, item, partition_key, response_hook=None, **kwargs):
+        document = self.partitions.get(partition_key, {}).pop(item, None)
+        if document is None:
+            raise CosmosResourceNotFoundError(message=f"Entity with the specified id {item} does not exist in the system.")
+        self._respond(self._write_charge(document), None, response_hook)
+
+    def patch_item(self, item, partition_key, patch_operations, filter_predicate=None, etag=None, match_condition=None, response_hook=None, **kwargs):
+        document = self.partitions.get(partition_key, {}).get(item)
+        if document is None:
+            self._respond(1.0, {}, response_hook)
+            raise CosmosResourceNotFoundError(message=f"Entity with the specified id {item} does not exist in the system.")
+        predicate = TYPE_FILTER.fullmatch(filter_predicate) if filter_predicate else None
+        if (etag and etag != document["_etag"]) or (predicate and (document.get("type") != predicate.group("type")
+                                                                  or predicate.group("live") and "deleted" in document)):
+            self._respond(1.0, {}, response_hook)
+            raise CosmosAccessConditionFailedError(message="One of the specified pre-condition is not met.")
+        for patch in patch_operations:
+            document[patch["path"].strip("/")] = patch["value"]
+        self.seed(document)
+        return self._respond(self._write_charge(document), dict(self.partitions[partition_key][item]), response_hook)
+
+    def execute_item_batch(self, batch_operations, partition_key, response_hook=None, **kwargs):
+        results = []
+        charge = 0.0
+        for operation, arguments in batch_operations:
+            if operation == "upsert":
+                item = arguments[0]
+                self.seed(item)
+                charge += self._write_charge(item)
+                results.append({"resourceBody": dict(self.partitions[partition_key][item["id"]])})
+            elif operation == "delete":
+                document = self.partitions[partition_key].pop(arguments[0])
+                charge += self._write_charge(document)
+                results.append({"statusCode": 204})
+            elif operation == "patch":
+                item_id, operations = arguments[0], arguments[1]
+                document = self.partitions[partition_key][item_id]
+                for patch in operations:
+                    document[patch["path"].strip("/")] = patch["value"]
+                self.seed(document)
+                charge += self._write_charge(document)
+                results.append({"resourceBody": dict(self.partitions[partition_key][item_id])})
+            else:
+                raise NotImplementedError(f"Batch operation {operation} is not supported by the stand-in")
+        self._respond(charge, results, response_hook)
+        return results
+
+    def query_items(self, query, parameters=None, partition_key=None, enable_cross_partition_query=None, response_hook=None, **kwargs):
+        match = QUERY.match(query.strip())
+        if not match:
+            raise NotImplementedError(f"Query not supported by the stand-in: {query}")
+        values = {parameter["name"].lstrip("@"): parameter["value"] for parameter in parameters or []}
+        conditions = []
+        undefined = []
+        contained = []
+        for condition in re.split(r"\s+AND\s+", match.group("where") or "", flags=re.IGNORECASE):
+            if not condition.strip():
+                continue
+            parsed = CONDITION.fullmatch(condition.strip())
+            if not parsed and CONTAINS.fullmatch(condition.strip()):
+                contains = CONTAINS.fullmatch(condition.strip())
+                contained.append((contains.group("field"), set(values[contains.group("parameter")])))
+                continue
+            if not parsed and UNDEFINED.fullmatch(condition.strip()):
+                undefined.append(UNDEFINED.fullmatch(condition.strip()).group("field"))
+                continue
+            if not parsed:
+                raise NotImplementedError(f"Condition not supported by the stand-in: {condition}")
+            value = values[parsed.group("parameter")] if parsed.group("parameter") else parsed.group("literal")
+            conditions.append((parsed.group("field"), OPERATORS[parsed.group("operator")], value))
+
+        if partition_key is not None:
+            visited = [self._physical_partition(partition_key)]
+            documents = list(self.partitions.get(partition_key, {}).values())
+        elif enable_cross_partition_query:
+            visited = list(range(self.physical_partitions))
+            documents = [document for items in self.partitions.values() for document in items.values()]
+        else:
+            raise ValueError("Cross partition query is required but disabled")
+
+        matched = [document for document in documents
+                   if all(field in document and compare(document[field], value) for field, compare, value in conditions) and not any(field in document for field in undefined)
+                   and all(document.get(field) in allowed for field, allowed in contained)]
+        sort_charge = 0.0
+        if match.group("order"):
+            sort_keys = [(key.group("field"), "descending" if (key.group("direction") or "ASC").upper() == "DESC" else "ascending")
+                         for key in SORT_KEY.finditer(match.group("order"))]
+            composite = self._composite_index(sort_keys)
+            if len(sort_keys) > 1 and not composite:
+                raise ValueError("The order by query does not have a corresponding composite index that it can be served from.")
+            if conditions and not composite:
+                sort_charge = 0.02 * len(matched)
+            for field, direction in reversed(sort_keys):
+                matched.sort(key=lambda document: document.get(field) or "", reverse=direction == "descending")
+        if match.group("offset"):
+            ## skipped documents are still loaded, so deep pages cost as much as everything before them
+            loaded = matched[:int(match.group("offset")) + int(match.group("limit"))]
+            matched = loaded[int(match.group("offset")):]
+        else:
+            loaded = matched
+
+        fields = match.group("fields").strip()
+        if fields == "*":
+            rows = [dict(document) for document in matched]
+        else:
+            names = [field.strip()[2:] for field in fields.split(",")]
+            rows = [{name: document[name] for name in names if name in document} for document in matched]
+
+        return StandInQueryIterable(self, rows, loaded, visited, kwargs.get("max_item_count"), response_hook, sort_charge)
+
+
+class StandInQueryIterable():
+    """Query results, charged when they are iterated, whole or page by page like ItemPaged."""
+
+    def __init__(self, container, rows, loaded, visited, max_item_count, response_hook, sort_charge=0.0):
+        self.container = container
+        self.rows = rows
+        self.loaded = loaded
+        self.visited = visited
+        self.max_item_count = max_item_count or 100
+        self.response_hook = response_hook
+        self.sort_charge = sort_charge
+
+    def __iter__(self):
+        ## every visited physical partition is one round trip; the loading charge lands where the documents live
+        load_charge = 0.1 * sum(_kb(document) for document in self.loaded) + self.sort_charge
+        for position, _ in enumerate(self.visited):
+            last = position == len(self.visited) - 1
+            self.container._respond(2.3 + (load_charge if last else 0), self.rows if last else [], self.response_hook)
+        return iter(self.rows)
+
+    def by_page(self, continuation_token=None):
+        return StandInPages(self, int(continuation_token or 0))
+
+
+class StandInPages():
+    def __init__(self, results, start):
+        self.results = results
+        self.start = start
+        self.continuation_token = None
+        self.fetched = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        results = self.results
+        if self.fetched and self.continuation_token is None:
+            raise StopIteration
+        self.fetched = True
+        end = self.start + results.max_item_count
+        page = results.rows[self.start:end]
+        charge = 2.3 + 0.1 * sum(_kb(document) for document in results.loaded[self.start:end]) + results.sort_charge
+        results.container._respond(charge, page, results.response_hook)
+        self.start = end
+        self.continuation_token = str(end) if end < len(results.rows) else None
+        return iter(page)
+
+
+class StandInDatabase():
+    """The database calls `ensure` makes, for one stand-in container."""
+
+    def __init__(self, container: StandInContainer):
+        self.container = container
+
+    def replace_container(self, container, partition_key, indexing_policy=None, default_ttl=None, conflict_resolution_policy=None, **kwargs):
+        ## a replace is a PUT: settings left out are reset, as in Cosmos
+        self.container.indexing_policy = indexing_policy or dict(DEFAULT_INDEXING_POLICY)
+        self.container.default_ttl = default_ttl
+        return self.container
@@ -61,7 +61,8 @@ export const historyList = async (offset=0): Promise<Conversation[] | null> => {
                 id: conv.id,
                 title: conv.title,
                 date: conv.createdAt,
-                messages: convMessages
+                messages: convMessages,
+                etag: conv._etag ?? undefined
             };
             return conversation;
         }));
@@ -97,7 +98,9 @@ export const historyRead = async (convId: string): Promise<ChatMessage[]> => {
                     role: msg.role,
                     date: msg.createdAt,
                     content: msg.content,
-                    feedback: msg.feedback ?? undefined
+                    feedback: msg.feedback ?? undefined,
+                    contentRef: msg.contentRef ?? undefined,
+                    etag: msg.etag ?? undefined
                 }
                 messages.push(message)
             });
@@ -110,6 +113,30 @@ export const historyRead = async (convId: string): Promise<ChatMessage[]> => {
     return response
 }
 
+export const historyMessageContent = async (convId: string, messageId: string): Promise<string | null> => {
+    const response = await fetch("/history/message_content", {
+        method: "POST",
+        body: JSON.stringify({
+            conversation_id: convId,
+            message_id: messageId
+        }),
+        headers: {
+            "Content-Type": "application/json"
+        },
+    })
+    .then(async (res) => {
+        if(!res.ok){
+            return null
+        }
+        const payload = await res.json();
+        return payload?.content ?? null;
+    }).catch((err) => {
+        console.error("There was an issue fetching the message content.");
+        return null
+    })
+    return response
+}
+
 export const historyGenerate = async (options: ConversationRequest, abortSignal: AbortSignal, convId?: string): Promise<Response> => {
     let body;
     if(convId){
@@ -237,12 +264,14 @@ export const historyClear = async (convId: string) : Promise<Response> => {
     return response;
 }
 
-export const historyRename = async (convId: string, title: string) : Promise<Response> => {
+// with the etag of the last read the rename only applies if nobody changed the conversation since; 409 otherwise
+export const historyRename = async (convId: string, title: string, etag?: string) : Promise<Response> => {
     const response = await fetch("/history/rename", {
         method: "POST",
         body: JSON.stringify({
             conversation_id: convId,
-            title: title
+            title: title,
+            etag: etag
         }),
         headers: {
             "Content-Type": "application/json"
@@ -313,12 +342,13 @@ export const frontendSettings = async (): Promise<Response | null> => {
 
     return response
 }
-export const historyMessageFeedback = async (messageId: string, feedback: string): Promise<Response> => {
+export const historyMessageFeedback = async (messageId: string, feedback: string, etag?: string): Promise<Response> => {
     const response = await fetch("/history/message_feedback", {
         method: "POST",
         body: JSON.stringify({
             message_id: messageId,
-            message_feedback: feedback
+            message_feedback: feedback,
+            etag: etag
         }),
         headers: {
             "Content-Type": "application/json"
@@ -4,6 +4,7 @@ export type AskResponse = {
     error?: string;
     message_id?: string;
     feedback?: Feedback;
+    etag?: string;
 };
 
 export type Citation = {
@@ -29,6 +30,8 @@ export type ChatMessage = {
     end_turn?: boolean;
     date: string;
     feedback?: Feedback;
+    contentRef?: string;
+    etag?: string;
 };
 
 export type Conversation = {
@@ -36,6 +39,7 @@ export type Conversation = {
     title: string;
     messages: ChatMessage[];
     date: string;
+    etag?: string;
 }
 
 export enum ChatCompletionType {
@@ -18,11 +18,15 @@ import { XSSAllowTags } from "../../constants/xssAllowTags";
 interface Props {
     answer: AskResponse;
     onCitationClicked: (citedDocument: Citation) => void;
+    onExpand?: () => void;
+    expandFailed?: boolean;
 }
 
 export const Answer = ({
     answer,
-    onCitationClicked
+    onCitationClicked,
+    onExpand,
+    expandFailed
 }: Props) => {
     const initializeAnswerFeedback = (answer: AskResponse) => {
         if (answer.message_id == undefined) return undefined;
@@ -40,8 +44,21 @@ export const Answer = ({
     const [isFeedbackDialogOpen, setIsFeedbackDialogOpen] = useState(false);
     const [showReportInappropriateFeedback, setShowReportInappropriateFeedback] = useState(false);
     const [negativeFeedbackList, setNegativeFeedbackList] = useState<Feedback[]>([]);
+    const [etag, setEtag] = useState(answer.etag);
     const appStateContext = useContext(AppStateContext)
     const FEEDBACK_ENABLED = appStateContext?.state.frontendSettings?.feedback_enabled; 
+
+    // feedback is only saved over the version of the message this answer was read with; 409 if it changed elsewhere
+    const saveFeedback = async (feedback: string) => {
+        if (answer.message_id == undefined) return;
+        const response = await historyMessageFeedback(answer.message_id, feedback, etag);
+        if (response.ok) {
+            const payload = await response.json();
+            setEtag(payload?.etag ?? undefined);
+        } else if (response.status === 409) {
+            console.error("The feedback was not saved because the message was changed elsewhere. Reload the conversation to rate it again.");
+        }
+    }
     
     const handleChevronClick = () => {
         setChevronIsExpanded(!chevronIsExpanded);
@@ -100,7 +117,7 @@ export const Answer = ({
         setFeedbackState(newFeedbackState);
 
         // Update message feedback in db
-        await historyMessageFeedback(answer.message_id, newFeedbackState);
+        await saveFeedback(newFeedbackState);
     }
 
     const onDislikeResponseClicked = async () => {
@@ -115,7 +132,7 @@ export const Answer = ({
             // Reset negative feedback to neutral
             newFeedbackState = Feedback.Neutral;
             setFeedbackState(newFeedbackState);
-            await historyMessageFeedback(answer.message_id, Feedback.Neutral);
+            await saveFeedback(Feedback.Neutral);
         }
         appStateContext?.dispatch({ type: 'SET_FEEDBACK_STATE', payload: { answerId: answer.message_id, feedback: newFeedbackState }});
     }
@@ -136,7 +153,7 @@ export const Answer = ({
 
     const onSubmitNegativeFeedback = async () => {
         if (answer.message_id == undefined) return;
-        await historyMessageFeedback(answer.message_id, negativeFeedbackList.join(","));
+        await saveFeedback(negativeFeedbackList.join(","));
         resetFeedbackDialog();
     }
 
@@ -236,6 +253,19 @@ export const Answer = ({
                         </Stack>
                     </Stack.Item>
                 )}
+                {onExpand && (
+                    <Stack.Item onKeyDown={e => e.key === "Enter" || e.key === " " ? onExpand?.() : null}>
+                        <Text
+                            className={styles.accordionTitle}
+                            onClick={onExpand}
+                            aria-label="Show the full answer and references"
+                            tabIndex={0}
+                            role="button"
+                        >
+                            <span>{expandFailed ? "The full text could not be loaded, try again" : "Show full text"}</span>
+                        </Text>
+                    </Stack.Item>
+                )}
                 <Stack.Item className={styles.answerDisclaimerContainer}>
                     <span className={styles.answerDisclaimer}>AI-generated content may be incorrect</span>
                 </Stack.Item>
@@ -124,9 +124,9 @@ export const ChatHistoryListItemCell: React.FC<ChatHistoryListItemCellProps> = (
             return
         }
         setRenameLoading(true)
-        let response = await historyRename(item.id, editTitle);
+        let response = await historyRename(item.id, editTitle, item.etag);
         if(!response.ok){
-            setErrorRename("Error: could not rename item")
+            setErrorRename(response.status === 409 ? "Error: this conversation was changed elsewhere, reload it to rename" : "Error: could not rename item")
             setTimeout(() => {
                 setTextFieldFocused(true);
                 setErrorRename(undefined);
@@ -137,7 +137,8 @@ export const ChatHistoryListItemCell: React.FC<ChatHistoryListItemCellProps> = (
         }else{
             setRenameLoading(false)
             setEdit(false)
-            appStateContext?.dispatch({ type: 'UPDATE_CHAT_TITLE', payload: { ...item, title: editTitle } as Conversation })
+            const renamed = await response.json();
+            appStateContext?.dispatch({ type: 'UPDATE_CHAT_TITLE', payload: { ...item, title: editTitle, etag: renamed?._etag ?? undefined } as Conversation })
             setEditTitle("");
         }
     }
@@ -28,6 +28,7 @@ import {
     historyGenerate,
     historyUpdate,
     historyClear,
+    historyMessageContent,
     ChatHistoryLoadingState,
     CosmosDBStatus,
     ErrorMessage
@@ -57,6 +58,9 @@ const Chat = () => {
     const abortFuncs = useRef([] as AbortController[]);
     const [showAuthMessage, setShowAuthMessage] = useState<boolean>(true);
     const [messages, setMessages] = useState<ChatMessage[]>([])
+    // full bodies of offloaded messages the user expanded, by message id; the messages themselves keep their preview
+    const [expandedContent, setExpandedContent] = useState<{ [messageId: string]: string }>({})
+    const [failedExpansions, setFailedExpansions] = useState<string[]>([])
     const [processMessages, setProcessMessages] = useState<messageStatus>(messageStatus.NotRunning);
     const [clearingChat, setClearingChat] = useState<boolean>(false);
     const [hideErrorDialog, { toggle: toggleErrorDialog }] = useBoolean(true);
@@ -370,6 +374,7 @@ const Chat = () => {
                 abortFuncs.current = abortFuncs.current.filter(a => a !== abortController);
                 return;
             } else {
+                // offloaded messages are resent as their preview and contentRef; the server puts the full bodies back
                 conversation.messages.push(userMessage);
                 request = {
                     messages: [...conversation.messages.filter((answer) => answer.role !== ERROR)],
@@ -589,8 +594,35 @@ const Chat = () => {
         } else {
             setMessages([])
         }
+        setExpandedContent({})
+        setFailedExpansions([])
     }, [appStateContext?.state.currentChat]);
 
+    // offloaded bodies are fetched only when the user expands the answer they belong to
+    const expandMessages = async (offloaded: ChatMessage[]) => {
+        const conversationId = appStateContext?.state.currentChat?.id;
+        if (!conversationId) return;
+        const contents = await Promise.all(offloaded.map((msg) => historyMessageContent(conversationId, msg.id)));
+        const loaded: { [messageId: string]: string } = {};
+        offloaded.forEach((msg, index) => {
+            const content = contents[index];
+            if (content !== null) {
+                loaded[msg.id] = content;
+            }
+        });
+        setExpandedContent((expanded) => ({ ...expanded, ...loaded }));
+        const failed = offloaded.filter((msg) => loaded[msg.id] === undefined).map((msg) => msg.id);
+        setFailedExpansions((previous) => [...previous.filter((id) => !offloaded.some((msg) => msg.id === id)), ...failed]);
+    }
+
+    const displayedMessage = (message: ChatMessage) => {
+        return message && expandedContent[message.id] !== undefined ? { ...message, content: expandedContent[message.id] } : message;
+    }
+
+    const collapsedMessages = (answer: ChatMessage, index: number) => {
+        return [answer, messages[index - 1]].filter((msg) => msg?.contentRef && expandedContent[msg.id] === undefined);
+    }
+
     useLayoutEffect(() => {
         const saveToDB = async (messages: ChatMessage[], id: string) => {
             const response = await historyUpdate(messages, id)
@@ -749,12 +781,15 @@ const Chat = () => {
                                             answer.role === "assistant" ? <div className={styles.chatMessageGpt}>
                                                 <Answer
                                                     answer={{
-                                                        answer: answer.content,
-                                                        citations: parseCitationFromMessage(messages[index - 1]),
+                                                        answer: displayedMessage(answer).content,
+                                                        citations: parseCitationFromMessage(displayedMessage(messages[index - 1])),
                                                         message_id: answer.id,
-                                                        feedback: answer.feedback
+                                                        feedback: answer.feedback,
+                                                        etag: answer.etag
                                                     }}
                                                     onCitationClicked={c => onShowCitation(c)}
+                                                    onExpand={collapsedMessages(answer, index).length > 0 ? () => expandMessages(collapsedMessages(answer, index)) : undefined}
+                                                    expandFailed={collapsedMessages(answer, index).some((msg) => failedExpansions.includes(msg.id))}
                                                 />
                                             </div> : answer.role === ERROR ? <div className={styles.chatMessageError}>
                                                 <Stack horizontal className={styles.chatMessageErrorContent}>
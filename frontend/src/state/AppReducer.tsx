@@ -30,9 +30,10 @@ export const appStateReducer = (state: AppState, action: Action): AppState => {
                 if (chat.id === action.payload.id) {
                     if(state.currentChat?.id === action.payload.id){
                         state.currentChat.title = action.payload.title;
+                        state.currentChat.etag = action.payload.etag;
                     }
                     //TODO: make api call to save new title to DB
-                    return { ...chat, title: action.payload.title };
+                    return { ...chat, title: action.payload.title, etag: action.payload.etag };
                 }
                 return chat;
             });
@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 bind = "0.0.0.0"
 
@@ -6,4 +7,19 @@ timeout = 230
 # https://learn.microsoft.com/en-us/troubleshoot/azure/app-service/web-apps-performance-faqs#why-does-my-request-time-out-after-230-seconds
 
 num_cpus = multiprocessing.cpu_count()
-workers = (num_cpus * 2) + 1
\ No newline at end of file
+workers = (num_cpus * 2) + 1
+
+# Worker class: "sync" (default) pins a whole worker for the lifetime of every request,
+# including streamed completions. "gthread" serves GUNICORN_THREADS requests per worker.
+# "gevent" serves each request on a greenlet and makes the upstream Azure OpenAI, Blob and
+# Cosmos calls cooperative, so a single worker can hold hundreds of concurrent streams.
+# Request state (deployment, message ids) is not kept in module globals. Only "sync" and "gevent"
+# were load tested (benchmarks/bench_serving.py); "gthread" runs the shared SQLite connections and
+# cache counters on real threads and has not been verified.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync").lower()
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+if worker_class == "gevent":
+    workers = int(os.environ.get("GUNICORN_WORKERS", num_cpus + 1))
+    worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+elif os.environ.get("GUNICORN_WORKERS"):
+    workers = int(os.environ.get("GUNICORN_WORKERS"))
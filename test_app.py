@@ -1,6 +1,1284 @@
+import json
+
 from app import format_as_ndjson
 
 
 def test_format_as_ndjson():
     obj = {"message": "I ❤️ 🐍 \n and escaped newlines"}
     assert format_as_ndjson(obj) == '{"message": "I ❤️ 🐍 \\n and escaped newlines"}\n'
+
+
+def test_relay_envelope_matches_decoded_response():
+    from backend.upstream.sse_relay import NdjsonEnvelope, extract_content_delta, iter_sse_lines
+
+    chunk = 'data: {"id":"1","model":"gpt-4","created":1,"object":"chunk","choices":[{"index":0,"delta":{"content":"\\"Hi\\" ❤️\\n"},"end_turn":false}]}\n\n'
+    lines = [line for line in iter_sse_lines([chunk[:40].encode(), chunk[40:].encode()]) if line]
+    raw_content = extract_content_delta(lines[0])
+
+    response = {"id": "m", "model": "gpt-4", "created": 1, "object": "chunk", "choices": [{"messages": []}], "history_metadata": {}}
+    relayed = json.loads(NdjsonEnvelope(response).wrap(raw_content))
+    assert relayed["choices"][0]["messages"] == [{"role": "assistant", "content": '"Hi" ❤️\n'}]
+    assert relayed["history_metadata"] == {}
+
+    assert extract_content_delta(b'data: {"choices":[{"delta":{"role":"assistant"}}]}') is None
+    assert extract_content_delta(b'data: {"choices":[{"delta":{"content":"x"},"end_turn":true}]}') is None
+
+
+def test_mixed_deployments_are_resolved_per_request(monkeypatch):
+    import random
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+
+    import app as app_module
+    from backend.upstream.deployments import Deployment, DeploymentRegistry
+
+    registry = DeploymentRegistry(
+        deployments=[
+            Deployment(name="default", model="default", model_name="gpt-35-turbo-16k", key="default-key", resource="default"),
+            Deployment(name="GPT 3.5", model="gpt35", model_name="gpt-35-turbo-16k", key="gpt35-key", resource="gpt35"),
+            Deployment(name="GPT 4.0", model="gpt4", model_name="gpt-4", key="gpt4-key", resource="gpt4"),
+        ],
+        default="default"
+    )
+
+    def fake_create(**kwargs):
+        time.sleep(random.uniform(0, 0.01))
+        content = f"{kwargs['engine']}|{kwargs['api_key']}|{kwargs['api_base']}"
+        return SimpleNamespace(model=kwargs["engine"], created=0, object="chat.completion",
+                               choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(app_module, "deployments", registry)
+    monkeypatch.setattr(app_module, "SHOULD_STREAM", False)
+    monkeypatch.setattr(app_module, "should_use_data", lambda: False)
+    monkeypatch.setattr(app_module.openai.ChatCompletion, "create", fake_create)
+    client = app_module.app.test_client()
+
+    def ask(version):
+        body = {"messages": [{"role": "user", "content": "hi"}], "selectedGPTVersion": version}
+        return version, client.post("/conversation", json=body).get_json()
+
+    versions = ["GPT 3.5", "GPT 4.0"] * 50
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(ask, versions))
+
+    expected = {
+        "GPT 3.5": "gpt35|gpt35-key|https://gpt35.openai.azure.com/",
+        "GPT 4.0": "gpt4|gpt4-key|https://gpt4.openai.azure.com/",
+    }
+    ids = set()
+    for version, payload in results:
+        assert payload["choices"][0]["messages"][0]["content"] == expected[version]
+        ids.add(payload["id"])
+    assert len(ids) == len(versions)
+
+
+def test_blob_text_cache_revalidates_and_evicts():
+    from types import SimpleNamespace
+
+    from azure.core.exceptions import ResourceNotModifiedError
+
+    from backend.documents.blob_text_cache import BlobTextCache
+
+    class FakeBlobClient():
+        def __init__(self, blob_name, data, etag):
+            self.container_name = "templates"
+            self.blob_name = blob_name
+            self.data = data
+            self.etag = etag
+            self.downloads = 0
+
+        def download_blob(self, etag=None, match_condition=None):
+            if etag == self.etag:
+                raise ResourceNotModifiedError("not modified")
+            self.downloads += 1
+            return SimpleNamespace(readall=lambda: self.data, properties=SimpleNamespace(etag=self.etag))
+
+    cache = BlobTextCache(max_bytes=10, ttl_seconds=0)
+    template = FakeBlobClient("a.docx", b"abcdef", "1")
+    assert cache.fetch(template, bytes.decode).text == "abcdef"
+    assert cache.fetch(template, bytes.decode).text == "abcdef"
+    assert template.downloads == 1 and cache.revalidations == 1
+
+    template.data, template.etag = b"abc", "2"
+    assert cache.fetch(template, bytes.decode).text == "abc"
+    assert template.downloads == 2
+
+    cache.fetch(FakeBlobClient("b.docx", b"12345678", "1"), bytes.decode)
+    assert cache.evictions == 1 and cache.stats()["entries"] == 1
+
+
+def test_blob_name_index_pages_by_prefix():
+    from types import SimpleNamespace
+
+    from backend.documents.blob_index import BlobNameIndex
+
+    names = ["acme/nda-1.docx", "acme/nda-2.docx", "acme/nda-3.docx", "beta/nda.docx", "zeta.docx"]
+
+    class FakeContainerClient():
+        def list_blobs(self, results_per_page):
+            pages = [names[i:i + results_per_page] for i in range(0, len(names), results_per_page)]
+            return SimpleNamespace(by_page=lambda: ([SimpleNamespace(name=n) for n in page] for page in pages))
+
+    index = BlobNameIndex(get_container_client=FakeContainerClient, page_size=2)
+    index.refresh()
+
+    first, token = index.page(prefix="acme/", limit=2)
+    assert first == ["acme/nda-1.docx", "acme/nda-2.docx"]
+    rest, token = index.page(prefix="acme/", limit=2, continuation_token=token)
+    assert rest == ["acme/nda-3.docx"] and token is None
+    assert index.page()[0] == names
+
+
+def test_blob_name_list_rejects_bad_limits_and_never_serves_a_partial_list(monkeypatch):
+    import threading
+    import time
+    from types import SimpleNamespace
+
+    import pytest
+
+    import app as app_module
+    from backend.documents.blob_index import BlobIndexUnavailable, BlobNameIndex
+
+    listing = threading.Event()
+
+    class SlowContainerClient():
+        def list_blobs(self, results_per_page):
+            def pages():
+                yield [SimpleNamespace(name="acme/nda-1.docx")]
+                listing.wait(5)
+                yield [SimpleNamespace(name="beta/nda.docx")]
+            return SimpleNamespace(by_page=pages)
+
+    class FailingContainerClient():
+        def list_blobs(self, results_per_page):
+            raise RuntimeError("AuthorizationFailure")
+
+    index = BlobNameIndex(get_container_client=SlowContainerClient, refresh_seconds=60)
+    with pytest.raises(ValueError):
+        index.page(limit=0)
+    with pytest.raises(BlobIndexUnavailable):
+        index.page(timeout=0.1)
+    listing.set()
+    assert index.page(timeout=5) == (["acme/nda-1.docx", "beta/nda.docx"], None)
+
+    failing = BlobNameIndex(get_container_client=FailingContainerClient, refresh_seconds=60)
+    monkeypatch.setattr(app_module, "agreements_index", failing)
+    client = app_module.app.test_client()
+    assert client.get("/get_files?limit=0").status_code == 400
+    assert client.get("/get_files?limit=ten").status_code == 400
+    response = client.get("/get_files")
+    assert response.status_code == 503 and "AuthorizationFailure" in response.get_json()["error"]
+    assert failing.stats()["last_error"] == "AuthorizationFailure"
+
+    ## a failed first build is retried within seconds, not after the refresh interval
+    attempts = []
+    retried = threading.Event()
+
+    class FlakyContainerClient():
+        def list_blobs(self, results_per_page):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("ServerBusy")
+            retried.wait(5)
+            return SimpleNamespace(by_page=lambda: iter([[SimpleNamespace(name="acme/nda-1.docx")]]))
+
+    flaky = BlobNameIndex(get_container_client=FlakyContainerClient, refresh_seconds=300, retry_seconds=0.01)
+    with pytest.raises(BlobIndexUnavailable):
+        flaky.page(timeout=5)
+    retried.set()
+    deadline = time.time() + 5
+    while not flaky.stats()["complete"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert flaky.page() == (["acme/nda-1.docx"], None) and flaky.stats()["last_error"] is None
+
+
+def test_streaming_docx_extractor_keeps_tables_in_order():
+    from io import BytesIO
+
+    from docx import Document
+
+    from backend.documents.docx_text import extract_docx_text, extract_docx_text_python_docx
+
+    doc = Document()
+    doc.add_paragraph("1. Term\tup to 2 years")
+    table = doc.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text = "Signed by"
+    table.rows[0].cells[1].text = "PHX Pharma SE"
+    doc.add_paragraph("2. Governing law")
+    buffer = BytesIO()
+    doc.save(buffer)
+    data = buffer.getvalue()
+
+    assert extract_docx_text(data) == "1. Term\tup to 2 years\nSigned by | PHX Pharma SE\n2. Governing law"
+    assert extract_docx_text_python_docx(data) == "1. Term\tup to 2 years\n2. Governing law"
+
+
+def test_token_budget_keeps_newest_turns_and_reserves_answer():
+    from backend.validation.token_budget import TokenBudget
+
+    messages = [
+        {"role": "system", "content": "You are an experienced lawyer."},
+        {"role": "user", "content": "old question " * 400},
+        {"role": "assistant", "content": "template text " * 3000},
+        {"role": "user", "content": "Is clause 4 conforming?"},
+    ]
+    budget = TokenBudget("gpt-4", max_response_tokens=1000, max_context_tokens=3000)
+    fitted, breakdown = budget.fit(messages, functions=[{"name": "get_nda_template"}])
+
+    assert fitted[0] == messages[0]
+    assert fitted[-1] == messages[-1]
+    assert fitted[1]["role"] == "system" and breakdown["dropped_messages"] == 1
+    assert fitted[2]["content"].endswith("context window ...]") and breakdown["truncated_messages"] == 1
+    assert breakdown["prompt"] + breakdown["reserved_for_answer"] <= breakdown["context_window"]
+
+
+def test_batch_validation_streams_one_line_per_document(monkeypatch):
+    from types import SimpleNamespace
+
+    import app as app_module
+
+    template_reads = []
+
+    def fake_template(name):
+        template_reads.append(name)
+        return "TEMPLATE"
+
+    def fake_create(**kwargs):
+        agreement = kwargs["messages"][-1]["content"]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"checked {agreement[:40]}"))])
+
+    monkeypatch.setattr(app_module, "get_nda_template", fake_template)
+    monkeypatch.setattr(app_module, "get_nda_document", lambda name: name.upper())
+    monkeypatch.setattr(app_module.openai.ChatCompletion, "create", fake_create)
+    client = app_module.app.test_client()
+
+    documents = [f"nda-{i}.docx" for i in range(10)]
+    response = client.post("/validate/batch", json={"template": "template.docx", "documents": documents})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert template_reads == ["template.docx"]
+    assert sorted(line["document"] for line in lines[:-1]) == documents
+    assert all("NDA-" in line["content"] for line in lines[:-1])
+    assert lines[-1]["summary"]["documents"] == 10 and lines[-1]["summary"]["failed"] == 0
+    assert client.post("/validate/batch", json={"template": "t.docx"}).status_code == 400
+
+
+def test_closing_a_batch_cancels_the_documents_not_started():
+    import threading
+    import time
+
+    from backend.validation.batch import DeploymentConcurrencyLimiter, run_batch
+
+    started = []
+    release = threading.Event()
+
+    def validate(document):
+        started.append(document)
+        if len(started) > 1:
+            release.wait(5)
+        return {"content": "checked"}
+
+    results = run_batch([f"nda-{i}.docx" for i in range(20)], validate, DeploymentConcurrencyLimiter(limit=2), "default")
+    next(results)
+    ## the client went away after the first line, while the second validation is still running
+    closed_at = time.perf_counter()
+    results.close()
+    assert time.perf_counter() - closed_at < 1
+    release.set()
+    time.sleep(0.2)
+    assert len(started) <= 3
+
+
+def test_validation_result_cache_keys_and_evicts(tmp_path):
+    from backend.validation.result_cache import ValidationResultCache
+
+    cache = ValidationResultCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    messages = [{"id": "a", "date": "today", "role": "user", "content": "Validate"}]
+    key = ValidationResultCache.make_key("t1", "a1", "gpt4", "SYSTEM", messages)
+
+    assert key == ValidationResultCache.make_key("t1", "a1", "gpt4", "SYSTEM", [{"id": "b", "role": "user", "content": "Validate"}])
+    assert key != ValidationResultCache.make_key("t1", "a2", "gpt4", "SYSTEM", messages)
+    assert key != ValidationResultCache.make_key("t1", "a1", "gpt35", "SYSTEM", messages)
+    assert cache.get(key) is None
+
+    cache.put(key, "123456", "gpt4")
+    assert cache.get(key)["content"] == "123456"
+    cache.put("other", "abcdef", "gpt4")
+    assert cache.get(key) is None and cache.stats()["evictions"] == 1
+
+
+def test_clause_verdicts_are_reused_across_agreements(tmp_path):
+    from backend.validation.clause_verdicts import ClauseVerdictCache, validate_by_clause
+
+    template = "Return of Information\nThe Receiving Party shall return all information within 30 days.\nGoverning Law\nThis Agreement is governed by German law."
+    first = "1. Return of Information\nThe Receiving  Party shall return all information within 30 days.\n2. Governing Law\nThis Agreement is governed by the laws of Delaware."
+    second = "Governing Law\nThis agreement is governed by German law.\nReturn of Information\nThe receiving party shall return all information within 30 days."
+    judged = []
+
+    def judge(pairs):
+        judged.extend(clause.text for clause, _ in pairs)
+        return {clause.index: {"conforming": "delaware" not in clause.normalized, "explanation": ""} for clause, _ in pairs}
+
+    cache = ClauseVerdictCache(str(tmp_path / "cache.sqlite3"))
+    report = validate_by_clause(template, first, judge, cache, "v1")
+    assert [clause["conforming"] for clause in report["clauses"]] == [True, False]
+    assert report["cache"]["hit_ratio"] == 0.0
+
+    report = validate_by_clause(template, second, judge, cache, "v1")
+    assert report["cache"] == {"clauses": 2, "hits": 1, "misses": 1, "judged": 1, "hit_ratio": 0.5}
+    assert report["clauses"][1]["cached"] and report["clauses"][1]["template_heading"] == "Return of Information"
+    assert len(judged) == 3
+
+    assert validate_by_clause(template, second, judge, cache, "v2")["cache"]["hits"] == 0
+
+
+def test_prescreen_extracts_general_rule_findings():
+    from backend.validation.prescreen import prescreen
+
+    agreement = (
+        "This Agreement shall remain in force for a period of three (3) years.\n"
+        "Upon written notice the Receiving Party shall destroy all Confidential Information within thirty (30) days, "
+        "except for copies kept in mandatory backups.\n"
+        "This Agreement is governed by the laws of the State of Delaware.\n"
+        "Disputes shall be settled by arbitration in Zurich.\n"
+        "No penalty or liquidated damages shall apply."
+    )
+    findings = {finding["rule"]: finding for finding in prescreen(agreement)["findings"]}
+
+    assert findings["term"]["status"] == "fail" and findings["term"]["value"] == 36
+    assert findings["return_destruction"]["status"] == "pass" and findings["return_destruction"]["value"] == 30
+    assert findings["governing_law"]["status"] == "fail" and findings["governing_law"]["value"] == "Delaware"
+    assert findings["arbitration_seat"]["status"] == "pass"
+    assert findings["penalties"]["status"] == "pass"
+
+
+def test_redline_marks_single_word_changes():
+    from backend.validation.redline import format_diff_context, redline
+
+    template = "Return of Information\nThe Receiving Party shall immediately return all information.\nTerm\nThis Agreement ends after two years."
+    agreement = "Term\nThis Agreement ends after two years.\nReturn of Information\nThe Receiving Party shall promptly return all information."
+    result = redline(template, agreement)
+
+    assert [clause["status"] for clause in result["clauses"]] == ["identical", "changed"]
+    ops = [(op["op"], op["text"].strip()) for op in result["clauses"][1]["ops"] if op["op"] != "equal"]
+    assert ops == [("delete", "immediately"), ("insert", "promptly")]
+    assert "[-immediately-] [+promptly+]" in format_diff_context(result)
+
+
+def test_template_clause_index_aligns_reordered_clauses():
+    from backend.validation.clause_alignment import TemplateClauseIndex
+    from backend.validation.clauses import split_clauses
+
+    template = split_clauses(
+        "1. Confidential Information means all technical and commercial information disclosed by a party.\n"
+        "2. The Receiving Party shall return or destroy the Confidential Information within thirty days.\n"
+        "3. This Agreement is governed by German law and disputes are settled by arbitration in Vienna."
+    )
+    agreement = split_clauses(
+        "1. This agreement shall be governed by German law; disputes are settled by arbitration in Zurich.\n"
+        "2. Confidential Information means any technical or commercial information disclosed by either party.\n"
+        "3. The Receiving Party shall pay liquidated damages of EUR 100,000 for each breach."
+    )
+    aligned = TemplateClauseIndex(template).align(agreement)
+
+    assert [template_clause.index if template_clause else None for template_clause, _ in aligned] == [2, 0, None]
+    assert aligned[0][1] > 0.5
+
+
+def test_clause_mode_judges_clauses_in_parallel_and_streams_verdicts(monkeypatch):
+    import threading
+    import time
+    from types import SimpleNamespace
+
+    import app as app_module
+    from backend.validation.batch import DeploymentConcurrencyLimiter
+
+    clauses = [f"Clause {i}\nThe Receiving Party shall keep item {i} confidential." for i in range(6)]
+
+    in_flight = []
+    most_in_flight = []
+    lock = threading.Lock()
+
+    def fake_create(**kwargs):
+        with lock:
+            in_flight.append(1)
+            most_in_flight.append(len(in_flight))
+        time.sleep(0.2)
+        with lock:
+            in_flight.pop()
+        pairs = kwargs["messages"][-1]["content"].count("Pair ")
+        content = json.dumps([{"id": i + 1, "conforming": True, "explanation": ""} for i in range(pairs)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(app_module, "get_nda_template", lambda name: "\n".join(clauses))
+    monkeypatch.setattr(app_module, "get_nda_document", lambda name: "\n".join(clauses).replace("keep", "hold"))
+    monkeypatch.setattr(app_module, "get_template_index", lambda name: None)
+    monkeypatch.setattr(app_module, "clause_verdict_cache", None)
+    monkeypatch.setattr(app_module, "CLAUSE_VALIDATION_BATCH_SIZE", 1)
+    monkeypatch.setattr(app_module, "CLAUSE_VALIDATION_CONCURRENCY", 6)
+    ## the per-deployment limit is built at import, so the limiter itself carries the test's concurrency
+    monkeypatch.setattr(app_module, "clause_limiter", DeploymentConcurrencyLimiter(limit=6))
+    monkeypatch.setattr(app_module, "SHOULD_STREAM", True)
+    monkeypatch.setattr(app_module, "should_use_data", lambda: False)
+    monkeypatch.setattr(app_module.openai.ChatCompletion, "create", fake_create)
+    client = app_module.app.test_client()
+
+    start = time.perf_counter()
+    response = client.post("/conversation", json={
+        "messages": [{"role": "user", "content": "Validate"}],
+        "selectedTemplates": "template.docx",
+        "selectedItems": "acme.docx",
+        "validationMode": "clauses"
+    })
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    elapsed = time.perf_counter() - start
+
+    contents = [line["choices"][0]["messages"][0]["content"] for line in lines]
+    assert len(lines) == 7 and sum("conforming" in content for content in contents[:-1]) == 6
+    assert contents[-1].strip().startswith("Summary: 0 of 6 clauses are non-conforming")
+    assert lines[-1]["history_metadata"]["clause_validation"]["judged"] == 6
+    assert max(most_in_flight) == 6
+    assert elapsed < 0.2 * 6 / 2
+
+    ## VALIDATION_MODE only takes over the first turn; a follow-up question is answered, an explicit request validates again
+    monkeypatch.setattr(app_module, "VALIDATION_MODE", "clauses")
+    first_turn = {"messages": [{"role": "user", "content": "Validate"}], "selectedTemplates": "template.docx", "selectedItems": "acme.docx"}
+    follow_up = dict(first_turn, messages=first_turn["messages"] + [{"role": "assistant", "content": "Summary"}, {"role": "user", "content": "Why is clause 3 non-conforming?"}])
+    assert app_module.use_clause_validation(first_turn)
+    assert not app_module.use_clause_validation(follow_up)
+    assert app_module.use_clause_validation(dict(follow_up, validationMode="clauses"))
+    assert not app_module.use_clause_validation(dict(first_turn, validationMode="conversation"))
+    assert not app_module.use_clause_validation(dict(first_turn, selectedItems=""))
+
+
+def test_create_messages_appends_in_one_transactional_batch():
+    from backend.history.cosmosdbservice import CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            self.batches = []
+
+        def execute_item_batch(self, batch_operations, partition_key, response_hook=None):
+            self.batches.append((batch_operations, partition_key))
+            response_hook({"x-ms-request-charge": "14.3"}, [])
+            return [{"resourceBody": operation[1][0]} for operation in batch_operations]
+
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.container_client = FakeContainer()
+    client.enable_message_feedback = False
+    client.request_stats = CosmosRequestStats()
+
+    created = client.create_messages("conversation-1", "user-1", [
+        ("tool-1", {"role": "tool", "content": "NDA text"}),
+        ("assistant-1", {"role": "assistant", "content": "Conforming"}),
+    ])
+
+    (operations, partition_key), = client.container_client.batches
+    assert partition_key == "user-1"
+    assert [operation[0] for operation in operations] == ["upsert", "upsert", "patch"]
+    assert operations[2][1] == ("conversation-1", [{"op": "set", "path": "/updatedAt", "value": created[1]["createdAt"]}])
+    assert created[0]["createdAt"] < created[1]["createdAt"]
+    stats = client.request_stats.stats()["create_messages"]
+    assert (stats["calls"], stats["round_trips_per_call"], stats["request_charge_per_call"]) == (1, 1.0, 14.3)
+
+
+def test_history_reads_are_partition_scoped_point_reads():
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+    from backend.history.cosmosdbservice import CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            self.items = {"conversation-1": {"id": "conversation-1", "type": "conversation"}, "message-1": {"id": "message-1", "type": "message"}}
+            self.queries = []
+
+        def read_item(self, item, partition_key, response_hook=None):
+            response_hook({"x-ms-request-charge": "1"}, {})
+            if item not in self.items:
+                raise CosmosResourceNotFoundError(message="not found")
+            return self.items[item]
+
+        def query_items(self, query, parameters, partition_key=None, enable_cross_partition_query=None, response_hook=None):
+            self.queries.append((query, partition_key, enable_cross_partition_query))
+            return iter([])
+
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.container_client = FakeContainer()
+    client.request_stats = CosmosRequestStats()
+
+    assert client.get_conversation("user-1", "conversation-1")["id"] == "conversation-1"
+    assert client.get_conversation("user-1", "message-1") is None
+    assert client.get_conversation("user-1", "missing") is None
+    client.get_conversations("user-1", limit=25)
+    client.get_messages("user-1", "conversation-1")
+
+    for query, partition_key, cross_partition in client.container_client.queries:
+        assert partition_key == "user-1" and not cross_partition and "SELECT *" not in query
+    assert client.container_client.queries[1][0].endswith("ORDER BY c.createdAt ASC")
+    assert client.request_stats.stats()["get_conversation"]["calls"] == 3
+
+
+def test_rename_and_feedback_are_conditional_patches():
+    import pytest
+    from azure.core import MatchConditions
+    from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+    from backend.history.cosmosdbservice import CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            self.patches = []
+
+        def patch_item(self, item, partition_key, patch_operations, filter_predicate, response_hook, etag=None, match_condition=None):
+            self.patches.append((item, partition_key, patch_operations, filter_predicate, etag, match_condition))
+            response_hook({"x-ms-request-charge": "5.7"}, {})
+            if etag == '"stale"' or item == "message-1" and "conversation" in filter_predicate:
+                raise CosmosAccessConditionFailedError(message="precondition failed")
+            return {"id": item, "_etag": '"2"'}
+
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.container_client = FakeContainer()
+    client.request_stats = CosmosRequestStats()
+
+    assert client.rename_conversation("user-1", "conversation-1", "Acme NDA")["_etag"] == '"2"'
+    assert client.update_message_feedback("user-1", "message-1", "positive", etag='"1"')
+    assert client.rename_conversation("user-1", "message-1", "Not a conversation") is None
+    with pytest.raises(CosmosAccessConditionFailedError):
+        client.rename_conversation("user-1", "conversation-1", "Acme NDA", etag='"stale"')
+
+    rename, feedback = client.container_client.patches[:2]
+    assert rename == ("conversation-1", "user-1", [{"op": "set", "path": "/title", "value": "Acme NDA"}], "FROM c WHERE c.type = 'conversation' AND NOT IS_DEFINED(c.deleted)", None, None)
+    assert feedback[2:] == ([{"op": "set", "path": "/feedback", "value": "positive"}], "FROM c WHERE c.type = 'message' AND NOT IS_DEFINED(c.deleted)", '"1"', MatchConditions.IfNotModified)
+    stats = client.request_stats.stats()["rename_conversation"]
+    assert stats["round_trips_per_call"] == 1.0 and stats["request_bytes_per_call"] < 100
+
+
+def test_rename_and_feedback_with_a_stale_etag_from_a_read_return_409(monkeypatch):
+    import app as app_module
+    from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
+    from backend.history.cosmosdbservice import CONVERSATION_FIELDS, MESSAGE_FIELDS, CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            self.items = {
+                "conversation-1": {"id": "conversation-1", "type": "conversation", "title": "Acme NDA", "createdAt": "2026-01-01T00:00:00", "_etag": '"1"'},
+                "message-1": {"id": "message-1", "type": "message", "conversationId": "conversation-1", "role": "assistant",
+                              "content": "Conforming", "createdAt": "2026-01-01T00:00:01", "feedback": "", "_etag": '"1"'}
+            }
+            self.version = 1
+
+        def read_item(self, item, partition_key, response_hook=None):
+            if item not in self.items:
+                raise CosmosResourceNotFoundError(message="not found")
+            return dict(self.items[item])
+
+        def query_items(self, query, parameters, partition_key=None, response_hook=None):
+            return iter([dict(item) for item in self.items.values() if item["type"] == "message"])
+
+        def patch_item(self, item, partition_key, patch_operations, filter_predicate, response_hook, etag=None, match_condition=None):
+            if etag and etag != self.items[item]["_etag"]:
+                raise CosmosAccessConditionFailedError(message="precondition failed")
+            self.version += 1
+            for operation in patch_operations:
+                self.items[item][operation["path"].strip("/")] = operation["value"]
+            self.items[item]["_etag"] = f'"{self.version}"'
+            return dict(self.items[item])
+
+    assert "c._etag" in CONVERSATION_FIELDS and "c._etag" in MESSAGE_FIELDS
+    history = CosmosConversationClient.__new__(CosmosConversationClient)
+    history.container_client = FakeContainer()
+    history.request_stats = CosmosRequestStats()
+    monkeypatch.setattr(app_module, "cosmos_conversation_client", history)
+    monkeypatch.setattr(app_module, "history_write_queue", None)
+    client = app_module.app.test_client()
+
+    read = client.post("/history/read", json={"conversation_id": "conversation-1"}).json
+    conversation_etag, message_etag = read["etag"], read["messages"][0]["etag"]
+    assert (conversation_etag, message_etag) == ('"1"', '"1"')
+
+    ## another tab renames and rates with the same read; the second writer is told the item changed
+    renamed = client.post("/history/rename", json={"conversation_id": "conversation-1", "title": "Acme", "etag": conversation_etag})
+    assert renamed.status_code == 200
+    assert client.post("/history/rename", json={"conversation_id": "conversation-1", "title": "Other", "etag": conversation_etag}).status_code == 409
+    assert client.post("/history/rename", json={"conversation_id": "conversation-1", "title": "Other", "etag": renamed.json["_etag"]}).status_code == 200
+
+    rated = client.post("/history/message_feedback", json={"message_id": "message-1", "message_feedback": "positive", "etag": message_etag})
+    assert rated.status_code == 200
+    assert client.post("/history/message_feedback", json={"message_id": "message-1", "message_feedback": "negative", "etag": message_etag}).status_code == 409
+    assert history.container_client.items["message-1"]["feedback"] == "positive"
+
+
+def test_delete_hides_conversation_and_reclaims_messages_in_bulk():
+    from backend.history.cosmosdbservice import CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            self.patches = []
+            self.batches = []
+
+        def patch_item(self, item, partition_key, patch_operations, filter_predicate, response_hook):
+            self.patches.append((item, patch_operations, filter_predicate))
+            return {"id": item, "deleted": True}
+
+        def query_items(self, query, parameters, partition_key, response_hook):
+            conversation_ids = parameters[0]["value"]
+            return iter([{"id": f"{conversation_id}-message-{n}"} for conversation_id in conversation_ids for n in range(5)])
+
+        def execute_item_batch(self, batch_operations, partition_key, response_hook):
+            self.batches.append(batch_operations)
+            return []
+
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.container_client = FakeContainer()
+    client.request_stats = CosmosRequestStats()
+    client.deleted_ttl = 3600
+    client.bulk_concurrency = 4
+
+    assert client.delete_conversation("user-1", "conversation-1")["deleted"]
+    item, patch_operations, filter_predicate = client.container_client.patches[0]
+    assert {"op": "set", "path": "/ttl", "value": 3600} in patch_operations and "NOT IS_DEFINED(c.deleted)" in filter_predicate
+
+    deleted = client.delete_conversations_messages("user-1", [f"conversation-{n}" for n in range(50)])
+    assert len(deleted) == 250
+    assert sorted(len(batch) for batch in client.container_client.batches) == [50, 100, 100]
+    assert all(operation[0] == "delete" for batch in client.container_client.batches for operation in batch)
+
+
+def test_delete_all_hides_the_history_with_one_write_before_reclaiming(monkeypatch):
+    from datetime import datetime, timedelta
+
+    import pytest
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+    import app as app_module
+    from backend.history.cosmosdbservice import CosmosConversationClient, HistoryResetError
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakePages():
+        continuation_token = None
+
+        def __init__(self, rows):
+            self.pages = iter([rows])
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            return next(self.pages)
+
+    class FakeQuery():
+        def __init__(self, rows):
+            self.rows = rows
+
+        def __iter__(self):
+            return iter(self.rows)
+
+        def by_page(self, continuation_token=None):
+            return FakePages(self.rows)
+
+    class FakeContainer():
+        def __init__(self):
+            self.items = {
+                "old": {"id": "old", "type": "conversation", "userId": "user-1", "createdAt": "2023-09-01T10:00:00", "updatedAt": "2023-09-01T10:00:00"},
+                "new": {"id": "new", "type": "conversation", "userId": "user-1", "createdAt": "2999-01-01T00:00:00", "updatedAt": "2999-01-01T00:00:00"}
+            }
+            self.queries = []
+
+        def upsert_item(self, body, response_hook=None):
+            self.items[body["id"]] = body
+            return body
+
+        def read_item(self, item, partition_key, response_hook=None):
+            if item not in self.items:
+                raise CosmosResourceNotFoundError(message="not found")
+            return self.items[item]
+
+        def query_items(self, query, parameters, partition_key=None, max_item_count=None, response_hook=None):
+            values = {parameter["name"]: parameter["value"] for parameter in parameters}
+            self.queries.append((query, values))
+            conversations = [dict(item) for item in self.items.values() if item["type"] == "conversation"]
+            if "@deletedBefore" in values:
+                conversations = [item for item in conversations if item["createdAt"] > values["@deletedBefore"]]
+            if "@createdBefore" in values:
+                conversations = [item for item in conversations if item["createdAt"] <= values["@createdBefore"]]
+            return FakeQuery(conversations)
+
+        def execute_item_batch(self, batch_operations, partition_key, response_hook=None):
+            return []
+
+    history = CosmosConversationClient.__new__(CosmosConversationClient)
+    history.container_client = FakeContainer()
+    history.request_stats = CosmosRequestStats()
+    history.deleted_ttl = 3600
+    history.bulk_concurrency = 4
+
+    submitted = []
+    monkeypatch.setattr(app_module, "cosmos_conversation_client", history)
+    monkeypatch.setattr(app_module.history_reclaimer, "submit", lambda description, job, *args: submitted.append((job, args)))
+    client = app_module.app.test_client()
+
+    ## hidden before the endpoint answers, although the background job has not run
+    assert client.delete("/history/delete_all").status_code == 200
+    (job, (user_id, deleted_before)), = submitted
+    assert history.get_conversation(user_id, "old") is None and history.get_conversation(user_id, "new")["id"] == "new"
+    conversations, _ = history.get_conversations_page(user_id, 25)
+    assert [conversation["id"] for conversation in conversations] == ["new"]
+    assert history.container_client.queries[-1][1]["@deletedBefore"] == deleted_before
+    with pytest.raises(HistoryResetError):
+        history.get_conversations_page(user_id, 25, since="2023-09-01T10:00:00")
+    since = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+    assert client.get(f"/history/list?since={since}").status_code == 410
+    changed, _ = history.get_conversations_page(user_id, 25, since=deleted_before)
+    assert {conversation["id"]: conversation.get("deleted", False) for conversation in changed} == {"old": True, "new": False}
+
+    ## the background job only marks what the delete_all hid
+    assert job(user_id, deleted_before) == ["old"]
+
+
+def test_history_list_pages_with_continuation_tokens_and_since(monkeypatch):
+    from datetime import datetime, timedelta
+    from azure.cosmos.exceptions import CosmosHttpResponseError
+    import app as app_module
+
+    class FakeHistory():
+        def __init__(self):
+            self.calls = []
+
+        def get_conversations_page(self, user_id, page_size, continuation_token=None, since=None):
+            self.calls.append((page_size, continuation_token, since))
+            if continuation_token == "garbled":
+                raise CosmosHttpResponseError(status_code=400, message="Invalid Continuation Token")
+            if since:
+                return [{"id": "conversation-2", "deleted": True}], None
+            return [{"id": "conversation-1"}], "page-2"
+
+    history = FakeHistory()
+    monkeypatch.setattr(app_module, "cosmos_conversation_client", history)
+    client = app_module.app.test_client()
+
+    first = client.get("/history/list?page_size=10")
+    assert first.json == [{"id": "conversation-1"}] and first.headers["X-Continuation-Token"] == "page-2"
+    client.get("/history/list?continuation_token=page-2")
+    since = (datetime.utcnow() - timedelta(minutes=5)).replace(microsecond=0)
+    changed = client.get(f"/history/list?since={since.isoformat()}%2B00:00")
+    assert changed.json == [{"id": "conversation-2", "deleted": True}] and "X-Continuation-Token" not in changed.headers
+    assert history.calls == [(10, None, None), (25, "page-2", None), (25, None, since.isoformat())]
+
+    assert client.get("/history/list?since=2000-01-01T00:00:00").status_code == 410
+    assert client.get("/history/list?since=yesterday").status_code == 400
+
+    history.calls = []
+    client.get("/history/list?page_size=-1")
+    client.get("/history/list?page_size=1000")
+    assert [call[0] for call in history.calls] == [1, 100]
+    assert client.get("/history/list?page_size=ten").status_code == 400
+    assert client.get("/history/list?offset=x").status_code == 400
+    assert client.get("/history/list?offset=-5").status_code == 400
+    garbled = client.get("/history/list?continuation_token=garbled")
+    assert garbled.status_code == 400 and "continuation_token" in garbled.json["error"]
+
+
+def test_history_write_queue_retries_in_order_and_keeps_dead_letters(tmp_path):
+    from backend.history.write_queue import HistoryWriteQueue
+
+    applied = []
+    failures = {"create_messages": 1}
+
+    def handler(kind):
+        def apply(user_id, payload):
+            if failures.get(kind):
+                failures[kind] -= 1
+                raise RuntimeError("429 Too Many Requests")
+            if payload.get("poison"):
+                raise RuntimeError("400 Bad Request")
+            applied.append((user_id, kind, payload["n"]))
+        return apply
+
+    handlers = {kind: handler(kind) for kind in ("create_conversation", "create_messages")}
+    queue = HistoryWriteQueue(path=str(tmp_path / "queue.sqlite3"), handlers=handlers, max_attempts=2, retry_delay=0.01, poll_interval=0.01)
+    queue.enqueue("create_conversation", "user-1", {"n": 1})
+    queue.enqueue("create_messages", "user-1", {"n": 2})
+    queue.enqueue("create_messages", "user-1", {"n": 3})
+    queue.enqueue("create_messages", "user-2", {"n": 4, "poison": True})
+    queue.enqueue("create_conversation", "user-2", {"n": 5})
+    assert queue.flush(timeout=5)
+    queue.close()
+
+    assert [n for user_id, _, n in applied if user_id == "user-1"] == [1, 2, 3]
+    assert [n for user_id, _, n in applied if user_id == "user-2"] == [5]
+    stats = queue.stats()
+    assert (stats["depth"], stats["dead_letters"], stats["flushed"], stats["retries"]) == (0, 1, 4, 2)
+
+    ## writes spooled by a process that stopped before flushing are delivered by the next one
+    stopped = HistoryWriteQueue(path=str(tmp_path / "queue.sqlite3"), handlers=handlers)
+    stopped.close()
+    stopped.enqueue("create_messages", "user-1", {"n": 6})
+    reopened = HistoryWriteQueue(path=str(tmp_path / "queue.sqlite3"), handlers=handlers, poll_interval=0.01)
+    assert reopened.flush(timeout=5) and applied[-1] == ("user-1", "create_messages", 6)
+    assert reopened.stats()["dead_letters"] == 1
+    reopened.close()
+
+
+def test_history_reads_wait_for_the_users_queued_writes(monkeypatch, tmp_path):
+    import threading
+    import time
+    import app as app_module
+    from backend.auth.sample_user import sample_user
+    from backend.history.write_queue import HistoryWriteQueue
+
+    class FakeHistory():
+        def __init__(self):
+            self.conversations = {}
+            self.available = threading.Event()
+
+        def create_conversation(self, user_id, title, conversation_id, created_at):
+            if not self.available.is_set():
+                raise RuntimeError("429 Too Many Requests")
+            self.conversations[conversation_id] = {"id": conversation_id, "title": title}
+
+        def get_conversation(self, user_id, conversation_id):
+            return self.conversations.get(conversation_id)
+
+        def get_messages(self, user_id, conversation_id):
+            return []
+
+        def rename_conversation(self, user_id, conversation_id, title, etag=None):
+            conversation = self.conversations.get(conversation_id)
+            if conversation:
+                conversation["title"] = title
+            return conversation
+
+        def get_conversations_page(self, user_id, page_size, continuation_token=None, since=None):
+            return list(self.conversations.values()), None
+
+        def delete_conversation(self, user_id, conversation_id):
+            return self.conversations.pop(conversation_id, None)
+
+        def delete_messages(self, conversation_id, user_id):
+            return []
+
+    class FakeReclaimer():
+        def submit(self, description, job, *args):
+            pass
+
+    history = FakeHistory()
+    handlers = {"create_conversation": lambda user_id, payload: history.create_conversation(user_id, payload["title"], payload["conversation_id"], None)}
+    ## the first attempt fails and backs off far longer than the read waits
+    queue = HistoryWriteQueue(path=str(tmp_path / "queue.sqlite3"), handlers=handlers, retry_delay=600, poll_interval=0.01)
+    monkeypatch.setattr(app_module, "cosmos_conversation_client", history)
+    monkeypatch.setattr(app_module, "history_write_queue", queue)
+    monkeypatch.setattr(app_module, "HISTORY_WRITE_READ_TIMEOUT_SECONDS", "0.2")
+    monkeypatch.setattr(app_module, "history_reclaimer", FakeReclaimer())
+    client = app_module.app.test_client()
+    user_id = sample_user["X-Ms-Client-Principal-Id"]
+
+    queue.enqueue("create_conversation", user_id, {"title": "Acme NDA", "conversation_id": "conversation-1"})
+    deadline = time.time() + 5
+    while queue.stats()["retries"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    still_queued = client.post("/history/read", json={"conversation_id": "conversation-1"})
+    assert still_queued.status_code == 409 and still_queued.headers["Retry-After"]
+    assert client.post("/history/rename", json={"conversation_id": "conversation-1", "title": "Renamed"}).status_code == 409
+    ## a list without the queued conversation, or a delete the flusher would undo, is not served either
+    assert client.get("/history/list").status_code == 409
+    assert client.delete("/history/delete", json={"conversation_id": "conversation-1"}).status_code == 409
+
+    ## a read retries the backed-off write at once instead of waiting out the backoff
+    history.available.set()
+    assert client.post("/history/read", json={"conversation_id": "conversation-1"}).status_code == 200
+    assert client.post("/history/rename", json={"conversation_id": "conversation-1", "title": "Renamed"}).json["title"] == "Renamed"
+    assert [conversation["id"] for conversation in client.get("/history/list").json] == ["conversation-1"]
+    assert client.delete("/history/delete", json={"conversation_id": "conversation-1"}).status_code == 200
+    assert queue.pending(user_id) == 0
+    queue.close()
+
+
+def test_new_conversation_gets_provisional_title_and_generated_title_later(monkeypatch):
+    import threading
+    import app as app_module
+    from backend.history.titles import TitleGenerator, heuristic_title
+
+    assert heuristic_title([{"role": "user", "content": "Validate it"}], "agreements/Acme_Supplier-NDA.docx,other.docx") == "Acme Supplier NDA"
+    assert heuristic_title([{"role": "user", "content": "**Please** check the confidentiality term of this agreement today."}]) == "Please check the confidentiality term of"
+
+    class FakeHistory():
+        def __init__(self):
+            self.conversations = []
+            self.renames = []
+            self.renamed = threading.Event()
+
+        def create_conversation(self, user_id, title, conversation_id, created_at):
+            self.conversations.append((conversation_id, title))
+
+        def create_messages(self, conversation_id, user_id, input_messages, created_at):
+            pass
+
+        def rename_conversation(self, user_id, conversation_id, title, expected_title=None):
+            self.renames.append((conversation_id, title, expected_title))
+            self.renamed.set()
+
+    release = threading.Event()
+
+    prompted = []
+
+    def slow_generate(messages, names):
+        prompted.append(names)
+        release.wait(5)
+        return f"{names[0]} review"
+
+    history = FakeHistory()
+    generator = TitleGenerator(generate=slow_generate)
+    monkeypatch.setattr(app_module, "cosmos_conversation_client", history)
+    monkeypatch.setattr(app_module, "history_write_queue", None)
+    monkeypatch.setattr(app_module, "title_generator", generator)
+    monkeypatch.setattr(app_module, "conversation_internal", lambda body, selected: app_module.jsonify(body["history_metadata"]))
+
+    body = {"messages": [{"role": "user", "content": "Validate it"}], "selectedItems": "Acme_NDA.docx"}
+    response = app_module.app.test_client().post("/history/generate", json=body)
+    conversation_id = response.json["conversation_id"]
+    assert response.json["title"] == "Acme NDA" and history.conversations == [(conversation_id, "Acme NDA")]
+    assert history.renames == []
+
+    release.set()
+    assert history.renamed.wait(5)
+    assert history.renames == [(conversation_id, "Acme_NDA review", "Acme NDA")]
+    assert prompted == [["Acme_NDA"]]
+
+    ## the same opening message about the same agreement is titled from the cache, about another one it is not
+    app_module.app.test_client().post("/history/generate", json=body)
+    other = app_module.app.test_client().post("/history/generate", json=dict(body, selectedItems="Globex_NDA.docx"))
+    generator.executor.shutdown(wait=True)
+    assert generator.stats()["hits"] == 1 and generator.stats()["generated"] == 2
+    assert (other.json["conversation_id"], "Globex_NDA review", "Globex NDA") in history.renames
+
+
+def test_ensure_applies_indexing_policy_and_queries_use_composite_indexes():
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+    from backend.history.cosmosdbservice import INDEXING_POLICY, CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            ## provisioned with a version 1 partition key, which Cosmos reports without a version
+            self.properties = {"id": "conversations", "partitionKey": {"paths": ["/userId"], "kind": "Hash"}, "defaultTtl": -1,
+                               "indexingPolicy": {"indexingMode": "consistent", "includedPaths": [{"path": "/*"}], "excludedPaths": []}}
+            self.progress = "40"
+            self.queries = []
+            self.reads = 0
+
+        def read(self, populate_quota_info=False, response_hook=None):
+            self.reads += 1
+            response_hook({"x-ms-documentdb-collection-index-transformation-progress": self.progress}, self.properties)
+            return self.properties
+
+        def query_items(self, query, parameters, partition_key=None, response_hook=None):
+            self.queries.append(query)
+            return iter([])
+
+        def read_item(self, item, partition_key, response_hook=None):
+            raise CosmosResourceNotFoundError(message="not found")
+
+    class FakeDatabase():
+        def __init__(self, container):
+            self.container = container
+            self.replaced = []
+            self.partition_keys = []
+
+        def replace_container(self, container, partition_key, indexing_policy, default_ttl, conflict_resolution_policy):
+            self.replaced.append((container, default_ttl))
+            self.partition_keys.append(dict(partition_key))
+            self.container.properties["indexingPolicy"] = indexing_policy
+
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.cosmosdb_client = object()
+    client.container_client = FakeContainer()
+    client.database_client = FakeDatabase(client.container_client)
+    client.container_name = "conversations"
+    client.request_stats = CosmosRequestStats()
+
+    assert client.ensure()
+    assert client.indexing_policy_status == "missing" and not client.database_client.replaced
+
+    ## the index is still being built, so queries keep sorting on one property
+    assert client.ensure(apply_indexing_policy=True)
+    assert client.database_client.replaced == [("conversations", -1)]
+    ## a version 2 key would be a change of partition key, which Cosmos rejects
+    assert client.database_client.partition_keys == [{"paths": ["/userId"], "kind": "Hash", "version": 1}]
+    assert client.indexing_policy_status == "building"
+    client.get_messages("user-1", "conversation-1")
+    assert client.container_client.queries[-1].endswith("ORDER BY c.createdAt ASC")
+
+    ## queries re-check the build on their own, at most every index_check_seconds, and never replace the policy
+    client.container_client.progress = "100"
+    reads = client.container_client.reads
+    client.get_messages("user-1", "conversation-1")
+    assert client.container_client.reads == reads and client.container_client.queries[-1].endswith("ORDER BY c.createdAt ASC")
+    client.index_check_seconds = 0
+    client.get_conversations("user-1", limit=25)
+    assert client.container_client.reads == reads + 1
+    assert len(client.database_client.replaced) == 1 and client.indexing_policy_status == "applied"
+    assert {"path": "/content/?"} in INDEXING_POLICY["excludedPaths"]
+    ## once built, queries stop reading the container
+    client.get_conversations("user-1", limit=25)
+    client.get_messages("user-1", "conversation-1")
+    assert "order by c.userId ASC, c.type ASC, c.updatedAt DESC" in client.container_client.queries[-2]
+    assert client.container_client.queries[-1].endswith("ORDER BY c.conversationId ASC, c.createdAt ASC")
+    assert client.container_client.reads == reads + 1
+
+
+def test_large_message_content_is_offloaded_and_deduplicated(tmp_path):
+    from backend.history.content_store import LocalContentBackend, MessageContentStore
+    from backend.history.cosmosdbservice import CosmosConversationClient
+    from backend.history.request_stats import CosmosRequestStats
+
+    class FakeContainer():
+        def __init__(self):
+            self.items = {}
+
+        def execute_item_batch(self, batch_operations, partition_key, response_hook=None):
+            response_hook({"x-ms-request-charge": "10"}, [])
+            for operation, arguments in batch_operations:
+                if operation == "upsert":
+                    self.items[arguments[0]["id"]] = arguments[0]
+            return [{"resourceBody": operation[1][0]} for operation in batch_operations]
+
+        def read_item(self, item, partition_key, response_hook=None):
+            response_hook({"x-ms-request-charge": "1"}, {})
+            return self.items[item]
+
+    store = MessageContentStore(LocalContentBackend(str(tmp_path)), threshold_bytes=1024, preview_chars=20)
+    client = CosmosConversationClient.__new__(CosmosConversationClient)
+    client.container_client = FakeContainer()
+    client.enable_message_feedback = False
+    client.request_stats = CosmosRequestStats()
+    client.content_store = store
+
+    agreement = "The receiving party shall keep the information confidential. " * 200
+    for conversation_id in ("conversation-1", "conversation-2"):
+        client.create_messages(conversation_id, "user-1", [
+            (f"tool-{conversation_id}", {"role": "tool", "content": agreement}),
+            (f"assistant-{conversation_id}", {"role": "assistant", "content": "Conforming"}),
+        ])
+
+    tool = client.get_message("user-1", "tool-conversation-1")
+    assert tool["content"] == agreement[:20] and tool["contentLength"] == len(agreement)
+    assert client.get_message_content(tool) == agreement
+    assert client.get_message_content(client.get_message("user-1", "assistant-conversation-1")) == "Conforming"
+    assert "contentRef" not in client.container_client.items["assistant-conversation-1"]
+
+    ## the second conversation's copy of the agreement is stored once, compressed
+    assert [path.name for path in tmp_path.rglob("*.gz")] == [tool["contentRef"] + ".gz"]
+    stats = store.stats()
+    assert (stats["offloaded"], stats["deduplicated"], stats["loads"]) == (2, 1, 1)
+    assert stats["stored_bytes"] < len(agreement) / 10
+
+    ## a body the store does not take stays inline rather than as a preview
+    class FailingBackend():
+        def put(self, digest, data):
+            raise RuntimeError("503 Service Unavailable")
+
+    client.content_store = MessageContentStore(FailingBackend(), threshold_bytes=1024, preview_chars=20)
+    client.create_messages("conversation-3", "user-1", [("tool-conversation-3", {"role": "tool", "content": agreement + " Signed."})])
+    inline = client.container_client.items["tool-conversation-3"]
+    assert inline["content"] == agreement + " Signed." and "contentRef" not in inline
+
+
+def test_generate_resends_offloaded_messages_by_reference(monkeypatch, tmp_path):
+    import app as app_module
+    from backend.auth.sample_user import sample_user
+    from backend.history.content_store import LocalContentBackend, MessageContentStore
+
+    store = MessageContentStore(LocalContentBackend(str(tmp_path)), threshold_bytes=1024, preview_chars=20)
+    agreement = "The receiving party shall keep the information confidential. " * 200
+    offloaded = store.offload(agreement)
+
+    class FakeHistory():
+        content_store = store
+
+        def get_message(self, user_id, message_id):
+            ## only the tool message of this user holds the reference
+            if (user_id, message_id) == (sample_user["X-Ms-Client-Principal-Id"], "tool-1"):
+                return dict(offloaded, id="tool-1", role="tool")
+            return None
+
+        def get_message_content(self, message):
+            return store.load(message["contentRef"])
+
+        def create_messages(self, conversation_id, user_id, input_messages, created_at):
+            pass
+
+    sent = []
+    monkeypatch.setattr(app_module, "cosmos_conversation_client", FakeHistory())
+    monkeypatch.setattr(app_module, "history_write_queue", None)
+    monkeypatch.setattr(app_module, "conversation_internal", lambda body, selected: sent.append(body["messages"]) or app_module.jsonify({}))
+    client = app_module.app.test_client()
+
+    ## the client sends the preview and the reference, never the fetched body; the model gets the full text
+    tool = {"id": "tool-1", "role": "tool", "content": offloaded["content"], "contentRef": offloaded["contentRef"]}
+    question = {"id": "user-2", "role": "user", "content": "Is the term limited?"}
+    assert client.post("/history/generate", json={"conversation_id": "conversation-1", "messages": [tool, question]}).status_code == 200
+    assert sent[0][0]["content"] == agreement and "contentRef" not in sent[0][0]
+
+    ## a reference the user's own message does not hold is not resolved
+    stolen = dict(tool, id="someone-elses-tool")
+    assert client.post("/history/generate", json={"conversation_id": "conversation-1", "messages": [stolen, question]}).status_code == 404
+    assert len(sent) == 1
+
+
+def test_http_client_registry_reuses_one_session_per_host(monkeypatch):
+    import requests
+    from backend.upstream.http_clients import HttpClientRegistry
+
+    sent = []
+    monkeypatch.setattr(requests.Session, "request", lambda session, method, url, **kwargs: sent.append((session, method, url, kwargs["timeout"])))
+    registry = HttpClientRegistry(pool_maxsize=4, connect_timeout=3, read_timeout=30)
+
+    registry.post("https://example.openai.azure.com/openai/deployments/gpt4/chat/completions")
+    registry.get("https://EXAMPLE.openai.azure.com/openai/models")
+    registry.get("https://graph.microsoft.com/v1.0/me")
+
+    assert sent[0][0] is sent[1][0] and sent[2][0] is not sent[0][0]
+    assert [(method, timeout) for _, method, _, timeout in sent] == [("POST", (3, 30)), ("GET", (3, 30)), ("GET", (3, 30))]
+    assert sent[0][0].get_adapter("https://example.openai.azure.com")._pool_maxsize == 4
+    stats = registry.stats()
+    assert (stats["pool_hits"], stats["pool_misses"]) == (1, 2)
+    assert set(stats["hosts"]) == {"https://example.openai.azure.com", "https://graph.microsoft.com"}
+
+
+def test_user_groups_follow_next_link_pages(monkeypatch):
+    from types import SimpleNamespace
+
+    import app as app_module
+
+    pages = {
+        "https://graph.microsoft.com/v1.0/me/transitiveMemberOf?$select=id": {"value": [{"id": "a"}, {"id": "b"}], "@odata.nextLink": "https://graph.microsoft.com/page-2"},
+        "https://graph.microsoft.com/page-2": {"value": [{"id": "c"}], "@odata.nextLink": "https://graph.microsoft.com/page-3"},
+        "https://graph.microsoft.com/page-3": {"value": [{"id": "d"}]},
+    }
+    requested = []
+
+    def fake_get(url, headers=None):
+        requested.append((url, headers["Authorization"]))
+        return SimpleNamespace(status_code=200, json=lambda: pages[url], text="")
+
+    monkeypatch.setattr(app_module.http_clients, "get", fake_get)
+    assert [group["id"] for group in app_module.fetchUserGroups("token")] == ["a", "b", "c", "d"]
+    assert [url for url, _ in requested] == list(pages)
+    assert {authorization for _, authorization in requested} == {"bearer token"}
+
+    ## a failed page drops the partial result rather than filtering on some of the groups
+    def throttled_after_first_page(url, headers=None):
+        if url == requested[0][0]:
+            return SimpleNamespace(status_code=200, json=lambda: pages[url], text="")
+        return SimpleNamespace(status_code=429, text="throttled")
+
+    monkeypatch.setattr(app_module.http_clients, "get", throttled_after_first_page)
+    assert app_module.fetchUserGroups("token") == []
+
+
+def test_tool_calls_are_served_from_prefetched_documents(monkeypatch):
+    import threading
+
+    from azure.core.exceptions import ResourceNotFoundError
+    from openai.util import convert_to_openai_object
+
+    import app as app_module
+    from backend.documents.prefetch import DocumentPrefetcher
+
+    prefetcher = DocumentPrefetcher(max_workers=2)
+    inline_loads = []
+
+    def get_nda_document(selected_documents):
+        inline_loads.append(selected_documents)
+        return "inline agreement"
+
+    monkeypatch.setattr(app_module, "document_prefetcher", prefetcher)
+    monkeypatch.setattr(app_module, "get_nda_document", get_nda_document)
+    monkeypatch.setattr(app_module, "PRESCREEN_ENABLED", False)
+
+    def tool_call():
+        line = convert_to_openai_object({"model": "gpt-4", "created": 1, "object": "chat.completion.chunk", "choices": [
+            {"delta": {"function_call": {"name": "get_nda_document", "arguments": "{}"}}, "finish_reason": "function_call"}]})
+        body = app_module.stream_without_data([line], {"selectedItems": "acme/nda.docx"}, "message-1", prefetched=prefetched)
+        return json.loads(list(body)[-1])["choices"][0]["messages"][0]["content"]
+
+    ## the download started before the model asked for it and the tool call waits for it
+    started = threading.Event()
+
+    def prefetch_agreement():
+        started.set()
+        return "prefetched agreement"
+
+    prefetched = prefetcher.prefetch({"get_nda_document": prefetch_agreement})
+    assert started.wait(5)
+    assert tool_call() == "prefetched agreement" and inline_loads == []
+
+    ## a failed prefetch, e.g. a blob deleted meanwhile, and a document that was not prefetched are loaded inline
+    def missing_blob():
+        raise ResourceNotFoundError("The specified blob does not exist.")
+
+    prefetched = prefetcher.prefetch({"get_nda_document": missing_blob})
+    assert tool_call() == "inline agreement"
+    prefetched = {}
+    assert tool_call() == "inline agreement"
+    assert inline_loads == ["acme/nda.docx", "acme/nda.docx"]
+    assert prefetcher.stats() == {"prefetched": 2, "served": 1, "failed": 1}
+
+
+def test_validation_cache_key_reads_etags_without_downloading(monkeypatch):
+    from types import SimpleNamespace
+
+    import app as app_module
+    from backend.documents.blob_text_cache import BlobTextCache
+
+    properties_requests = []
+
+    class FakeBlobClient():
+        def __init__(self, container_name, blob_name):
+            self.container_name = container_name
+            self.blob_name = blob_name
+
+        def get_blob_properties(self):
+            properties_requests.append(self.blob_name)
+            return SimpleNamespace(etag=f"etag-{self.blob_name}")
+
+        def download_blob(self, **kwargs):
+            if self.blob_name == "template.docx":
+                return SimpleNamespace(readall=lambda: b"TEMPLATE", properties=SimpleNamespace(etag="etag-template.docx"))
+            raise AssertionError("the cache key must not download the agreement")
+
+    cache = BlobTextCache(ttl_seconds=60)
+    monkeypatch.setattr(app_module, "docx_text_cache", cache)
+    monkeypatch.setattr(app_module, "get_blob_service_client", lambda: SimpleNamespace(get_blob_client=FakeBlobClient))
+    deployment = SimpleNamespace(name="GPT 4.0", model="gpt4")
+    request_body = {"selectedTemplates": "template.docx", "selectedItems": "acme.docx", "messages": [{"role": "user", "content": "Validate"}]}
+
+    ## the template is warm in the text cache, the agreement costs one properties request
+    cache.fetch(FakeBlobClient(app_module.NDA_TEMPPLATES_CONTAINER, "template.docx"), lambda data: data.decode())
+    key = app_module.validation_cache_key(request_body, deployment)
+    assert key and properties_requests == ["acme.docx"]
+    assert app_module.validation_cache_key(request_body, deployment) == key
+    assert cache.stats()["etag_checks"] == 2
+
+
+def test_clause_verdicts_only_accept_boolean_conformity():
+    from types import SimpleNamespace
+
+    from app import parse_clause_verdicts
+
+    pairs = [(SimpleNamespace(index=index), None) for index in range(6)]
+    content = json.dumps([
+        {"id": 1, "conforming": True, "explanation": "same wording"},
+        {"id": 2, "conforming": "false", "explanation": "promptly instead of immediately"},
+        {"id": 3, "conforming": " TRUE "},
+        {"id": 4, "conforming": "no"},
+        {"id": 5, "conforming": 1},
+        {"id": 6},
+    ])
+
+    verdicts = parse_clause_verdicts(content, pairs)
+    assert {index: verdict["conforming"] for index, verdict in verdicts.items()} == {0: True, 1: False, 2: True}